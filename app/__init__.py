@@ -1,89 +1,133 @@
+import time
+_import_started = time.perf_counter()
+
 from flask import Flask, render_template
 from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import SocketIO
 from flask_mail import Mail
-from flask_migrate import Migrate
 from flask_cors import CORS
+from flask_login import LoginManager
 import os
 from dotenv import load_dotenv
 from config import Config
-import requests  # 👈 понадобится для скачивания socket.io.min.js
+from app.utils.db_routing import (
+    RoutingSession, configure_sqlite, configure_replica, install_sqlite_pragmas, replica_router
+)
+from app.utils.sharding import configure_message_shards, message_shards
+import logging
 
 # --- Загрузить .env до создания приложения ---
 load_dotenv()
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 socketio = SocketIO()
 mail = Mail()
-migrate = Migrate()
-
-
-def ensure_static_files():
-    """Проверяет и создает недостающие статические файлы."""
-    static_js = os.path.join('app', 'static', 'js')
-    os.makedirs(static_js, exist_ok=True)
-
-    # Проверяем наличие socket.io.min.js
-    socketio_js = os.path.join(static_js, 'socket.io.min.js')
-    if not os.path.exists(socketio_js):
-        print("⚙️  Downloading socket.io.min.js...")
-        url = "https://cdn.socket.io/4.7.5/socket.io.min.js"
-        try:
-            r = requests.get(url)
-            r.raise_for_status()
-            with open(socketio_js, "wb") as f:
-                f.write(r.content)
-            print("✅ socket.io.min.js saved to /static/js/")
-        except Exception as e:
-            print(f"❌ Failed to download socket.io.min.js: {e}")
-
-    # Создаем favicon, если отсутствует
-    static_dir = os.path.join('app', 'static')
-    favicon_path = os.path.join(static_dir, 'favicon.ico')
-    if not os.path.exists(favicon_path):
-        print("⚙️  Creating placeholder favicon.ico...")
-        try:
-            with open(favicon_path, "wb") as f:
-                # Минимальный пустой favicon (валидный 16×16 ICO)
-                f.write(b'\x00\x00\x01\x00\x01\x00\x10\x10\x10\x00\x00\x00\x00\x00\x00\x00\x00\x00')
-            print("✅ favicon.ico created")
-        except Exception as e:
-            print(f"❌ Failed to create favicon: {e}")
+login_manager = LoginManager()
+
+_import_seconds = time.perf_counter() - _import_started
+
+
+def init_migrations(app):
+    """Flask-Migrate imports Alembic (~0.1 s); FAST_STARTUP workers skip it,
+    `flask db` runs in a separate process without the flag"""
+    from flask_migrate import Migrate
+    Migrate(app, db)
+
+
+def register_runtime_gauges(metrics):
+    """Gauges evaluated on each /metrics scrape"""
+    from app.sockets.registry import sessions
+    from app.sockets.ratelimit import limiter
+    from app.utils.message_cache import recent_messages
+    from app.utils.compression import compressor
+
+    def pool_state():
+        pool = db.engine.pool
+        return {
+            state: getattr(pool, state)()
+            for state in ('size', 'checkedin', 'checkedout', 'overflow')
+            if hasattr(pool, state)
+        }
+
+    metrics.gauge('schat_socket_connections', 'Authenticated socket connections', lambda: len(sessions))
+    metrics.gauge('schat_socket_rooms', 'Chat rooms with at least one joined socket', sessions.room_count)
+    metrics.gauge('schat_db_pool', 'SQLAlchemy connection pool state', pool_state, ('state',))
+    metrics.gauge('schat_socket_limit_events', 'Rate-limited, dropped and disconnected socket events',
+                  limiter.stats, ('kind',))
+    metrics.gauge('schat_recent_messages', 'Recent-message ring buffer statistics',
+                  recent_messages.stats, ('stat',))
+    metrics.gauge('schat_http_compression', 'Compressed responses, bytes in/out and CPU seconds spent',
+                  compressor.stats, ('stat',))
 
 
 def create_app(config_class=Config):
+    from app.utils.startup import StartupTimer
+
     app = Flask(__name__,
                 template_folder='templates',
                 static_folder='static')
 
     # Применить конфигурацию
     app.config.from_object(config_class)
+    timer = StartupTimer(app.config['STARTUP_TIMING'], _import_seconds)
 
     # Убедиться, что нужные папки существуют
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     os.makedirs(app.config['SIGNAL_PROTOCOL_STORE'], exist_ok=True)
 
     # Инициализация расширений
+    configure_sqlite(app)
+    configure_replica(app)
+    configure_message_shards(app)
     db.init_app(app)
+    install_sqlite_pragmas(app, db)
+    replica_router.init_app(app)
+    message_shards.init_app(app)
     socketio.init_app(
         app,
         cors_allowed_origins="*",
         async_mode='threading',
-        logger=True,
-        engineio_logger=True
+        logger=app.config['SOCKETIO_LOGGER'],
+        engineio_logger=app.config['ENGINEIO_LOGGER'],
+        http_compression=app.config['SOCKETIO_HTTP_COMPRESSION'],
+        compression_threshold=app.config['SOCKETIO_COMPRESSION_THRESHOLD']
     )
     mail.init_app(app)
-    migrate.init_app(app, db)
+    if not app.config['FAST_STARTUP']:
+        init_migrations(app)
+    login_manager.init_app(app)
     CORS(app)
+    timer.mark('extensions')
+
+    from app.utils.message_cache import recent_messages
+    recent_messages.init_app(app)
+
+    from app.utils.user_cache import user_cache
+    user_cache.init_app(app)
+
+    from app.utils.metrics import metrics
+    metrics.init_app(app)
+
+    from app.utils.profiling import profiler
+    profiler.init_app(app)
+
+    from app.utils.query_budget import query_monitor
+    query_monitor.init_app(app)
+
+    from app.utils.compression import compressor
+    compressor.init_app(app)
+    timer.mark('instrumentation')
 
     # Регистрация blueprints
     from app.routes.auth import auth_bp
     from app.routes.chats import chats_bp
     from app.routes.uploads import uploads_bp
+    from app.routes.admin import admin_bp
 
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(chats_bp, url_prefix='/chats')
     app.register_blueprint(uploads_bp, url_prefix='/uploads')
+    app.register_blueprint(admin_bp, url_prefix='/admin')
 
     # Главная страница
     @app.route('/')
@@ -95,14 +139,34 @@ def create_app(config_class=Config):
     def favicon():
         return '', 204
 
-    # Проверка статических файлов
-    ensure_static_files()
+    # URL ассетов с хэшем содержимого (`flask assets build`)
+    from app.utils.assets import assets
+    assets.init_app(app)
+
+    # Скачивание ассетов — шаг сборки (`flask assets fetch`), не старта
+    from app.cli import missing_static_files, register_cli
+    register_cli(app)
+    missing = missing_static_files(app.static_folder)
+    if missing:
+        logging.warning(f"Missing static files {missing}, run `flask assets fetch`")
+    timer.mark('blueprints')
 
     # Импорт и регистрация socket.io событий
     from app.sockets import connection, events
+    from app.sockets.ratelimit import limiter
+    limiter.init_app(app, socketio)
     socketio.on_namespace(connection.ChatNamespace('/chat'))
 
+    register_runtime_gauges(metrics)
+    timer.mark('sockets')
+
+    # Периодические задачи: поток стартует только при SCHEDULER_ENABLED
+    from app.utils.scheduler import scheduler
+    scheduler.init_app(app)
+
     # Проверка конфигурации почты
     print(f"📧 MAIL_USERNAME: {app.config.get('MAIL_USERNAME')}")
 
+    timer.report()
+
     return app
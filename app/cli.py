@@ -0,0 +1,300 @@
+import click
+import os
+from flask import current_app
+from flask.cli import AppGroup
+
+assets_cli = AppGroup('assets', help='Static asset build steps.')
+
+SOCKETIO_CLIENT_URL = "https://cdn.socket.io/4.7.5/socket.io.min.js"
+
+# Минимальный пустой favicon (валидный 16×16 ICO)
+PLACEHOLDER_FAVICON = b'\x00\x00\x01\x00\x01\x00\x10\x10\x10\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+
+
+def missing_static_files(static_folder):
+    """Static files the frontend needs that are not on disk"""
+    required = [os.path.join('js', 'socket.io.min.js'), 'favicon.ico']
+    return [name for name in required if not os.path.exists(os.path.join(static_folder, name))]
+
+
+@assets_cli.command('fetch')
+@click.option('--timeout', default=None, type=float, help='Download timeout, seconds.')
+@click.option('--force', is_flag=True, help='Download even if the file exists.')
+def fetch_assets(timeout, force):
+    """Download socket.io.min.js and create a placeholder favicon."""
+    import requests  # нужен только здесь, не при каждом старте воркера
+
+    static_folder = current_app.static_folder
+    timeout = timeout or current_app.config['ASSET_FETCH_TIMEOUT']
+    os.makedirs(os.path.join(static_folder, 'js'), exist_ok=True)
+
+    socketio_js = os.path.join(static_folder, 'js', 'socket.io.min.js')
+    if force or not os.path.exists(socketio_js):
+        click.echo(f"⚙️  Downloading {SOCKETIO_CLIENT_URL}...")
+        try:
+            r = requests.get(SOCKETIO_CLIENT_URL, timeout=timeout)
+            r.raise_for_status()
+        except requests.RequestException as e:
+            raise click.ClickException(f"Failed to download socket.io.min.js: {e}")
+        with open(socketio_js, 'wb') as f:
+            f.write(r.content)
+        click.echo("✅ socket.io.min.js saved to /static/js/")
+
+    favicon_path = os.path.join(static_folder, 'favicon.ico')
+    if not os.path.exists(favicon_path):
+        with open(favicon_path, 'wb') as f:
+            f.write(PLACEHOLDER_FAVICON)
+        click.echo("✅ favicon.ico created")
+
+
+@assets_cli.command('build')
+@click.option('--clean', is_flag=True, help='Remove builds not in the new manifest.')
+def build_static_assets(clean):
+    """Write fingerprinted, precompressed copies of the frontend assets.
+
+    Restart the server afterwards: the manifest is read at startup.
+    """
+    from app.utils.assets import ASSET_FILES, build_assets
+    from app.utils.compression import brotli
+
+    static_folder = current_app.static_folder
+    missing = [name for name in ASSET_FILES if not os.path.exists(os.path.join(static_folder, name))]
+    if missing:
+        raise click.ClickException(f"Missing {missing}, run `flask assets fetch` first")
+
+    output_dir = current_app.extensions['assets'].directory
+    manifest = build_assets(static_folder, output_dir, clean=clean)
+    for name, hashed in sorted(manifest.items()):
+        click.echo(f"  {name} -> {hashed}")
+    variants = '.gz and .br' if brotli is not None else '.gz (install brotli for .br)'
+    click.echo(f"✅ {len(manifest)} assets built in {output_dir} with {variants}")
+
+
+users_cli = AppGroup('users', help='User administration.')
+
+
+@users_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Input format, guessed from the extension by default.')
+@click.option('--workers', default=None, type=int, help='Key generation processes (default: CPU count).')
+@click.option('--chunk-size', default=500, show_default=True, help='Rows per INSERT/commit.')
+@click.option('--no-email', is_flag=True, help='Do not send verification emails.')
+@click.option('--verified', is_flag=True, help='Mark imported users as verified (implies --no-email).')
+def import_users(path, fmt, workers, chunk_size, no_email, verified):
+    """Create users from a CSV or JSONL file with email, username and password."""
+    from app.utils.user_import import UserImporter, read_user_records
+
+    importer = UserImporter(workers=workers, chunk_size=chunk_size,
+                            send_emails=not no_email, verified=verified)
+    result = importer.run(read_user_records(path, fmt))
+
+    for line_no, reason in sorted(importer.errors):
+        click.echo(f"  line {line_no}: {reason}", err=True)
+    phases = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in importer.timings.items())
+    click.echo(
+        f"✅ Imported {result['imported']} users, skipped {result['skipped']}, "
+        f"sent {result['emails_sent']} emails in {result['seconds']:.2f}s "
+        f"({result['users_per_second']:.1f} users/s; {phases})"
+    )
+
+
+chats_cli = AppGroup('chats', help='Chat data maintenance.')
+
+
+@chats_cli.command('merge-dms')
+@click.option('--batch-size', default=500, show_default=True, help='Direct chats per transaction.')
+def merge_dms(batch_size):
+    """Key direct chats by user pair and merge duplicates into the oldest.
+
+    Run with the server stopped, or restart it afterwards: in-process
+    message caches of merged chats are not invalidated from here.
+    """
+    from app.utils.direct_messages import merge_duplicate_dms
+    from app.utils.sharding import message_shards
+
+    # Дубликаты могут лежать в разных шардах: слияние только до их включения
+    if message_shards.enabled:
+        raise click.ClickException("merge-dms moves messages within the primary database; "
+                                   "run it before configuring MESSAGE_SHARDS")
+
+    def progress(stats):
+        click.echo(f"  keyed {stats['keyed']}, merged {stats['merged']}, "
+                   f"moved {stats['messages_moved']} messages")
+
+    stats = merge_duplicate_dms(batch_size=batch_size, progress=progress)
+    click.echo(
+        f"✅ {stats['keyed']} direct chats keyed, {stats['merged']} duplicates merged, "
+        f"{stats['messages_moved']} messages moved, {stats['skipped']} skipped (not two members)"
+    )
+
+
+@chats_cli.command('backfill-counts')
+@click.option('--batch-size', default=1000, show_default=True, help='Chats per transaction.')
+def backfill_counts(batch_size):
+    """Add channel columns if missing and recompute chat.member_count."""
+    from app.utils.membership import backfill_member_counts
+
+    updated = backfill_member_counts(
+        batch_size=batch_size, progress=lambda n: click.echo(f"  {n} chats")
+    )
+    click.echo(f"✅ member_count recomputed for {updated} chats")
+
+
+@chats_cli.command('purge')
+@click.option('--batch-size', default=None, type=int, help='Messages per DELETE (default RETENTION_BATCH_SIZE).')
+@click.option('--pause', default=None, type=float, help='Seconds between batches (default RETENTION_BATCH_PAUSE).')
+@click.option('--dry-run', is_flag=True, help='Count what would be deleted.')
+def purge_messages(batch_size, pause, dry_run):
+    """Delete messages past their chat's retention policy.
+
+    Safe while the server runs: it notices purged chats through
+    chat.purged_through and drops their cached pages.
+    """
+    from app.utils.retention import ensure_retention_column, purge_expired_messages
+
+    ensure_retention_column()
+
+    def progress(chat_id, deleted, stats):
+        click.echo(f"  chat {chat_id}: {deleted} messages; total {stats['messages']}")
+
+    stats = purge_expired_messages(
+        batch_size=batch_size or current_app.config['RETENTION_BATCH_SIZE'],
+        pause=current_app.config['RETENTION_BATCH_PAUSE'] if pause is None else pause,
+        dry_run=dry_run, progress=progress
+    )
+    verb = 'would be deleted' if dry_run else 'deleted'
+    click.echo(f"✅ {stats['messages']} messages in {stats['chats']} chats {verb}, "
+               f"{stats['attachments']} attachments removed")
+
+
+scheduler_cli = AppGroup('scheduler', help='Periodic background jobs.')
+
+
+@scheduler_cli.command('run')
+@click.option('--once', is_flag=True, help='Run due jobs once and exit.')
+@click.option('--job', 'job_name', default=None, help='Run this job now, regardless of its schedule, and exit.')
+def run_scheduler(once, job_name):
+    """Poll for due jobs until interrupted.
+
+    Any number of these processes (and workers with SCHEDULER_ENABLED) may
+    run at once: a lease in the database gives each run to one of them.
+    """
+    from app.utils.scheduler import scheduler
+
+    scheduler.ensure_schema()
+    if job_name:
+        if job_name not in scheduler.jobs:
+            raise click.ClickException(f"Unknown job {job_name}, known: {', '.join(sorted(scheduler.jobs))}")
+        outcome = scheduler.run_now(job_name)
+        if outcome is None:
+            raise click.ClickException(f"{job_name} is running in another process")
+        click.echo(f"{job_name}: {outcome[0]} {outcome[1]}")
+        return
+    if once:
+        for name, status, result in scheduler.run_pending():
+            click.echo(f"{name}: {status} {result}")
+        return
+
+    click.echo(f"⏱  Scheduler {scheduler.owner} polling every {scheduler.tick:.0f}s, "
+               f"jobs: {', '.join(sorted(scheduler.jobs))}")
+    try:
+        scheduler.loop()
+    except KeyboardInterrupt:
+        pass
+
+
+@scheduler_cli.command('status')
+def scheduler_status():
+    """Show next run, lease holder and last run of every job."""
+    from sqlalchemy import func, select
+    from app import db
+    from app.models import JobLease, JobRun
+    from app.utils.scheduler import scheduler
+
+    scheduler.ensure_schema()
+    leases = {lease.name: lease for lease in db.session.scalars(select(JobLease))}
+    last_started = (
+        select(JobRun.job, func.max(JobRun.started_at).label('started_at'))
+        .group_by(JobRun.job).subquery()
+    )
+    last_runs = {run.job: run for run in db.session.scalars(
+        select(JobRun).join(last_started, (JobRun.job == last_started.c.job)
+                            & (JobRun.started_at == last_started.c.started_at))
+    )}
+    for name in sorted(scheduler.jobs):
+        lease, run = leases.get(name), last_runs.get(name)
+        next_run = lease.next_run_at.isoformat(timespec='seconds') if lease else 'not scheduled yet'
+        held = f", leased by {lease.owner} until {lease.lease_until:%H:%M:%S}" if lease and lease.lease_until else ''
+        last = f", last {run.status} {run.started_at:%Y-%m-%d %H:%M:%S} ({run.duration:.2f}s)" if run else ''
+        click.echo(f"  {name}: next {next_run}{held}{last}")
+
+
+shards_cli = AppGroup('shards', help='Message shards (MESSAGE_SHARDS).')
+
+
+@shards_cli.command('init')
+def init_shards():
+    """Create the chat_shard directory, the message table and the message id
+    sequence on every shard."""
+    from app.utils.sharding import message_shards
+
+    message_shards.ensure_schema()
+    click.echo(f"✅ {message_shards.count} message shards ready")
+
+
+@shards_cli.command('status')
+def shards_status():
+    """Show chats placed and messages stored on each shard."""
+    from sqlalchemy import select
+    from app import db
+    from app.models import ChatShard
+    from app.utils.sharding import message_shards
+
+    message_shards.ensure_schema()
+    for shard, chats, messages in message_shards.counts():
+        where = 'primary' if shard == 0 else f'MESSAGE_SHARDS[{shard - 1}]'
+        click.echo(f"  shard {shard} ({where}): {chats} chats placed, {messages} messages")
+    for row in db.session.scalars(select(ChatShard).where(ChatShard.target.isnot(None))):
+        state = 'frozen' if row.frozen else 'copying'
+        click.echo(f"  chat {row.chat_id}: moving {row.shard} -> {row.target} ({state})")
+
+
+@shards_cli.command('move')
+@click.argument('chat_id', type=int)
+@click.argument('shard', type=int)
+@click.option('--batch-size', default=1000, show_default=True, help='Messages per copy/delete transaction.')
+@click.option('--pause', default=0.01, show_default=True, help='Seconds between batches.')
+def move_chat_command(chat_id, shard, batch_size, pause):
+    """Move a chat's messages to SHARD while the server runs.
+
+    Sends to the chat are refused for about two directory TTLs
+    (MESSAGE_SHARD_DIRECTORY_TTL) at the end of the copy. If interrupted,
+    run it again: copying resumes where it stopped.
+    """
+    from app import db
+    from app.models import Chat
+    from app.utils.sharding import message_shards, move_chat
+
+    message_shards.ensure_schema()
+    if db.session.get(Chat, chat_id) is None:
+        raise click.ClickException(f"Chat {chat_id} not found")
+
+    def progress(phase, stats):
+        click.echo(f"  {phase}: copied {stats['copied']}, deleted {stats['deleted']}")
+
+    try:
+        stats = move_chat(chat_id, shard, batch_size=batch_size, pause=pause, progress=progress)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"✅ chat {chat_id} on shard {shard}: {stats['copied']} messages copied, "
+               f"{stats['deleted']} removed from the source in {stats['seconds']:.1f}s, "
+               f"writes paused {stats['frozen_seconds']:.1f}s")
+
+
+def register_cli(app):
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(users_cli)
+    app.cli.add_command(chats_cli)
+    app.cli.add_command(scheduler_cli)
+    app.cli.add_command(shards_cli)
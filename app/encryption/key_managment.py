@@ -1,6 +1,7 @@
 import os
 import json
 import base64
+from datetime import datetime
 from app import db
 from app.models import User
 from .signal_protocol import SignalProtocol
@@ -102,6 +103,7 @@ class KeyManager:
             user.signed_pre_key_public = new_signed_pre_key['public']
             user.signed_pre_key_private = new_signed_pre_key['private']
             user.signed_pre_key_signature = new_signed_pre_key['signature']
+            user.signed_pre_key_rotated_at = datetime.utcnow()
             
             db.session.commit()
             return True
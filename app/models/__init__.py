@@ -1,4 +1,4 @@
 # app/models/__init__.py
-from .user import User, Chat, ChatMember, Message
+from .user import User, Chat, ChatMember, Message, ChatShard, PendingNotification, JobLease, JobRun
 
-__all__ = ['User', 'Chat', 'ChatMember', 'Message']
\ No newline at end of file
+__all__ = ['User', 'Chat', 'ChatMember', 'Message', 'ChatShard', 'PendingNotification', 'JobLease', 'JobRun']
@@ -1,4 +1,4 @@
-from app import db
+from app import db, login_manager
 from datetime import datetime, timedelta
 import secrets
 from flask_login import UserMixin
@@ -26,14 +26,16 @@ class User(UserMixin, db.Model):
     reset_token = db.Column(db.String(100), unique=True, nullable=True)
     reset_token_expires = db.Column(db.DateTime, nullable=True)
 
-    # Ключи шифрования
-    identity_key_public = db.Column(db.Text)
-    identity_key_private = db.Column(db.Text, nullable=True)  # зашифрованный
-    signing_key_public = db.Column(db.Text)
-    signing_key_private = db.Column(db.Text, nullable=True)
-    signed_pre_key_public = db.Column(db.Text)
-    signed_pre_key_private = db.Column(db.Text, nullable=True)
-    signed_pre_key_signature = db.Column(db.Text)
+    # Ключи шифрования: отложенная загрузка одной группой при первом обращении
+    identity_key_public = db.deferred(db.Column(db.Text), group='keys')
+    identity_key_private = db.deferred(db.Column(db.Text, nullable=True), group='keys')  # зашифрованный
+    signing_key_public = db.deferred(db.Column(db.Text), group='keys')
+    signing_key_private = db.deferred(db.Column(db.Text, nullable=True), group='keys')
+    signed_pre_key_public = db.deferred(db.Column(db.Text), group='keys')
+    signed_pre_key_private = db.deferred(db.Column(db.Text, nullable=True), group='keys')
+    signed_pre_key_signature = db.deferred(db.Column(db.Text), group='keys')
+    # Последняя ротация signed pre-key (задача rotate_signed_pre_keys)
+    signed_pre_key_rotated_at = db.Column(db.DateTime, nullable=True)
 
     # Отношения
     messages = db.relationship('Message', backref='author', lazy=True)
@@ -75,6 +77,13 @@ class User(UserMixin, db.Model):
         return f'<User {self.username}>'
 
 
+@login_manager.user_loader
+def load_user(user_id):
+    """Flask-Login: облегчённый пользователь по id из сессии (см. user_cache)"""
+    from app.utils.user_cache import user_cache
+    return user_cache.load(int(user_id))
+
+
 class Chat(db.Model):
     __tablename__ = 'chat'
 
@@ -84,10 +93,27 @@ class Chat(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
 
+    # Личный чат: пара (меньший id, больший id), у групп NULL
+    dm_user_low = db.Column(db.Integer, nullable=True)
+    dm_user_high = db.Column(db.Integer, nullable=True)
+
+    # Канал: без лимита участников, пишут только админы
+    is_channel = db.Column(db.Boolean, default=False, nullable=False, server_default='0')
+    # Денормализованное число участников (ведёт app/utils/membership.py)
+    member_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+
+    # Хранение сообщений, дней: NULL — глобальный MESSAGE_RETENTION_DAYS, 0 — бессрочно
+    retention_days = db.Column(db.Integer, nullable=True)
+    # id последнего сообщения, удалённого чисткой: по нему воркеры сбрасывают
+    # свои кэши, если чистка шла в другом процессе
+    purged_through = db.Column(db.Integer, nullable=True)
+
     # Отношения
     members = db.relationship('ChatMember', backref='chat', lazy=True, cascade='all, delete-orphan')
     messages = db.relationship('Message', backref='chat', lazy=True, cascade='all, delete-orphan')
 
+    __table_args__ = (db.Index('ux_chat_dm_pair', 'dm_user_low', 'dm_user_high', unique=True),)
+
 
 class ChatMember(db.Model):
     __tablename__ = 'chat_member'
@@ -98,7 +124,11 @@ class ChatMember(db.Model):
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_admin = db.Column(db.Boolean, default=False)
 
-    __table_args__ = (db.UniqueConstraint('user_id', 'chat_id', name='unique_chat_member'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'chat_id', name='unique_chat_member'),
+        # Постраничный список участников канала: WHERE chat_id = ? AND user_id > ?
+        db.Index('ix_chat_member_chat_user', 'chat_id', 'user_id'),
+    )
 
 
 class Message(db.Model):
@@ -116,3 +146,72 @@ class Message(db.Model):
     registration_id = db.Column(db.Integer)
     device_id = db.Column(db.Integer)
     pre_key_bundle = db.Column(db.Text)  # сериализованный пакет pre-key
+
+    # Курсорные выборки истории (экспорт, синхронизация) идут по (chat_id, id)
+    __table_args__ = (db.Index('ix_message_chat_id_id', 'chat_id', 'id'),)
+
+
+class ChatShard(db.Model):
+    """Каталог хранилищ сообщений: в каком шарде лежат сообщения чата.
+
+    Чат без строки живёт в шарде 0 (основная БД, сюда попадает вся
+    история до включения шардов). target задан, пока `flask shards move`
+    копирует чат; frozen — короткое окно в конце переноса, когда запись
+    в чат отклоняется.
+    """
+    __tablename__ = 'chat_shard'
+
+    chat_id = db.Column(db.Integer, db.ForeignKey('chat.id'), primary_key=True)
+    shard = db.Column(db.Integer, nullable=False, default=0)
+    target = db.Column(db.Integer, nullable=True)
+    frozen = db.Column(db.Boolean, nullable=False, default=False)
+
+
+class PendingNotification(db.Model):
+    """Непрочитанное офлайн-пользователем в одном чате, до отправки дайджеста.
+
+    Одна строка на (пользователь, чат): новые сообщения увеличивают
+    message_count, due_at задаётся первым сообщением окна.
+    """
+    __tablename__ = 'pending_notification'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    chat_id = db.Column(db.Integer, db.ForeignKey('chat.id'), nullable=False)
+    message_count = db.Column(db.Integer, nullable=False, default=1)
+    last_sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    last_at = db.Column(db.DateTime, nullable=False)
+    due_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'chat_id', name='unique_pending_notification'),
+        db.Index('ix_pending_notification_due', 'due_at'),
+    )
+
+
+class JobLease(db.Model):
+    """Расписание и аренда фоновой задачи: одна строка на задачу.
+
+    Процесс, которому удался условный UPDATE, выполняет задачу; остальные
+    ждут next_run_at. Истёкшая аренда (упавший процесс) снова свободна.
+    """
+    __tablename__ = 'job_lease'
+
+    name = db.Column(db.String(100), primary_key=True)
+    owner = db.Column(db.String(100), nullable=True)
+    lease_until = db.Column(db.DateTime, nullable=True)
+    next_run_at = db.Column(db.DateTime, nullable=False)
+
+
+class JobRun(db.Model):
+    __tablename__ = 'job_run'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(100), nullable=False)
+    owner = db.Column(db.String(100), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    duration = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(10), nullable=False)  # ok, failed
+    result = db.Column(db.Text)  # результат или текст ошибки
+
+    __table_args__ = (db.Index('ix_job_run_job_started', 'job', 'started_at'),)
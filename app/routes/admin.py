@@ -0,0 +1,50 @@
+from flask import Blueprint, request, jsonify, current_app, send_from_directory
+from functools import wraps
+import hmac
+from app.utils.message_cache import recent_messages
+from app.sockets.ratelimit import limiter
+from app.utils.profiling import profiler
+from app.utils.user_cache import user_cache
+from app.utils.compression import compressor
+
+admin_bp = Blueprint('admin', __name__)
+
+def admin_required(view):
+    """Allow the request only with a matching X-Admin-Token header"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        expected = current_app.config.get('ADMIN_TOKEN')
+        provided = request.headers.get('X-Admin-Token', '')
+        
+        # Без настроенного токена админские эндпоинты недоступны
+        if not expected or not hmac.compare_digest(provided, expected):
+            return jsonify({'error': 'Admin authorization required'}), 403
+        
+        return view(*args, **kwargs)
+    return wrapped
+
+@admin_bp.route('/stats', methods=['GET'])
+@admin_required
+def get_stats():
+    """In-process cache and compression statistics for sizing"""
+    return jsonify({
+        'recent_messages': recent_messages.stats(),
+        'socket_limits': limiter.stats(),
+        'user_cache': user_cache.stats(),
+        'compression': compressor.stats()
+    }), 200
+
+@admin_bp.route('/profiles', methods=['GET'])
+@admin_required
+def list_profiles():
+    """Saved collapsed-stack profiles, newest first"""
+    profiles = sorted(profiler.list_profiles(), key=lambda p: p['name'], reverse=True)
+    return jsonify({'enabled': profiler.enabled, 'profiles': profiles}), 200
+
+@admin_bp.route('/profiles/<path:name>', methods=['GET'])
+@admin_required
+def get_profile(name):
+    """Download one profile (feed it to flamegraph.pl or speedscope)"""
+    if not name.endswith('.collapsed'):
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_from_directory(profiler.directory, name, mimetype='text/plain')
@@ -2,7 +2,8 @@ from flask import Blueprint, request, jsonify, current_app, render_template, red
 from flask_login import login_user, logout_user, login_required, current_user
 from app import db, mail
 from app.models import User
-from app.encryption.signal_protocol import SignalProtocol
+from app.sockets.auth import generate_socket_token
+from app.utils.db_routing import replica_ok
 from flask_mail import Message
 import re
 import logging
@@ -87,6 +88,8 @@ def register():
             return jsonify({'error': 'Username already taken'}), 400
         
         # Генерация криптографических ключей
+        # cryptography грузится только при регистрации, не при старте воркера
+        from app.encryption.signal_protocol import SignalProtocol
         signal = SignalProtocol(current_app.config['SIGNAL_PROTOCOL_STORE'])
         identity_keys = signal.generate_identity_key_pair()
         signing_keys = signal.generate_signing_key_pair()
@@ -179,7 +182,8 @@ def login():
             'message': 'Login successful',
             'user_id': user.id,
             'username': user.username,
-            'email': user.email
+            'email': user.email,
+            'socket_token': generate_socket_token(user)
         }), 200
         
     except Exception as e:
@@ -197,6 +201,7 @@ def logout():
         return jsonify({'error': 'Logout failed'}), 500
 
 @auth_bp.route('/me', methods=['GET'])
+@replica_ok
 @login_required
 def get_current_user():
     try:
@@ -210,6 +215,12 @@ def get_current_user():
         current_app.logger.error(f"Get user error: {str(e)}")
         return jsonify({'error': 'Failed to get user info'}), 500
 
+@auth_bp.route('/socket-token', methods=['GET'])
+@login_required
+def get_socket_token():
+    """Signed token for clients that connect to /chat without the session cookie"""
+    return jsonify({'token': generate_socket_token(current_user)}), 200
+
 @auth_bp.route('/verify/<token>')
 def verify_email(token):
     try:
@@ -271,6 +282,30 @@ def resend_verification():
         current_app.logger.error(f"Resend verification error: {str(e)}")
         return jsonify({'error': 'Failed to resend verification'}), 500
 
+def build_verification_message(user, verification_url):
+    """Письмо со ссылкой подтверждения email"""
+    return Message(
+        subject='Verify your S-Chat account',
+        recipients=[user.email],
+        sender=current_app.config.get('MAIL_DEFAULT_SENDER') or current_app.config.get('MAIL_USERNAME'),
+        html=f'''
+        <h2>Welcome to S-Chat!</h2>
+        <p>Hello {user.username},</p>
+        <p>Please verify your email by clicking the link below:</p>
+        <a href="{verification_url}" style="
+            display: inline-block; 
+            padding: 12px 24px; 
+            background: #007bff; 
+            color: white; 
+            text-decoration: none; 
+            border-radius: 5px;
+        ">Verify Email</a>
+        <p>Or copy and paste this link in your browser:</p>
+        <p><code>{verification_url}</code></p>
+        <p>If you didn't create an account, please ignore this email.</p>
+        '''
+    )
+
 def send_verification_email(user):
     """
     Отправка verification email с обработкой различных сценариев
@@ -295,27 +330,7 @@ def send_verification_email(user):
         # Если конфигурация есть, пытаемся отправить настоящее письмо
         verification_url = f"{request.host_url}auth/verify-page/{user.verification_token}"
         
-        msg = Message(
-            subject='Verify your S-Chat account',
-            recipients=[user.email],
-            sender=current_app.config.get('MAIL_DEFAULT_SENDER') or mail_username,
-            html=f'''
-            <h2>Welcome to S-Chat!</h2>
-            <p>Hello {user.username},</p>
-            <p>Please verify your email by clicking the link below:</p>
-            <a href="{verification_url}" style="
-                display: inline-block; 
-                padding: 12px 24px; 
-                background: #007bff; 
-                color: white; 
-                text-decoration: none; 
-                border-radius: 5px;
-            ">Verify Email</a>
-            <p>Or copy and paste this link in your browser:</p>
-            <p><code>{verification_url}</code></p>
-            <p>If you didn't create an account, please ignore this email.</p>
-            '''
-        )
+        msg = build_verification_message(user, verification_url)
         
         mail.send(msg)
         logging.info(f"✅ Verification email sent to {user.email}")
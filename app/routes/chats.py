@@ -1,47 +1,142 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 from app import db
 from app.models import Chat, ChatMember, User, Message
+from app.utils.message_cache import recent_messages
+from app.utils.query_budget import extend_budget, query_budget
+from app.utils.db_routing import read_engine, replica_ok, replica_router
+from app.utils.versioning import VersionedCache, conditional_json, versions
+from app.utils.membership import (
+    _chunks, add_members, apply_membership_changes, member_count, publish_membership_changes,
+    touch_chat_lists
+)
+from app.utils.direct_messages import open_or_get_dm
+from app.utils.retention import check_purges, retention_days
+from app.utils.sharding import message_shards
+from flask_sqlalchemy.pagination import SelectPagination
 from flask_login import login_required, current_user
+from sqlalchemy import select, update, and_, or_, func
+from datetime import datetime
+import base64
+import binascii
+import json
+import math
 
 chats_bp = Blueprint('chats', __name__)
 
+# Списки участников по версии состава чата
+member_lists = VersionedCache(maxsize=1000)
+
+MAX_GROUP_MEMBERS = 50
+
+# Тип чата не меняется после создания: is_channel без запроса к БД
+chat_kinds = VersionedCache(maxsize=10000)
+
+# Id чатов пользователя по версии его списка чатов
+user_chat_ids = VersionedCache(maxsize=10000)
+
+
+def _is_channel(chat_id):
+    return chat_kinds.get_or_compute(chat_id, 0, lambda: bool(db.session.scalar(
+        select(Chat.is_channel).where(Chat.id == chat_id)
+    )))
+
+
+def _member_cap(chat):
+    if chat.is_channel:
+        return current_app.config['CHANNEL_MAX_MEMBERS']
+    return MAX_GROUP_MEMBERS
+
+
+def _chat_list_version(user_id):
+    """(chat ids, version) of a user's chat list from counters alone.
+
+    The version combines the user's membership counter with the message
+    and member counters of each of their chats. Counters only grow, so the
+    sum changes whenever any of them is bumped. The chat ids are cached
+    under the membership counter: warm, the only query reads the chats'
+    purge watermarks, so purges run by other processes bump the counters.
+    """
+    own = versions.get('chats', user_id)
+    chat_ids = user_chat_ids.get_or_compute(user_id, own, lambda: db.session.scalars(
+        select(ChatMember.chat_id).where(ChatMember.user_id == user_id)
+    ).all())
+    check_purges(chat_ids)
+    activity = sum(versions.get('messages', chat_id) + versions.get('members', chat_id)
+                   for chat_id in chat_ids)
+    return chat_ids, f"{own}.{activity}"
+
+
+def _last_messages(chat_ids):
+    """{chat_id: newest Message row}, one window query per shard and chunk"""
+    last = {}
+    for shard, shard_chat_ids in message_shards.group(chat_ids).items():
+        store = message_shards.session(shard=shard)
+        for chunk in _chunks(shard_chat_ids):
+            ranked = select(
+                Message.chat_id,
+                Message.content,
+                Message.message_type,
+                Message.timestamp,
+                func.row_number().over(
+                    partition_by=Message.chat_id,
+                    order_by=(Message.timestamp.desc(), Message.id.desc())
+                ).label('rn')
+            ).where(Message.chat_id.in_(chunk)).subquery()
+            last.update((row.chat_id, row) for row in store.execute(
+                select(ranked).where(ranked.c.rn == 1)
+            ))
+    return last
+
+
+def _chat_list_payload(chat_ids):
+    # Последние сообщения могли быть записаны только что — не с реплики
+    replica_router.avoid_stale({('chat', chat_id) for chat_id in chat_ids})
+    
+    chats = {}
+    for chunk in _chunks(chat_ids):
+        chats.update((chat.id, chat) for chat in Chat.query.filter(Chat.id.in_(chunk)))
+    last_messages = _last_messages(list(chats))
+    
+    chats_data = []
+    for chat_id in chat_ids:
+        chat = chats.get(chat_id)
+        if chat is None:
+            continue
+        
+        last_message = last_messages.get(chat.id)
+        
+        chats_data.append({
+            'id': chat.id,
+            'name': chat.name,
+            'is_group': chat.is_group,
+            'is_channel': chat.is_channel,
+            'member_count': chat.member_count,
+            'last_message': {
+                'content': last_message.content,
+                'timestamp': last_message.timestamp.isoformat() if last_message.timestamp else None,
+                'type': last_message.message_type
+            } if last_message else None,
+            'created_at': chat.created_at.isoformat()
+        })
+    
+    return {'chats': chats_data}
+
 @chats_bp.route('/chats', methods=['GET'])
+@replica_ok
 def get_user_chats():
     """Get all chats for a user"""
     try:
-        user_id = request.args.get('user_id')
+        user_id = request.args.get('user_id', type=int)
         
         if not user_id:
             return jsonify({'error': 'User ID is required'}), 400
         
-        # Get user's chat memberships
-        memberships = ChatMember.query.filter_by(user_id=user_id).all()
-        
-        chats_data = []
-        for membership in memberships:
-            chat = Chat.query.get(membership.chat_id)
-            
-            # Get last message
-            last_message = Message.query.filter_by(chat_id=chat.id)\
-                .order_by(Message.timestamp.desc()).first()
-            
-            # Get member count
-            member_count = ChatMember.query.filter_by(chat_id=chat.id).count()
-            
-            chats_data.append({
-                'id': chat.id,
-                'name': chat.name,
-                'is_group': chat.is_group,
-                'member_count': member_count,
-                'last_message': {
-                    'content': last_message.content if last_message else None,
-                    'timestamp': last_message.timestamp.isoformat() if last_message else None,
-                    'type': last_message.message_type if last_message else 'text'
-                } if last_message else None,
-                'created_at': chat.created_at.isoformat()
-            })
-        
-        return jsonify({'chats': chats_data}), 200
+        # Неизменившийся список — 304 по одним счётчикам версий
+        chat_ids, version = _chat_list_version(user_id)
+        return conditional_json(
+            versions.etag('chats', user_id, version),
+            lambda: _chat_list_payload(chat_ids)
+        )
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -54,7 +149,8 @@ def create_chat():
         name = data.get('name')
         user_ids = data.get('user_ids', [])  # List of user IDs to add to chat
         created_by = data.get('created_by')
-        is_group = data.get('is_group', False)
+        is_channel = data.get('is_channel', False)
+        is_group = data.get('is_group', False) or is_channel
         
         if not created_by:
             return jsonify({'error': 'Creator user ID is required'}), 400
@@ -64,152 +160,597 @@ def create_chat():
             return jsonify({'error': 'Individual chat must have exactly 2 users'}), 400
         
         # For group chats, check max members
-        if is_group and len(user_ids) + 1 > 50:  # +1 for creator
-            return jsonify({'error': 'Group chat cannot exceed 50 members'}), 400
+        max_members = current_app.config['CHANNEL_MAX_MEMBERS'] if is_channel else MAX_GROUP_MEMBERS
+        if is_group and len(set(user_ids) - {created_by}) + 1 > max_members:  # +1 for creator
+            return jsonify({'error': f'Group chat cannot exceed {max_members} members'}), 400
+        
+        # Individual chat: one per pair of users
+        if not is_group:
+            chat_id, created = open_or_get_dm(created_by, user_ids[0], name=name)
+            if created:
+                versions.bump('members', chat_id)
+                touch_chat_lists([created_by, user_ids[0]])
+            return jsonify({
+                'message': 'Chat created successfully' if created else 'Chat already exists',
+                'chat_id': chat_id,
+                'created': created
+            }), 201 if created else 200
         
         # Create chat
         chat = Chat(
             name=name,
             is_group=is_group,
-            created_by=created_by
+            is_channel=is_channel,
+            created_by=created_by,
+            member_count=1
         )
         
         db.session.add(chat)
         db.session.flush()  # Get chat ID without committing
         
-        # Add creator as admin
-        creator_member = ChatMember(
-            user_id=created_by,
-            chat_id=chat.id,
-            is_admin=True
-        )
-        db.session.add(creator_member)
-        
-        # Add other users
-        for user_id in user_ids:
-            if user_id != created_by:  # Don't add creator twice
-                member = ChatMember(
-                    user_id=user_id,
-                    chat_id=chat.id,
-                    is_admin=False
-                )
-                db.session.add(member)
+        # Add creator as admin, other users in one INSERT
+        db.session.add(ChatMember(user_id=created_by, chat_id=chat.id, is_admin=True))
+        db.session.flush()
+        added = add_members(chat.id, [uid for uid in user_ids if uid != created_by], members={created_by: True})
         
+        chat_id = chat.id
+        message_shards.place(chat_id)
         db.session.commit()
+        versions.bump('members', chat_id)
+        touch_chat_lists([created_by] + added)
         
         return jsonify({
             'message': 'Chat created successfully',
-            'chat_id': chat.id
+            'chat_id': chat_id
         }), 201
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def _message_page(chat_id, page, per_page):
+    # Самая новая страница обычно уже лежит в буфере комнаты
+    if page == 1 and per_page > 0:
+        cached = recent_messages.newest(chat_id, per_page)
+        if cached is not None:
+            messages_data, total = cached
+            return {
+                'messages': messages_data,
+                'total': total,
+                'pages': math.ceil(total / per_page),
+                'current_page': page
+            }
+    
+    messages = SelectPagination(
+        select=select(Message).where(Message.chat_id == chat_id)
+        .order_by(Message.timestamp.desc(), Message.id.desc()),
+        session=message_shards.session(chat_id),
+        page=page, per_page=per_page, max_per_page=None, error_out=False
+    )
+    
+    messages_data = []
+    for message in messages.items:
+        messages_data.append({
+            'id': message.id,
+            'user_id': message.user_id,
+            'content': message.content,
+            'type': message.message_type,
+            'file_path': message.file_path,
+            'timestamp': message.timestamp.isoformat()
+        })
+    
+    if page == 1:
+        recent_messages.seed(chat_id, messages_data, messages.total)
+    
+    return {
+        'messages': messages_data,
+        'total': messages.total,
+        'pages': messages.pages,
+        'current_page': page
+    }
+
 @chats_bp.route('/chats/<int:chat_id>/messages', methods=['GET'])
+@replica_ok
+@query_budget(3)
 def get_chat_messages(chat_id):
     """Get messages for a specific chat"""
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 50, type=int)
         
-        messages = Message.query.filter_by(chat_id=chat_id)\
-            .order_by(Message.timestamp.desc())\
-            .paginate(page=page, per_page=per_page, error_out=False)
-        
-        messages_data = []
-        for message in messages.items:
-            messages_data.append({
-                'id': message.id,
-                'user_id': message.user_id,
-                'content': message.content,
-                'type': message.message_type,
-                'file_path': message.file_path,
-                'timestamp': message.timestamp.isoformat()
-            })
+        # Чистка в другом процессе: сбросить буфер и версию до расчёта ETag
+        check_purges([chat_id])
         
-        return jsonify({
-            'messages': messages_data,
-            'total': messages.total,
-            'pages': messages.pages,
-            'current_page': page
-        }), 200
+        # Каждое новое сообщение сдвигает все страницы: одна версия на чат
+        return conditional_json(
+            versions.etag('messages', chat_id),
+            lambda: _message_page(chat_id, page, per_page)
+        )
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _parse_timestamp(value):
+    """Parse an ISO-8601 query argument, None if absent"""
+    if not value:
+        return None
+    return datetime.fromisoformat(value)
+
+def _encode_resume_token(chat_id, last_id, since, until):
+    """Opaque token that resumes an export after last_id with the same filters"""
+    payload = {
+        'chat_id': chat_id,
+        'after_id': last_id,
+        'since': since.isoformat() if since else None,
+        'until': until.isoformat() if until else None
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def _decode_resume_token(token):
+    """Inverse of _encode_resume_token; raises ValueError on garbage"""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError('Invalid resume token') from e
+    # Валидный JSON, но не объект ("1", []) — тоже мусор
+    if not isinstance(state, dict):
+        raise ValueError('Invalid resume token')
+    return state
+
+def _export_lines(chat_id, after_id, since, until, batch_size):
+    """Yield NDJSON lines for a chat from a server-side cursor.
+
+    Rows are fetched as plain tuples in batches of batch_size, so memory
+    stays constant regardless of how many messages the chat holds.
+    """
+    query = select(
+        Message.id,
+        Message.user_id,
+        Message.content,
+        Message.message_type,
+        Message.file_path,
+        Message.timestamp
+    ).where(
+        Message.chat_id == chat_id,
+        Message.id > after_id
+    ).order_by(Message.id)
+
+    if since:
+        query = query.where(Message.timestamp >= since)
+    if until:
+        query = query.where(Message.timestamp < until)
+
+    last_id = after_id
+    count = 0
+    engine = message_shards.engine(message_shards.shard_of(chat_id)) or read_engine(db)
+    with engine.connect() as conn:
+        result = conn.execution_options(
+            stream_results=True,
+            yield_per=batch_size
+        ).execute(query)
+
+        for rows in result.partitions():
+            # Одна запись в сокет на пачку, а не на строку
+            chunk = []
+            for row in rows:
+                chunk.append(json.dumps({
+                    'id': row.id,
+                    'user_id': row.user_id,
+                    'content': row.content,
+                    'type': row.message_type,
+                    'file_path': row.file_path,
+                    'timestamp': row.timestamp.isoformat() if row.timestamp else None
+                }) + '\n')
+            last_id = rows[-1].id
+            count += len(rows)
+            yield ''.join(chunk)
+
+    # Завершающая строка: клиент продолжает экспорт с этого токена
+    yield json.dumps({
+        'end': True,
+        'count': count,
+        'resume_token': _encode_resume_token(chat_id, last_id, since, until)
+    }) + '\n'
+
+@chats_bp.route('/chats/<int:chat_id>/export', methods=['GET'])
+@login_required
+def export_chat(chat_id):
+    """Stream the full history of a chat as NDJSON, to a logged-in member.
+
+    Query args: since/until (ISO-8601, half-open range), after_id, or a
+    resume token from a previous export that restores all of them.
+    """
+    try:
+        token = request.args.get('resume')
+        if token:
+            state = _decode_resume_token(token)
+            if state.get('chat_id') != chat_id:
+                return jsonify({'error': 'Resume token belongs to another chat'}), 400
+            after_id = int(state.get('after_id') or 0)
+            since = _parse_timestamp(state.get('since'))
+            until = _parse_timestamp(state.get('until'))
+        else:
+            after_id = request.args.get('after_id', 0, type=int)
+            since = _parse_timestamp(request.args.get('since'))
+            until = _parse_timestamp(request.args.get('until'))
+    except TypeError:
+        # Объект, но с полями не того типа
+        return jsonify({'error': 'Invalid resume token'}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not db.session.get(Chat, chat_id):
+        return jsonify({'error': 'Chat not found'}), 404
+    
+    # Вся история чата — только его участникам
+    is_member = db.session.scalar(
+        select(ChatMember.id)
+        .where(ChatMember.chat_id == chat_id, ChatMember.user_id == current_user.id)
+    )
+    if not is_member:
+        return jsonify({'error': 'Not a member of this chat'}), 403
+
+    batch_size = current_app.config.get('EXPORT_BATCH_SIZE', 1000)
+    lines = _export_lines(chat_id, after_id, since, until, batch_size)
+
+    return Response(
+        stream_with_context(lines),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename=chat_{chat_id}.ndjson'}
+    )
+
+def _sync_rows(user_id, cursors, limit):
+    """Ranked rows of the sync query, one statement per message shard.
+
+    Shard 0 shares the primary with chat_member and checks membership in a
+    join; for chats on other shards it is checked first, in one query.
+    """
+    by_shard = message_shards.group(cursors)
+    others = [chat_id for shard, chat_ids in by_shard.items() if shard for chat_id in chat_ids]
+    if others:
+        extend_budget(len(by_shard))
+        member_of = set(db.session.scalars(
+            select(ChatMember.chat_id)
+            .where(ChatMember.user_id == user_id, ChatMember.chat_id.in_(others))
+        ))
+
+    rows = []
+    for shard, chat_ids in by_shard.items():
+        if shard:
+            chat_ids = [chat_id for chat_id in chat_ids if chat_id in member_of]
+            if not chat_ids:
+                continue
+        # Номер строки внутри каждого чата: limit + 1 строка говорит о том,
+        # что клиент отстал больше чем на limit сообщений
+        ranked = select(
+            Message.id,
+            Message.chat_id,
+            Message.user_id,
+            Message.content,
+            Message.message_type,
+            Message.file_path,
+            Message.timestamp,
+            func.row_number().over(
+                partition_by=Message.chat_id,
+                order_by=Message.id
+            ).label('rn')
+        ).where(
+            or_(*[
+                and_(Message.chat_id == chat_id, Message.id > cursors[chat_id])
+                for chat_id in chat_ids
+            ])
+        )
+        if not shard:
+            ranked = ranked.join(
+                ChatMember,
+                and_(ChatMember.chat_id == Message.chat_id, ChatMember.user_id == user_id)
+            )
+        ranked = ranked.subquery()
+
+        rows.extend(message_shards.session(shard=shard).execute(
+            select(ranked)
+            .where(ranked.c.rn <= limit + 1)
+            .order_by(ranked.c.chat_id, ranked.c.id)
+        ))
+    return rows
+
+@chats_bp.route('/chats/sync', methods=['POST'])
+@query_budget(1)
+def sync_chats():
+    """Return messages newer than the client's last seen id for many chats.
+
+    Body: {"user_id": 1, "chats": {"<chat_id>": <last_seen_message_id>}, "limit": 100}.
+    Each message shard is asked one query over the (chat_id, id) index; a chat
+    with more than `limit` new messages is flagged too_far_behind instead,
+    and the client should refetch its newest page.
+    """
+    try:
+        data = request.get_json() or {}
+        user_id = data.get('user_id')
+        cursors = data.get('chats') or {}
+
+        if not user_id:
+            return jsonify({'error': 'User ID is required'}), 400
+
+        max_limit = current_app.config.get('SYNC_MAX_MESSAGES_PER_CHAT', 200)
+        limit = min(int(data.get('limit', 100)), max_limit)
+        if limit < 1:
+            return jsonify({'error': 'Limit must be positive'}), 400
+
+        if len(cursors) > current_app.config.get('SYNC_MAX_CHATS', 500):
+            return jsonify({'error': 'Too many chats in one sync request'}), 400
+
+        cursors = {int(chat_id): int(last_id or 0) for chat_id, last_id in cursors.items()}
+        result = {
+            str(chat_id): {'messages': [], 'too_far_behind': False}
+            for chat_id in cursors
+        }
+        if not cursors:
+            return jsonify({'chats': result}), 200
+
+        rows = _sync_rows(user_id, cursors, limit)
+
+        for row in rows:
+            entry = result[str(row.chat_id)]
+            if row.rn > limit:
+                entry['too_far_behind'] = True
+                entry['messages'] = []
+            elif not entry['too_far_behind']:
+                entry['messages'].append({
+                    'id': row.id,
+                    'chat_id': row.chat_id,
+                    'user_id': row.user_id,
+                    'content': row.content,
+                    'type': row.message_type,
+                    'file_path': row.file_path,
+                    'timestamp': row.timestamp.isoformat()
+                })
+
+        return jsonify({'chats': result}), 200
+
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Chat ids and message ids must be integers'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _load_chat_members(chat_id):
+    rows = db.session.execute(
+        select(User.id, User.username, ChatMember.is_admin, ChatMember.joined_at)
+        .join(User, User.id == ChatMember.user_id)
+        .where(ChatMember.chat_id == chat_id)
+        .order_by(ChatMember.joined_at, ChatMember.id)
+    ).all()
+    return [
+        {
+            'user_id': user_id,
+            'username': username,
+            'is_admin': is_admin,
+            'joined_at': joined_at.isoformat()
+        }
+        for user_id, username, is_admin, joined_at in rows
+    ]
+
+
+def _member_page(chat_id, after, limit):
+    """Keyset page of members ordered by user id (ix_chat_member_chat_user)"""
+    rows = db.session.execute(
+        select(User.id, User.username, ChatMember.is_admin, ChatMember.joined_at)
+        .join(User, User.id == ChatMember.user_id)
+        .where(ChatMember.chat_id == chat_id, ChatMember.user_id > after)
+        .order_by(ChatMember.user_id)
+        .limit(limit + 1)
+    ).all()
+    members = [
+        {
+            'user_id': user_id,
+            'username': username,
+            'is_admin': is_admin,
+            'joined_at': joined_at.isoformat()
+        }
+        for user_id, username, is_admin, joined_at in rows[:limit]
+    ]
+    next_after = members[-1]['user_id'] if len(rows) > limit else None
+    return members, next_after
+
+
+# Не @replica_ok: ответ кэшируется под версией состава, а устаревшая
+# реплика закэшировала бы старый список под новой версией
 @chats_bp.route('/chats/<int:chat_id>/members', methods=['GET'])
+@query_budget(2)
 def get_chat_members(chat_id):
-    """Get members of a specific chat"""
+    """Get members of a specific chat (ETag = membership version).
+
+    Channels, and any request with ?after= or ?limit=, get keyset pages:
+    {"members", "next_after"}; pass next_after back as ?after= until it
+    is null.
+    """
     try:
-        members = ChatMember.query.filter_by(chat_id=chat_id).all()
+        if _is_channel(chat_id) or 'after' in request.args or 'limit' in request.args:
+            after = request.args.get('after', 0, type=int)
+            limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+            members, next_after = _member_page(chat_id, after, limit)
+            return jsonify({'members': members, 'next_after': next_after}), 200
         
-        members_data = []
-        for member in members:
-            user = User.query.get(member.user_id)
-            members_data.append({
-                'user_id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'is_admin': member.is_admin,
-                'joined_at': member.joined_at.isoformat()
-            })
-        
-        return jsonify({'members': members_data}), 200
+        version = versions.get('members', chat_id)
+        return conditional_json(
+            versions.etag('members', chat_id, version),
+            lambda: {'members': member_lists.get_or_compute(
+                chat_id, version, lambda: _load_chat_members(chat_id)
+            )}
+        )
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _require_admin(chat_id, user_id, action='change members'):
+    """None if user_id is an admin of the chat, else an error response"""
+    is_admin = db.session.scalar(
+        select(ChatMember.is_admin)
+        .where(ChatMember.chat_id == chat_id, ChatMember.user_id == user_id)
+    )
+    if not is_admin:
+        return jsonify({'error': f'Only admins can {action}'}), 403
+    return None
+
+
 @chats_bp.route('/chats/<int:chat_id>/invite', methods=['POST'])
-def invite_to_chat():
+@query_budget(8)
+def invite_to_chat(chat_id):
     """Invite users to a group chat"""
     try:
         data = request.get_json()
-        chat_id = data.get('chat_id')
         user_ids = data.get('user_ids', [])
         invited_by = data.get('invited_by')
         
-        chat = Chat.query.get(chat_id)
+        chat = db.session.get(Chat, chat_id)
         if not chat:
             return jsonify({'error': 'Chat not found'}), 404
         
         if not chat.is_group:
             return jsonify({'error': 'Can only invite to group chats'}), 400
         
-        # Check if inviter is admin
-        inviter_member = ChatMember.query.filter_by(
-            user_id=invited_by, 
-            chat_id=chat_id
-        ).first()
-        
-        if not inviter_member or not inviter_member.is_admin:
-            return jsonify({'error': 'Only admins can invite users'}), 403
-        
-        # Check member limit
-        current_members = ChatMember.query.filter_by(chat_id=chat_id).count()
-        if current_members + len(user_ids) > 50:
-            return jsonify({'error': 'Cannot exceed 50 members'}), 400
-        
-        # Add users to chat
-        for user_id in user_ids:
-            # Check if user is already a member
-            existing_member = ChatMember.query.filter_by(
-                user_id=user_id, 
-                chat_id=chat_id
-            ).first()
-            
-            if not existing_member:
-                member = ChatMember(
-                    user_id=user_id,
-                    chat_id=chat_id,
-                    is_admin=False
-                )
-                db.session.add(member)
+        denied = _require_admin(chat_id, invited_by)
+        if denied:
+            return denied
         
+        changes = apply_membership_changes(chat_id, add=user_ids, max_members=_member_cap(chat))
         db.session.commit()
+        publish_membership_changes(chat_id, changes, notify_room=not chat.is_channel)
         
-        return jsonify({'message': 'Users invited successfully'}), 200
+        return jsonify({'message': 'Users invited successfully', 'added': changes['added']}), 200
         
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+@chats_bp.route('/chats/<int:chat_id>/members', methods=['POST'])
+@query_budget(12)
+def update_chat_members(chat_id):
+    """Bulk add/remove/promote/demote in one transaction.
+
+    Body: {"actor_id", "add": [...], "remove": [...], "promote": [...],
+    "demote": [...]}. Only admins may change others; any member may
+    remove themselves.
+    """
+    try:
+        data = request.get_json() or {}
+        actor_id = data.get('actor_id')
+        add = data.get('add', [])
+        remove = data.get('remove', [])
+        promote = data.get('promote', [])
+        demote = data.get('demote', [])
+        
+        chat = db.session.get(Chat, chat_id)
+        if not chat:
+            return jsonify({'error': 'Chat not found'}), 404
+        
+        if not chat.is_group:
+            return jsonify({'error': 'Can only change members of group chats'}), 400
+        
+        leaving_only = not (add or promote or demote) and [str(u) for u in remove] == [str(actor_id)]
+        if not leaving_only:
+            denied = _require_admin(chat_id, actor_id)
+            if denied:
+                return denied
+        
+        changes = apply_membership_changes(
+            chat_id, add=add, remove=remove, promote=promote, demote=demote,
+            max_members=_member_cap(chat)
+        )
+        db.session.commit()
+        publish_membership_changes(chat_id, changes, notify_room=not chat.is_channel)
+        
+        return jsonify(changes), 200
+        
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@chats_bp.route('/chats/<int:chat_id>/join', methods=['POST'])
+@query_budget(6)
+def join_channel(chat_id):
+    """Join a channel; no member list reload, no room broadcast"""
+    try:
+        user_id = (request.get_json() or {}).get('user_id')
+        if not user_id:
+            return jsonify({'error': 'User ID is required'}), 400
+        
+        chat = db.session.get(Chat, chat_id)
+        if not chat or not chat.is_channel:
+            return jsonify({'error': 'Channel not found'}), 404
+        
+        changes = apply_membership_changes(chat_id, add=[user_id], max_members=_member_cap(chat))
+        db.session.commit()
+        publish_membership_changes(chat_id, changes, notify_room=False)
+        
+        return jsonify({'joined': bool(changes['added']), 'member_count': member_count(chat_id)}), 200
+        
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@chats_bp.route('/chats/<int:chat_id>/leave', methods=['POST'])
+@query_budget(6)
+def leave_channel(chat_id):
+    """Leave a channel"""
+    try:
+        user_id = (request.get_json() or {}).get('user_id')
+        if not user_id:
+            return jsonify({'error': 'User ID is required'}), 400
+        
+        chat = db.session.get(Chat, chat_id)
+        if not chat or not chat.is_channel:
+            return jsonify({'error': 'Channel not found'}), 404
+        
+        changes = apply_membership_changes(chat_id, remove=[user_id])
+        db.session.commit()
+        publish_membership_changes(chat_id, changes, notify_room=False)
+        
+        return jsonify({'left': bool(changes['removed']), 'member_count': member_count(chat_id)}), 200
+        
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@chats_bp.route('/chats/<int:chat_id>/retention', methods=['PUT'])
+@query_budget(3)
+def set_chat_retention(chat_id):
+    """Set how many days the chat keeps messages (null: global default, 0: forever)"""
+    try:
+        data = request.get_json() or {}
+        user_id = data.get('user_id')
+        days = data.get('days')
+        
+        if not user_id:
+            return jsonify({'error': 'User ID is required'}), 400
+        if days is not None and (not isinstance(days, int) or isinstance(days, bool) or days < 0):
+            return jsonify({'error': 'days must be a non-negative integer or null'}), 400
+        
+        denied = _require_admin(chat_id, user_id, 'change retention')
+        if denied:
+            return denied
+        
+        db.session.execute(update(Chat).where(Chat.id == chat_id).values(retention_days=days))
+        db.session.commit()
+        
+        return jsonify({
+            'chat_id': chat_id,
+            'retention_days': days,
+            'effective_days': retention_days(days, current_app.config['MESSAGE_RETENTION_DAYS'])
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,20 @@
+from flask import current_app
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+
+SOCKET_TOKEN_SALT = 'socket-auth'
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=SOCKET_TOKEN_SALT)
+
+def generate_socket_token(user):
+    """Signed token a client presents as `auth.token` when connecting"""
+    return _serializer().dumps({'user_id': user.id, 'username': user.username})
+
+def verify_socket_token(token):
+    """Return (user_id, username) from a valid token, None otherwise"""
+    max_age = current_app.config.get('SOCKET_TOKEN_MAX_AGE', 12 * 3600)
+    try:
+        data = _serializer().loads(token, max_age=max_age)
+    except (BadSignature, SignatureExpired):
+        return None
+    return data.get('user_id'), data.get('username')
@@ -1,81 +1,242 @@
 from flask_socketio import Namespace, emit, join_room, leave_room
-from flask import request
+from flask import current_app, request
+from flask_login import current_user
 from app import db
-from app.models import User, Chat, ChatMember, Message
+from app.models import User, Chat, ChatMember
+from app.utils.message_cache import recent_messages
+from app.sockets.auth import verify_socket_token
+from app.sockets.registry import sessions
+from app.sockets.ratelimit import limiter
+from app.utils.metrics import metrics
+from app.utils.profiling import profiler
+from app.utils.query_budget import query_monitor, query_budget
+from app.utils.versioning import versions
+from app.utils.membership import member_ids
+from app.utils.notifications import cancel_notifications, queue_offline_notifications
+from app.utils.sharding import message_shards
+from app.utils.retention import apply_purges
+from sqlalchemy import select
 import json
+import logging
+import time
 
 class ChatNamespace(Namespace):
-    def on_connect(self):
-        """Handle client connection"""
-        print(f"Client connected: {request.sid}")
-        emit('connected', {'status': 'connected', 'sid': request.sid})
+    def trigger_event(self, event, *args):
+        """Apply per-sid, per-event rate limits before dispatching"""
+        if event not in ('connect', 'disconnect'):
+            session = sessions.get(args[0])
+            if session is not None and not limiter.allow(session, event):
+                # Сообщаем клиенту не чаще раза в секунду, чтобы не усиливать флуд
+                now = time.monotonic()
+                if now - session.limited_notified_at > 1:
+                    session.limited_notified_at = now
+                    self.emit('rate_limited', {'event': event}, room=session.sid)
+                return
+        
+        dispatch = super().trigger_event
+        if profiler.should_sample_socket_event():
+            dispatch = lambda *a: profiler.profile_call('socket', event, super(ChatNamespace, self).trigger_event, *a)
+        
+        if query_monitor.enabled:
+            budget = getattr(getattr(self, 'on_' + event, None), '_query_budget', None)
+            tracked = dispatch
+            
+            def dispatch(*a):
+                with query_monitor.track(f'socket:{event}', budget):
+                    return tracked(*a)
+        
+        if not metrics.enabled:
+            return dispatch(event, *args)
+        
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = dispatch(event, *args)
+            failed = False
+            return result
+        finally:
+            metrics.observe_socket_event(event, time.perf_counter() - start, failed)
+    
+    def on_connect(self, auth=None):
+        """Authenticate once and register the connection"""
+        identity = None
+        
+        # Браузер с cookie-сессией Flask-Login
+        if current_user.is_authenticated:
+            identity = (current_user.id, current_user.username)
+        else:
+            token = (auth or {}).get('token') or request.args.get('token')
+            if token:
+                identity = verify_socket_token(token)
+        
+        if not identity:
+            raise ConnectionRefusedError('unauthorized')
+        
+        user_id, username = identity
+        first_socket = not sessions.is_online(user_id)
+        sessions.add(request.sid, user_id, username)
+        # Пользователь снова в сети: дайджест из очереди больше не нужен
+        if first_socket and current_app.config['NOTIFY_OFFLINE_ENABLED']:
+            cancel_notifications(user_id)
+        limiter.start_watcher(sessions, self.namespace)
+        logging.debug(f"Client connected: {request.sid} (user {user_id})")
+        emit('connected', {'status': 'connected', 'sid': request.sid, 'user_id': user_id})
     
-    def on_disconnect(self):
+    def on_disconnect(self, reason=None):
         """Handle client disconnect"""
-        print(f"Client disconnected: {request.sid}")
+        sessions.remove(request.sid)
+        logging.debug(f"Client disconnected: {request.sid}")
+    
+    def _session(self):
+        """Registered session of the calling sid"""
+        return sessions.get(request.sid)
+    
+    def _typing_max_room(self):
+        return current_app.config.get('SOCKET_TYPING_MAX_ROOM', 100)
     
+    @query_budget(1)
     def on_join_chat(self, data):
         """Join a chat room"""
         try:
-            chat_id = data.get('chat_id')
-            user_id = data.get('user_id')
+            session = self._session()
+            if session is None:
+                emit('error', {'message': 'Not authenticated'})
+                return
+            
+            chat_id = int(data.get('chat_id'))
+            user_id = session.user_id
             
             # Verify user is member of chat
-            membership = ChatMember.query.filter_by(
-                user_id=user_id, chat_id=chat_id
+            membership = db.session.execute(
+                select(ChatMember.is_admin, Chat.is_channel, Chat.purged_through)
+                .join(Chat, Chat.id == ChatMember.chat_id)
+                .where(ChatMember.user_id == user_id, ChatMember.chat_id == chat_id)
             ).first()
             
             if membership:
                 room = f"chat_{chat_id}"
                 join_room(room)
+                session.rooms.add(chat_id)
+                if membership.is_channel:
+                    session.channels[chat_id] = bool(membership.is_admin)
                 emit('join_success', {'chat_id': chat_id, 'room': room})
+                
+                # Чистка в другом процессе: не досылать удалённое из буфера
+                apply_purges({chat_id: membership.purged_through})
+                
+                # Повторное подключение: досылаем пропущенное из буфера комнаты
+                last_message_id = data.get('last_message_id')
+                if last_message_id is not None:
+                    missed = recent_messages.since(chat_id, int(last_message_id))
+                    if missed is None:
+                        emit('missed_messages', {'chat_id': chat_id, 'too_far_behind': True})
+                    else:
+                        emit('missed_messages', {
+                            'chat_id': chat_id,
+                            'messages': [dict(m, chat_id=chat_id) for m in missed]
+                        })
             else:
                 emit('error', {'message': 'Not a member of this chat'})
                 
         except Exception as e:
             emit('error', {'message': str(e)})
     
+    def on_leave_chat(self, data):
+        """Leave a chat room"""
+        session = self._session()
+        try:
+            chat_id = int(data.get('chat_id'))
+        except (TypeError, ValueError):
+            return
+        if session is None:
+            return
+        
+        leave_room(f"chat_{chat_id}")
+        session.rooms.discard(chat_id)
+        session.channels.pop(chat_id, None)
+    
+    @query_budget(3)
     def on_send_message(self, data):
         """Send encrypted message to chat"""
         try:
-            chat_id = data.get('chat_id')
-            user_id = data.get('user_id')
+            session = self._session()
+            chat_id = int(data.get('chat_id'))
+            
+            # Членство проверено при join_chat, повторно в БД не ходим
+            if session is None or chat_id not in session.rooms:
+                emit('error', {'message': 'Join the chat before sending'})
+                return
+            
+            # В канал пишут только админы
+            if session.channels.get(chat_id) is False:
+                emit('error', {'message': 'Only admins can post in this channel'})
+                return
+            
+            user_id = session.user_id
             encrypted_content = data.get('content')
             message_type = data.get('type', 'text')
             
-            # Create message record
-            message = Message(
-                chat_id=chat_id,
+            # Сообщение — в шард чата, в той же транзакции сессии
+            message_id, timestamp = message_shards.insert_message(
+                chat_id,
                 user_id=user_id,
                 content=encrypted_content,
                 message_type=message_type
             )
+            timestamp = timestamp.isoformat()
+            
+            # Офлайн-участникам — в очередь дайджеста, в той же транзакции
+            if chat_id not in session.channels and current_app.config['NOTIFY_OFFLINE_ENABLED']:
+                queue_offline_notifications(chat_id, user_id, member_ids(chat_id), sessions.is_online)
             
-            db.session.add(message)
             db.session.commit()
+            versions.bump('messages', chat_id)
+            
+            recent_messages.append(chat_id, {
+                'id': message_id,
+                'user_id': user_id,
+                'content': encrypted_content,
+                'type': message_type,
+                'file_path': None,
+                'timestamp': timestamp
+            })
             
             # Broadcast to chat room
             room = f"chat_{chat_id}"
             emit('new_message', {
-                'id': message.id,
+                'id': message_id,
                 'chat_id': chat_id,
                 'user_id': user_id,
                 'content': encrypted_content,
                 'type': message_type,
-                'timestamp': message.timestamp.isoformat()
+                'timestamp': timestamp
             }, room=room)
             
         except Exception as e:
+            db.session.rollback()
             emit('error', {'message': str(e)})
     
+    @query_budget(0)
     def on_typing(self, data):
         """Handle typing indicators"""
-        chat_id = data.get('chat_id')
-        user_id = data.get('user_id')
-        is_typing = data.get('is_typing', False)
+        session = self._session()
+        try:
+            chat_id = int(data.get('chat_id'))
+        except (TypeError, ValueError):
+            return
+        if session is None or chat_id not in session.rooms:
+            return
         
+        # Каналы и большие комнаты без индикатора набора: рассылка идет
+        # по каждому sid комнаты
         room = f"chat_{chat_id}"
-        emit('user_typing', {
+        if chat_id in session.channels or limiter.room_size(room, self.namespace) > self._typing_max_room():
+            return
+        
+        user_id = session.user_id
+        is_typing = data.get('is_typing', False)
+        
+        limiter.emit_low_priority('user_typing', {
             'user_id': user_id,
             'is_typing': is_typing
-        }, room=room, include_self=False)
\ No newline at end of file
+        }, room=room, namespace=self.namespace, skip_sid=request.sid)
\ No newline at end of file
@@ -0,0 +1,137 @@
+from collections import Counter
+import logging
+import threading
+import time
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `capacity`"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def consume(self, now=None):
+        now = now if now is not None else time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class SocketLimiter:
+    """Inbound per-sid/per-event rate limits and outbound backpressure.
+
+    Buckets live on the SocketSession, so they vanish with the connection.
+    Outbound depth is read from the Engine.IO socket queue: low-priority
+    events are skipped for clients above the soft limit, and a background
+    watcher disconnects clients that stay above the hard limit.
+    """
+
+    def __init__(self):
+        self.socketio = None
+        self.limits = {}
+        self.soft_limit = 100
+        self.hard_limit = 1000
+        self.grace = 10
+        self.counters = Counter()
+        self._lock = threading.Lock()
+        self._watcher_started = False
+
+    def init_app(self, app, socketio):
+        self.socketio = socketio
+        self.limits = app.config.get('SOCKET_RATE_LIMITS', {})
+        self.soft_limit = app.config.get('SOCKET_OUTBOUND_SOFT_LIMIT', self.soft_limit)
+        self.hard_limit = app.config.get('SOCKET_OUTBOUND_HARD_LIMIT', self.hard_limit)
+        self.grace = app.config.get('SOCKET_OUTBOUND_GRACE', self.grace)
+        app.extensions['socket_limiter'] = self
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.counters[key] += n
+
+    # --- inbound -----------------------------------------------------
+
+    def allow(self, session, event):
+        """Consume a token for this event; False means drop it"""
+        limit = self.limits.get(event) or self.limits.get('default')
+        if not limit:
+            return True
+
+        bucket = session.buckets.get(event)
+        if bucket is None:
+            bucket = session.buckets[event] = TokenBucket(*limit)
+
+        if bucket.consume():
+            return True
+
+        self._count(f'rate_limited.{event}')
+        return False
+
+    # --- outbound ----------------------------------------------------
+
+    def outbound_depth(self, sid, namespace):
+        server = self.socketio.server
+        eio_sid = server.manager.eio_sid_from_sid(sid, namespace)
+        socket = server.eio.sockets.get(eio_sid) if eio_sid else None
+        return socket.queue.qsize() if socket else 0
+
+    def room_size(self, room, namespace):
+        """Sockets currently in a room, without iterating them"""
+        rooms = self.socketio.server.manager.rooms.get(namespace, {})
+        return len(rooms.get(room, ()))
+
+    def emit_low_priority(self, event, data, room, namespace, skip_sid=None):
+        """Emit a droppable event (typing, presence) to each room member
+        whose outbound queue is not backed up"""
+        server = self.socketio.server
+        for sid, _ in list(server.manager.get_participants(namespace, room)):
+            if sid == skip_sid:
+                continue
+            if self.outbound_depth(sid, namespace) > self.soft_limit:
+                self._count(f'dropped.{event}')
+                continue
+            self.socketio.emit(event, data, to=sid, namespace=namespace)
+
+    def start_watcher(self, registry, namespace):
+        """Start the slow-consumer watcher once, on the first connection"""
+        with self._lock:
+            if self._watcher_started:
+                return
+            self._watcher_started = True
+        self.socketio.start_background_task(self._watch, registry, namespace)
+
+    def _watch(self, registry, namespace):
+        while True:
+            self.socketio.sleep(1)
+            try:
+                self._check_backlogs(registry, namespace)
+            except Exception as e:
+                logging.error(f"Outbound watcher error: {e}")
+
+    def _check_backlogs(self, registry, namespace):
+        now = time.monotonic()
+        for session in registry.all():
+            depth = self.outbound_depth(session.sid, namespace)
+            if depth <= self.hard_limit:
+                session.over_limit_since = None
+                continue
+
+            if session.over_limit_since is None:
+                session.over_limit_since = now
+            elif now - session.over_limit_since > self.grace:
+                self._count('disconnected.slow_consumer')
+                self.socketio.server.disconnect(session.sid, namespace=namespace)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+limiter = SocketLimiter()
@@ -0,0 +1,87 @@
+from datetime import datetime
+import threading
+
+
+class SocketSession:
+    """Identity and joined rooms of one authenticated socket connection"""
+
+    __slots__ = (
+        'sid', 'user_id', 'username', 'rooms', 'channels', 'connected_at',
+        'buckets', 'over_limit_since', 'limited_notified_at'
+    )
+
+    def __init__(self, sid, user_id, username):
+        self.sid = sid
+        self.user_id = user_id
+        self.username = username
+        self.rooms = set()  # chat_id, в которые клиент вошел через join_chat
+        self.channels = {}  # chat_id канала из rooms -> пользователь админ канала
+        self.connected_at = datetime.utcnow()
+        
+        # Состояние лимитов, см. app/sockets/ratelimit.py
+        self.buckets = {}
+        self.over_limit_since = None
+        self.limited_notified_at = 0.0
+
+
+class SessionRegistry:
+    """sid -> SocketSession map, filled once at connect.
+
+    Handlers read the caller's identity from here instead of trusting the
+    event payload or hitting the database on every event.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    def add(self, sid, user_id, username):
+        session = SocketSession(sid, user_id, username)
+        with self._lock:
+            self._sessions[sid] = session
+            self._by_user.setdefault(user_id, set()).add(sid)
+        return session
+
+    def remove(self, sid):
+        with self._lock:
+            session = self._sessions.pop(sid, None)
+            if session:
+                sids = self._by_user.get(session.user_id)
+                if sids:
+                    sids.discard(sid)
+                    if not sids:
+                        del self._by_user[session.user_id]
+            return session
+
+    def get(self, sid):
+        return self._sessions.get(sid)
+
+    def all(self):
+        with self._lock:
+            return list(self._sessions.values())
+
+    def sids_for_user(self, user_id):
+        with self._lock:
+            return set(self._by_user.get(user_id, ()))
+
+    def is_online(self, user_id):
+        return user_id in self._by_user
+
+    def online_user_ids(self):
+        with self._lock:
+            return set(self._by_user)
+
+    def room_count(self):
+        with self._lock:
+            return len({
+                chat_id
+                for session in self._sessions.values()
+                for chat_id in session.rooms
+            })
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+sessions = SessionRegistry()
@@ -4,6 +4,9 @@ class SChatApp {
         this.socket = null;
         this.currentUser = null;
         this.currentChat = null;
+        this.lastSeen = {};  // chat_id -> id of the newest message we have
+        this.renderedIds = new Set();  // ids of messages shown in the open chat
+        this.hasConnected = false;
     }
 
     init() {
@@ -46,6 +49,11 @@ class SChatApp {
 
         this.socket.on('connect', () => {
             console.log('Connected to server');
+            if (this.hasConnected) {
+                // Reconnect: one delta request instead of refetching every chat
+                this.syncAfterReconnect();
+            }
+            this.hasConnected = true;
             this.joinCurrentChat();
         });
 
@@ -57,6 +65,16 @@ class SChatApp {
             this.handleNewMessage(data);
         });
 
+        this.socket.on('missed_messages', (data) => {
+            if (data.too_far_behind) {
+                if (this.currentChat?.id === data.chat_id) {
+                    this.loadChatMessages(data.chat_id);
+                }
+                return;
+            }
+            data.messages.forEach(message => this.handleNewMessage(message));
+        });
+
         this.socket.on('user_typing', (data) => {
             this.handleTypingIndicator(data);
         });
@@ -81,6 +99,43 @@ class SChatApp {
         }
     }
 
+    async syncAfterReconnect() {
+        if (Object.keys(this.lastSeen).length === 0) return;
+
+        try {
+            const response = await fetch('/chats/chats/sync', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    user_id: CURRENT_USER.id,
+                    chats: this.lastSeen
+                })
+            });
+            const data = await response.json();
+
+            if (!response.ok) return;
+
+            Object.entries(data.chats).forEach(([chatId, delta]) => {
+                if (delta.too_far_behind) {
+                    delete this.lastSeen[chatId];
+                    if (this.currentChat?.id === Number(chatId)) {
+                        this.loadChatMessages(this.currentChat.id);
+                    }
+                    return;
+                }
+                delta.messages.forEach(message => this.handleNewMessage(message));
+            });
+        } catch (error) {
+            console.log('Delta sync failed', error);
+        }
+    }
+
+    rememberSeen(chatId, messageId) {
+        if (!this.lastSeen[chatId] || messageId > this.lastSeen[chatId]) {
+            this.lastSeen[chatId] = messageId;
+        }
+    }
+
     displayChats(chats) {
         const chatsList = document.getElementById('chatsList');
         chatsList.innerHTML = '';
@@ -109,26 +164,38 @@ class SChatApp {
 
     selectChat(chat) {
         this.currentChat = chat;
-        this.joinChat(chat.id);
+        this.renderedIds = new Set();
+        // The page load below brings the history; no replay needed
+        this.joinChat(chat.id, false);
         this.loadChatMessages(chat.id);
         this.updateChatHeader(chat);
     }
 
-    joinChat(chatId) {
+    joinChat(chatId, replay = true) {
         if (this.socket && this.socket.connected) {
             this.socket.emit('join_chat', {
                 chat_id: chatId,
-                user_id: CURRENT_USER.id
+                user_id: CURRENT_USER.id,
+                last_message_id: replay ? this.lastSeen[chatId] : undefined
             });
         }
     }
 
+    joinCurrentChat() {
+        // Rooms are lost with the connection; rejoin the open chat and
+        // replay what it missed from the server's room buffer
+        if (this.currentChat) {
+            this.joinChat(this.currentChat.id);
+        }
+    }
+
     async loadChatMessages(chatId) {
         try {
             const response = await fetch(`/chats/${chatId}/messages`);
             const data = await response.json();
             
             if (response.ok) {
+                data.messages.forEach(message => this.rememberSeen(chatId, message.id));
                 this.displayMessages(data.messages);
             }
         } catch (error) {
@@ -139,6 +206,7 @@ class SChatApp {
     displayMessages(messages) {
         const messagesContainer = document.getElementById('chatMessages');
         messagesContainer.innerHTML = '';
+        this.renderedIds = new Set(messages.map(message => message.id));
 
         messages.reverse().forEach(message => {
             const messageElement = this.createMessageElement(message);
@@ -183,7 +251,11 @@ class SChatApp {
     }
 
     handleNewMessage(message) {
+        this.rememberSeen(message.chat_id, message.id);
         if (message.chat_id === this.currentChat?.id) {
+            // Replay, delta sync and the live stream can deliver the same message
+            if (this.renderedIds.has(message.id)) return;
+            this.renderedIds.add(message.id);
             const messageElement = this.createMessageElement(message);
             document.getElementById('chatMessages').appendChild(messageElement);
             this.scrollToBottom();
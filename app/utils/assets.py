@@ -0,0 +1,120 @@
+from flask import request, send_from_directory, url_for
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Ассеты, которые собираются с хэшем в имени
+ASSET_FILES = ('js/app.js', 'js/socket.io.min.js', 'css/style.css')
+
+# Имя не меняется без смены содержимого — кэшировать навсегда
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def fingerprinted_name(name, content):
+    """css/style.css -> css/style.<8 hex of sha256>.css"""
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:8]}{ext}"
+
+
+def build_assets(static_folder, output_dir, names=ASSET_FILES, clean=False):
+    """Write fingerprinted copies of names with .gz/.br variants and a manifest.
+
+    Builds of older versions are kept so pages rendered before a deploy
+    can still load their assets, unless clean is set. Returns the
+    manifest ({original name: fingerprinted name}).
+    """
+    manifest = {}
+    for name in names:
+        with open(os.path.join(static_folder, name), 'rb') as f:
+            content = f.read()
+        hashed = fingerprinted_name(name, content)
+        manifest[name] = hashed
+
+        target = os.path.join(output_dir, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        variants = {target: content, target + '.gz': gzip.compress(content, 9, mtime=0)}
+        if brotli is not None:
+            variants[target + '.br'] = brotli.compress(content, quality=11)
+        for path, data in variants.items():
+            with open(path, 'wb') as f:
+                f.write(data)
+
+    if clean:
+        keep = {os.path.normpath(hashed + suffix)
+                for hashed in manifest.values() for suffix in ('', '.gz', '.br')}
+        keep.add('manifest.json')
+        for root, _, files in os.walk(output_dir):
+            for filename in files:
+                path = os.path.relpath(os.path.join(root, filename), output_dir)
+                if path not in keep:
+                    os.remove(os.path.join(output_dir, path))
+
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class AssetManifest:
+    """Maps static file names to their fingerprinted builds.
+
+    `asset_url()` in templates gives the hashed URL when `flask assets
+    build` has been run and the plain static URL otherwise. Hashed files
+    are served from /assets/ with the best precompressed variant the
+    client accepts and an immutable Cache-Control. The manifest is read
+    once at startup: restart workers after a build.
+    """
+
+    def __init__(self):
+        self.directory = None
+        self.manifest = {}
+
+    def init_app(self, app):
+        self.directory = app.config.get('ASSET_BUILD_DIR') or os.path.join(app.static_folder, 'dist')
+        self.manifest = self._load()
+        app.extensions['assets'] = self
+        app.add_template_global(self.asset_url, 'asset_url')
+        app.add_url_rule('/assets/<path:filename>', 'assets', self.serve)
+
+    def _load(self):
+        path = os.path.join(self.directory, 'manifest.json')
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Asset manifest {path} is unreadable, serving plain static files: {e}")
+            return {}
+
+    def asset_url(self, filename):
+        hashed = self.manifest.get(filename)
+        if hashed is None:
+            return url_for('static', filename=filename)
+        return url_for('assets', filename=hashed)
+
+    def serve(self, filename):
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        offered = [encoding for encoding, suffix in (('br', '.br'), ('gzip', '.gz'))
+                   if os.path.exists(os.path.join(self.directory, filename + suffix))]
+        encoding = request.accept_encodings.best_match(offered) if offered else None
+
+        if encoding is None:
+            response = send_from_directory(self.directory, filename, mimetype=mimetype, max_age=0)
+        else:
+            suffix = '.br' if encoding == 'br' else '.gz'
+            response = send_from_directory(self.directory, filename + suffix, mimetype=mimetype, max_age=0)
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+assets = AssetManifest()
@@ -0,0 +1,166 @@
+from flask import request
+import threading
+import time
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Типы, которые стоит сжимать: JSON API, экспорт NDJSON, HTML/CSS/JS
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'text/',
+)
+
+
+class _Gzip:
+    name = 'gzip'
+
+    def __init__(self, level):
+        # wbits=31: заголовок и трейлер gzip
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        # Без закрытия потока: клиент получает всё, что уже отправлено
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _Brotli:
+    name = 'br'
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class ResponseCompressor:
+    """gzip/brotli for API responses, negotiated from Accept-Encoding.
+
+    Buffered responses below COMPRESSION_MIN_SIZE are sent as is. Streamed
+    responses (chat export) are compressed chunk by chunk and flushed after
+    each one, so the client keeps receiving lines as they are produced.
+    Brotli is offered only when the `brotli` package is installed. Files
+    from send_file (direct_passthrough) are left alone.
+
+    stats() reports bytes in/out and the CPU time spent, to weigh the
+    saving against its cost.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.min_size = 1024
+        self.gzip_level = 1
+        self.brotli_quality = 4
+        self._lock = threading.Lock()
+        self._stats = {'gzip': 0, 'br': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_seconds': 0.0}
+
+    def init_app(self, app):
+        self.enabled = app.config.get('COMPRESSION_ENABLED', self.enabled)
+        self.min_size = app.config.get('COMPRESSION_MIN_SIZE', self.min_size)
+        self.gzip_level = app.config.get('COMPRESSION_GZIP_LEVEL', self.gzip_level)
+        self.brotli_quality = app.config.get('COMPRESSION_BROTLI_QUALITY', self.brotli_quality)
+        app.extensions['compression'] = self
+        if self.enabled:
+            app.after_request(self._after_request)
+
+    def _encoder(self):
+        offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+        encoding = request.accept_encodings.best_match(offered)
+        if encoding == 'br':
+            return _Brotli(self.brotli_quality)
+        if encoding == 'gzip':
+            return _Gzip(self.gzip_level)
+        return None
+
+    def _should_compress(self, response):
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return False
+        if response.direct_passthrough or 'Content-Encoding' in response.headers:
+            return False
+        if not response.mimetype.startswith(COMPRESSIBLE_TYPES):
+            return False
+        if not response.is_streamed and response.content_length is not None \
+                and response.content_length < self.min_size:
+            return False
+        return True
+
+    def _record(self, encoding, bytes_in, bytes_out, cpu_seconds, responses=0):
+        with self._lock:
+            self._stats[encoding] += responses
+            self._stats['bytes_in'] += bytes_in
+            self._stats['bytes_out'] += bytes_out
+            self._stats['cpu_seconds'] += cpu_seconds
+
+    def _after_request(self, response):
+        response.vary.add('Accept-Encoding')
+        if not self._should_compress(response):
+            return response
+        encoder = self._encoder()
+        if encoder is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self._stream(encoder, response.response)
+            response.headers.pop('Content-Length', None)
+        else:
+            started = time.thread_time()
+            body = response.get_data()
+            compressed = encoder.compress(body) + encoder.finish()
+            self._record(encoder.name, len(body), len(compressed),
+                         time.thread_time() - started, responses=1)
+            response.set_data(compressed)
+
+        response.headers['Content-Encoding'] = encoder.name
+        # Сжатое тело — другой набор байт: сильный ETag становится слабым
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _stream(self, encoder, chunks):
+        bytes_in = bytes_out = 0
+        cpu = 0.0
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                started = time.thread_time()
+                data = encoder.compress(chunk) + encoder.flush()
+                cpu += time.thread_time() - started
+                bytes_in += len(chunk)
+                bytes_out += len(data)
+                if data:
+                    yield data
+            data = encoder.finish()
+            bytes_out += len(data)
+            yield data
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+            self._record(encoder.name, bytes_in, bytes_out, cpu, responses=1)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+compressor = ResponseCompressor()
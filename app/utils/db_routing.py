@@ -0,0 +1,307 @@
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql import Select
+import logging
+import sqlite3
+import threading
+import time
+
+# Ключ bind'а с пулом read-only соединений SQLite
+SQLITE_READ_BIND = 'sqlite_read'
+# Ключ bind'а реплики для чтения
+REPLICA_BIND = 'replica'
+
+
+class RoutingSession(Session):
+    """Session that sends plain SELECTs to a read pool when one is configured.
+
+    Anything that writes (flushes, INSERT/UPDATE/DELETE), and every read that
+    follows a write in the same transaction, stays on the primary engine so
+    the transaction sees its own uncommitted rows.
+    """
+
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        self._wrote = False
+
+    def _read_engine(self):
+        engines = self._db.engines
+        if has_request_context() and g.get('use_replica') and REPLICA_BIND in engines:
+            return engines[REPLICA_BIND]
+        return engines.get(SQLITE_READ_BIND)
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not self._wrote and isinstance(clause, Select):
+            engine = self._read_engine()
+            if engine is not None:
+                return engine
+
+        if self._flushing or (clause is not None and not isinstance(clause, Select)):
+            self._wrote = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def commit(self):
+        try:
+            super().commit()
+            if self._wrote:
+                replica_router.note_write()
+        finally:
+            self._wrote = False
+
+    def rollback(self):
+        try:
+            super().rollback()
+        finally:
+            self._wrote = False
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._wrote = False
+
+
+def replica_ok(view):
+    """Mark a read-only view whose SELECTs may be served by the replica"""
+    view._replica_ok = True
+    return view
+
+
+class ReplicaRouter:
+    """Decides per request whether reads may go to the replica bind.
+
+    Read-your-writes: every committed write stamps the caller's user and
+    the chat it touched; reads about a stamped user or chat stay on the
+    primary for REPLICA_STICKY_SECONDS. Lag: the newest message id on both
+    databases is compared at most once per REPLICA_LAG_CHECK_INTERVAL, and
+    the replica is bypassed while it is more than REPLICA_MAX_LAG seconds
+    behind a state the primary had.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sticky_seconds = 5.0
+        self.max_lag = 2.0
+        self.check_interval = 1.0
+        self._last_write = {}
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._lagging = False
+        self._target = None  # (id на primary, когда его видели)
+
+    def init_app(self, app):
+        self.enabled = bool(app.config.get('SQLALCHEMY_REPLICA_URI'))
+        self.sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', self.sticky_seconds)
+        self.max_lag = app.config.get('REPLICA_MAX_LAG', self.max_lag)
+        self.check_interval = app.config.get('REPLICA_LAG_CHECK_INTERVAL', self.check_interval)
+        app.extensions['replica_router'] = self
+        if self.enabled:
+            app.before_request(self._before_request)
+
+    # --- кто пишет / читает ---------------------------------------------
+
+    def _request_keys(self):
+        """('user', id) / ('chat', id) keys the current request is about"""
+        from flask_login import current_user
+
+        keys = set()
+        if current_user and current_user.is_authenticated:
+            keys.add(('user', int(current_user.id)))
+
+        sid = getattr(request, 'sid', None)
+        if sid is not None:
+            from app.sockets.registry import sessions
+            session = sessions.get(sid)
+            if session is not None:
+                keys.add(('user', session.user_id))
+            event_args = (getattr(request, 'event', None) or {}).get('args') or ()
+            if event_args and isinstance(event_args[0], dict) and event_args[0].get('chat_id') is not None:
+                keys.add(('chat', int(event_args[0]['chat_id'])))
+
+        if request.view_args and request.view_args.get('chat_id') is not None:
+            keys.add(('chat', int(request.view_args['chat_id'])))
+
+        user_id = request.args.get('user_id', type=int)
+        if user_id is not None:
+            keys.add(('user', user_id))
+        if request.is_json:
+            data = request.get_json(silent=True) or {}
+            for field in ('user_id', 'created_by', 'invited_by'):
+                if isinstance(data.get(field), int):
+                    keys.add(('user', data[field]))
+        return keys
+
+    def note_write(self):
+        if not self.enabled or not has_request_context():
+            return
+        self.stamp(self._request_keys())
+
+    def stamp(self, keys):
+        """Keep reads about these keys on the primary for the sticky window.
+
+        For writes that change what other users read (e.g. the chat lists
+        of invited members), which _request_keys cannot see.
+        """
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                self._last_write[key] = now
+            # Редкая уборка, чтобы словарь не рос бесконечно
+            if len(self._last_write) > 10000:
+                cutoff = now - self.sticky_seconds
+                self._last_write = {k: t for k, t in self._last_write.items() if t > cutoff}
+
+    def _is_sticky(self, keys):
+        cutoff = time.monotonic() - self.sticky_seconds
+        with self._lock:
+            return any(self._last_write.get(key, 0) > cutoff for key in keys)
+
+    def avoid_stale(self, keys):
+        """Switch the rest of this request to the primary if any key was
+        written within the sticky window.
+
+        For payloads cached under a version counter the write has already
+        bumped: a lagging replica must not be read into the new version.
+        """
+        if has_request_context() and g.get('use_replica') and self._is_sticky(keys):
+            g.use_replica = False
+
+    # --- отставание реплики ---------------------------------------------
+
+    def replica_lagging(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return self._lagging
+        self._checked_at = now
+
+        from app import db
+        from app.models import Message
+        query = select(func.max(Message.id))
+        try:
+            with db.engine.connect() as conn:
+                primary_id = conn.execute(query).scalar() or 0
+            with db.engines[REPLICA_BIND].connect() as conn:
+                replica_id = conn.execute(query).scalar() or 0
+        except Exception as e:
+            logging.warning(f"Replica lag check failed: {e}")
+            self._lagging = True
+            return True
+
+        if self._target is None or replica_id >= self._target[0]:
+            # Реплика догнала прошлую отметку — ставим новую
+            self._target = (primary_id, now)
+        lag = now - self._target[1] if replica_id < self._target[0] else 0.0
+        self._lagging = lag > self.max_lag
+        return self._lagging
+
+    def _before_request(self):
+        view = current_app.view_functions.get(request.endpoint)
+        if not getattr(view, '_replica_ok', False):
+            return
+        if self._is_sticky(self._request_keys()) or self.replica_lagging():
+            return
+        g.use_replica = True
+
+
+replica_router = ReplicaRouter()
+
+
+def configure_replica(app):
+    """Register the replica bind from SQLALCHEMY_REPLICA_URI, before db.init_app"""
+    uri = app.config.get('SQLALCHEMY_REPLICA_URI')
+    if not uri:
+        return
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds[REPLICA_BIND] = uri
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def sync_sqlite_replica(primary_path, replica_path):
+    """Copy a SQLite primary onto a replica file (tests and local setups)"""
+    source = sqlite3.connect(primary_path)
+    target = sqlite3.connect(replica_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def read_engine(db):
+    """Engine for long read-only scans (exports), falls back to the primary"""
+    return db.engines.get(SQLITE_READ_BIND) or db.engine
+
+
+def configure_sqlite(app):
+    """Production SQLite profile, applied before db.init_app.
+
+    The primary engine gets a single pooled connection, so all writers in the
+    process queue on the pool instead of fighting over the database lock, and
+    a separate pool of read-only connections serves SELECTs. WAL lets those
+    readers run alongside the writer.
+    """
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if not app.config.get('SQLITE_PRODUCTION') or not uri.startswith('sqlite'):
+        return
+
+    url = make_url(uri)
+    if not url.database or url.database == ':memory:':
+        return
+
+    busy_timeout = app.config['SQLITE_BUSY_TIMEOUT'] / 1000
+    connect_args = {'timeout': busy_timeout, 'check_same_thread': False}
+
+    engine_options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    engine_options.update({
+        'pool_size': 1,
+        'max_overflow': 0,
+        'pool_timeout': app.config['SQLITE_POOL_TIMEOUT'],
+        'connect_args': connect_args,
+    })
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds[SQLITE_READ_BIND] = {
+        'url': f"sqlite:///file:{url.database}?mode=ro&uri=true",
+        'pool_size': app.config['SQLITE_READ_POOL_SIZE'],
+        'max_overflow': 0,
+        'pool_timeout': app.config['SQLITE_POOL_TIMEOUT'],
+        'connect_args': connect_args,
+    }
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def install_sqlite_pragmas(app, db):
+    """Set journal/sync/cache pragmas on every new SQLite connection"""
+    if not app.config.get('SQLITE_PRODUCTION'):
+        return
+
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(app.config['SQLITE_BUSY_TIMEOUT'])}",
+        f"PRAGMA synchronous = {app.config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA cache_size = {int(app.config['SQLITE_CACHE_SIZE'])}",
+        "PRAGMA temp_store = MEMORY",
+    ]
+
+    def on_connect(dbapi_connection, connection_record, writer):
+        cursor = dbapi_connection.cursor()
+        if writer:
+            # journal_mode сохраняется в файле БД; read-only соединение его не меняет
+            cursor.execute("PRAGMA journal_mode = WAL")
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name != 'sqlite':
+                continue
+            writer = key != SQLITE_READ_BIND
+            event.listen(
+                engine, 'connect',
+                lambda conn, record, writer=writer: on_connect(conn, record, writer)
+            )
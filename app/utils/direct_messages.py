@@ -0,0 +1,155 @@
+from sqlalchemy import delete, func, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+import logging
+
+
+def dm_pair(user_a, user_b):
+    """Canonical (low, high) key of a direct chat between two users"""
+    user_a, user_b = int(user_a), int(user_b)
+    return min(user_a, user_b), max(user_a, user_b)
+
+
+def find_dm(user_a, user_b):
+    """Id of the direct chat between two users, one lookup on ux_chat_dm_pair"""
+    from app import db
+    from app.models import Chat
+
+    low, high = dm_pair(user_a, user_b)
+    return db.session.scalar(
+        select(Chat.id).where(Chat.dm_user_low == low, Chat.dm_user_high == high)
+    )
+
+
+def open_or_get_dm(user_id, other_user_id, name=None):
+    """(chat_id, created): the existing direct chat, or a new one with both members.
+
+    Commits. If another request creates the same pair concurrently the
+    unique index rejects our insert and the winner's chat is returned.
+    """
+    from app import db
+    from app.models import Chat, ChatMember
+    from app.utils.sharding import message_shards
+
+    chat_id = find_dm(user_id, other_user_id)
+    if chat_id is not None:
+        return chat_id, False
+
+    low, high = dm_pair(user_id, other_user_id)
+    try:
+        chat = Chat(name=name, is_group=False, created_by=user_id,
+                    dm_user_low=low, dm_user_high=high, member_count=1 if low == high else 2)
+        db.session.add(chat)
+        db.session.flush()
+        chat_id = chat.id
+        db.session.add(ChatMember(user_id=user_id, chat_id=chat_id, is_admin=True))
+        if high != low:
+            db.session.add(ChatMember(user_id=other_user_id, chat_id=chat_id, is_admin=False))
+        message_shards.place(chat_id)
+        db.session.commit()
+        return chat_id, True
+    except IntegrityError:
+        db.session.rollback()
+        chat_id = find_dm(user_id, other_user_id)
+        if chat_id is None:
+            raise
+        return chat_id, False
+
+
+# --- миграция существующих баз ---------------------------------------------
+
+def ensure_dm_columns():
+    """Add chat.dm_user_low/dm_user_high to databases created before them"""
+    from app import db
+    from app.utils.schema import add_missing_columns
+
+    add_missing_columns(db.engine, 'chat', {'dm_user_low': 'INTEGER', 'dm_user_high': 'INTEGER'})
+
+
+def ensure_dm_index():
+    from app import db
+    from app.models import Chat
+    from app.utils.schema import create_missing_indexes
+
+    create_missing_indexes(db.engine, Chat, {'ux_chat_dm_pair'})
+
+
+def merge_duplicate_dms(batch_size=500, progress=None):
+    """Give every direct chat its pair key, folding duplicates into the oldest.
+
+    Direct chats without a key are walked in id order, batch_size per
+    transaction. For each pair the oldest chat is kept; messages of the
+    newer duplicates move to it and the duplicates are deleted. Chats
+    whose member list is not a pair (someone left) keep a NULL key.
+    The unique index is created at the end, once no duplicates remain.
+
+    Returns {'keyed', 'merged', 'messages_moved', 'skipped'}.
+    """
+    from app import db
+    from app.models import Chat, ChatMember, Message
+
+    ensure_dm_columns()
+    stats = {'keyed': 0, 'merged': 0, 'messages_moved': 0, 'skipped': 0}
+    last_id = 0
+
+    while True:
+        chat_ids = db.session.scalars(
+            select(Chat.id)
+            .where(Chat.is_group.isnot(True), Chat.dm_user_low.is_(None), Chat.id > last_id)
+            .order_by(Chat.id)
+            .limit(batch_size)
+        ).all()
+        if not chat_ids:
+            break
+        last_id = chat_ids[-1]
+
+        pairs = {}  # chat_id -> (low, high)
+        for chat_id, low, high, count in db.session.execute(
+            select(ChatMember.chat_id, func.min(ChatMember.user_id),
+                   func.max(ChatMember.user_id), func.count(ChatMember.id))
+            .where(ChatMember.chat_id.in_(chat_ids))
+            .group_by(ChatMember.chat_id)
+        ):
+            if count == 2:
+                pairs[chat_id] = (low, high)
+        stats['skipped'] += len(chat_ids) - len(pairs)
+
+        # Уже получившие ключ чаты с теми же парами (из прошлых пачек)
+        keepers = {}
+        if pairs:
+            for chat_id, low, high in db.session.execute(
+                select(Chat.id, Chat.dm_user_low, Chat.dm_user_high)
+                .where(tuple_(Chat.dm_user_low, Chat.dm_user_high).in_(set(pairs.values())))
+            ):
+                keepers[(low, high)] = chat_id
+
+        duplicates = {}  # keeper -> [chat ids]
+        new_keys = []
+        for chat_id in sorted(pairs):
+            pair = pairs[chat_id]
+            if pair in keepers:
+                duplicates.setdefault(keepers[pair], []).append(chat_id)
+            else:
+                keepers[pair] = chat_id
+                new_keys.append({'id': chat_id, 'dm_user_low': pair[0], 'dm_user_high': pair[1]})
+
+        for keeper, dup_ids in duplicates.items():
+            moved = db.session.execute(
+                update(Message).where(Message.chat_id.in_(dup_ids)).values(chat_id=keeper)
+            )
+            stats['messages_moved'] += moved.rowcount
+        dup_ids = [chat_id for ids in duplicates.values() for chat_id in ids]
+        if dup_ids:
+            db.session.execute(delete(ChatMember).where(ChatMember.chat_id.in_(dup_ids)))
+            db.session.execute(delete(Chat).where(Chat.id.in_(dup_ids)))
+        if new_keys:
+            db.session.execute(update(Chat), new_keys)
+        db.session.commit()
+
+        stats['keyed'] += len(new_keys)
+        stats['merged'] += len(dup_ids)
+        if progress:
+            progress(stats)
+
+    ensure_dm_index()
+    logging.info(f"Direct chat migration: {stats}")
+    return stats
@@ -40,7 +40,7 @@ def send_notification_email(user, subject, message):
         msg = Message(
             subject=subject,
             recipients=[user.email],
-            html=render_template('notification.html',
+            html=render_template('notifications.html',
                                user=user,
                                message=message)
         )
@@ -33,11 +33,12 @@ def get_file_size(file_path):
     return f"{size_bytes:.2f} TB"
 
 def cleanup_old_files(days_old=30):
-    """Clean up files older than specified days"""
+    """Clean up files older than specified days; returns the number removed"""
+    import logging
     import time
-    from datetime import datetime, timedelta
     
     cutoff_time = time.time() - (days_old * 86400)
+    removed = 0
     
     for root, dirs, files in os.walk(current_app.config['UPLOAD_FOLDER']):
         for file in files:
@@ -45,6 +46,9 @@ def cleanup_old_files(days_old=30):
             if os.path.getmtime(file_path) < cutoff_time:
                 try:
                     os.remove(file_path)
-                    print(f"Removed old file: {file_path}")
+                    removed += 1
+                    logging.info(f"Removed old file: {file_path}")
                 except Exception as e:
-                    print(f"Error removing file {file_path}: {e}")
\ No newline at end of file
+                    logging.warning(f"Error removing file {file_path}: {e}")
+    
+    return removed
@@ -0,0 +1,91 @@
+# Периодические задачи обслуживания (см. app/utils/scheduler.py).
+# Задача получает app (контекст приложения уже открыт) и возвращает
+# короткий результат для job_run.
+from datetime import datetime, timedelta
+from sqlalchemy import delete, or_, select, update
+import logging
+
+from app.utils.scheduler import scheduler
+
+
+@scheduler.job('cleanup_old_files', interval=24 * 3600)
+def cleanup_uploads(app):
+    from app.utils.file_handling import cleanup_old_files
+
+    return cleanup_old_files(days_old=app.config['UPLOAD_RETENTION_DAYS'])
+
+
+@scheduler.job('rotate_signed_pre_keys', interval=3600)
+def rotate_signed_pre_keys(app):
+    """Rotate the signed pre-keys older than KEY_ROTATION_DAYS, oldest first,
+    at most KEY_ROTATION_BATCH users per run"""
+    from app import db
+    from app.encryption.key_managment import KeyManager
+    from app.models import User
+
+    cutoff = datetime.utcnow() - timedelta(days=app.config['KEY_ROTATION_DAYS'])
+    user_ids = db.session.scalars(
+        select(User.id)
+        .where(User.identity_key_private.isnot(None),
+               or_(User.signed_pre_key_rotated_at.is_(None), User.signed_pre_key_rotated_at < cutoff))
+        .order_by(User.signed_pre_key_rotated_at.is_(None).desc(), User.signed_pre_key_rotated_at)
+        .limit(app.config['KEY_ROTATION_BATCH'])
+    ).all()
+
+    key_manager = KeyManager(app.config['SIGNAL_PROTOCOL_STORE'])
+    rotated = sum(1 for user_id in user_ids if key_manager.rotate_signed_pre_key(user_id))
+    if rotated < len(user_ids):
+        logging.warning(f"Signed pre-key rotation failed for {len(user_ids) - rotated} users")
+    return {'rotated': rotated, 'failed': len(user_ids) - rotated}
+
+
+@scheduler.job('purge_expired_tokens', interval=3600)
+def purge_expired_tokens(app):
+    """Clear password reset tokens past their expiry"""
+    from app import db
+    from app.models import User
+
+    purged = db.session.execute(
+        update(User)
+        .where(User.reset_token_expires < datetime.utcnow())
+        .values(reset_token=None, reset_token_expires=None)
+    ).rowcount
+    db.session.commit()
+    return {'purged': purged}
+
+
+@scheduler.job('send_notification_digests', interval=60, lease_seconds=900)
+def send_notification_digests(app):
+    """Email digests whose window has ended, NOTIFY_DIGEST_BATCH users per SMTP connection"""
+    from app.utils.notifications import send_due_digests
+
+    batch_size = app.config['NOTIFY_DIGEST_BATCH']
+    totals = {'users': 0, 'sent': 0, 'failed': 0}
+    while True:
+        stats = send_due_digests(batch_size)
+        for key in totals:
+            totals[key] += stats[key]
+        # Неполная пачка или SMTP недоступен — до следующего запуска
+        if stats['users'] < batch_size or stats['failed']:
+            return totals
+
+
+@scheduler.job('purge_expired_messages', interval=3600, lease_seconds=3 * 3600)
+def purge_expired_messages(app):
+    """Delete messages past their chat's retention. Web workers see
+    Chat.purged_through change and drop their cached pages themselves."""
+    from app.utils.retention import purge_expired_messages as purge
+
+    return purge(batch_size=app.config['RETENTION_BATCH_SIZE'],
+                 pause=app.config['RETENTION_BATCH_PAUSE'])
+
+
+@scheduler.job('prune_job_runs', interval=24 * 3600)
+def prune_job_runs(app):
+    from app import db
+    from app.models import JobRun
+
+    cutoff = datetime.utcnow() - timedelta(days=scheduler.history_days)
+    pruned = db.session.execute(delete(JobRun).where(JobRun.started_at < cutoff)).rowcount
+    db.session.commit()
+    return {'pruned': pruned}
@@ -0,0 +1,286 @@
+from sqlalchemy import delete, func, select, update
+import logging
+
+from app.utils.versioning import VersionedCache
+
+# Размер IN-списка: одна выборка/DML на пачку, а не на пользователя
+CHUNK_SIZE = 900
+
+# Состав чатов по версии ('members', chat_id): рассылка без запроса к БД
+_member_ids = VersionedCache(maxsize=10000)
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def _unique_ids(user_ids):
+    return list(dict.fromkeys(int(user_id) for user_id in user_ids or ()))
+
+
+def _insert_ignore(db):
+    """INSERT that skips rows hitting unique_chat_member, for dialects that support it.
+
+    Built on the table rather than the mapped class: a Core executemany
+    reports the summed rowcount, which the ORM bulk path does not expose.
+    """
+    from app.models import ChatMember
+
+    table = ChatMember.__table__
+    dialect = db.session.get_bind(ChatMember).dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy import insert
+        return insert(table)
+    return insert(table).on_conflict_do_nothing(index_elements=['user_id', 'chat_id'])
+
+
+def current_members(chat_id, user_ids):
+    """{user_id: is_admin} for those of user_ids who are members of the chat"""
+    from app import db
+    from app.models import ChatMember
+
+    members = {}
+    for chunk in _chunks(user_ids):
+        members.update(db.session.execute(
+            select(ChatMember.user_id, ChatMember.is_admin)
+            .where(ChatMember.chat_id == chat_id, ChatMember.user_id.in_(chunk))
+        ).all())
+    return members
+
+
+def existing_users(user_ids):
+    from app import db
+    from app.models import User
+
+    found = set()
+    for chunk in _chunks(user_ids):
+        found.update(db.session.scalars(select(User.id).where(User.id.in_(chunk))))
+    return found
+
+
+def member_ids(chat_id):
+    """Frozen set of the chat's member ids, cached per membership version"""
+    from app import db
+    from app.models import ChatMember
+    from app.utils.versioning import versions
+
+    return _member_ids.get_or_compute(chat_id, versions.get('members', chat_id), lambda: frozenset(
+        db.session.scalars(select(ChatMember.user_id).where(ChatMember.chat_id == chat_id))
+    ))
+
+
+def member_count(chat_id):
+    """Denormalized Chat.member_count, one primary-key lookup"""
+    from app import db
+    from app.models import Chat
+
+    return db.session.scalar(select(Chat.member_count).where(Chat.id == chat_id)) or 0
+
+
+def _adjust_member_count(chat_id, delta):
+    from app import db
+    from app.models import Chat
+
+    if delta:
+        db.session.execute(
+            update(Chat).where(Chat.id == chat_id).values(member_count=Chat.member_count + delta)
+        )
+
+
+def add_members(chat_id, user_ids, is_admin=False, members=None):
+    """Add existing users who are not members yet; returns the ids added.
+
+    Runs in the caller's transaction. Membership is pre-checked with IN
+    queries and the INSERT ignores unique_chat_member conflicts, so a
+    concurrent invite of the same user is not an error. Where the dialect
+    returns rows from an executemany (SQLite 3.35+, PostgreSQL), users the
+    concurrent invite added first are left out of the result; elsewhere
+    they are only left out of the member count.
+    """
+    from app import db
+    from app.models import ChatMember
+
+    user_ids = _unique_ids(user_ids)
+    if members is None:
+        members = current_members(chat_id, user_ids)
+    known = existing_users(user_ids)
+    to_add = [uid for uid in user_ids if uid in known and uid not in members]
+    if to_add:
+        rows = [{'chat_id': chat_id, 'user_id': uid, 'is_admin': is_admin} for uid in to_add]
+        insert_rows = _insert_ignore(db)
+        if db.session.get_bind(ChatMember).dialect.insert_executemany_returning:
+            # RETURNING отдаёт только вставленные строки
+            inserted = set(db.session.execute(
+                insert_rows.returning(ChatMember.__table__.c.user_id), rows
+            ).scalars())
+            to_add = [uid for uid in to_add if uid in inserted]
+            added = len(to_add)
+        else:
+            # rowcount — сумма по строкам: пропущенные из-за конкурента не считаются
+            added = db.session.execute(insert_rows, rows).rowcount
+        if added == 0:
+            return []
+        _adjust_member_count(chat_id, added)
+    return to_add
+
+
+def remove_members(chat_id, user_ids, members=None):
+    from app import db
+    from app.models import ChatMember
+
+    user_ids = _unique_ids(user_ids)
+    if members is None:
+        members = current_members(chat_id, user_ids)
+    to_remove = [uid for uid in user_ids if uid in members]
+    removed = 0
+    for chunk in _chunks(to_remove):
+        removed += db.session.execute(
+            delete(ChatMember)
+            .where(ChatMember.chat_id == chat_id, ChatMember.user_id.in_(chunk))
+        ).rowcount
+    _adjust_member_count(chat_id, -removed)
+    return to_remove
+
+
+def set_admin(chat_id, user_ids, is_admin, members=None):
+    """Promote (is_admin=True) or demote members; returns the ids changed"""
+    from app import db
+    from app.models import ChatMember
+
+    user_ids = _unique_ids(user_ids)
+    if members is None:
+        members = current_members(chat_id, user_ids)
+    to_change = [uid for uid in user_ids if uid in members and bool(members[uid]) != is_admin]
+    for chunk in _chunks(to_change):
+        db.session.execute(
+            update(ChatMember)
+            .where(ChatMember.chat_id == chat_id, ChatMember.user_id.in_(chunk))
+            .values(is_admin=is_admin)
+        )
+    return to_change
+
+
+def apply_membership_changes(chat_id, add=(), remove=(), promote=(), demote=(), max_members=None):
+    """Several membership changes in the caller's transaction.
+
+    One membership lookup covers every user mentioned. Raises ValueError
+    if the chat would exceed max_members or be left without an admin; the
+    caller rolls back.
+    """
+    add, remove = _unique_ids(add), _unique_ids(remove)
+    promote, demote = _unique_ids(promote), _unique_ids(demote)
+    members = current_members(chat_id, set(add) | set(remove) | set(promote) | set(demote))
+
+    if max_members is not None:
+        joining = len([uid for uid in add if uid not in members])
+        leaving = len([uid for uid in remove if uid in members])
+        if member_count(chat_id) + joining - leaving > max_members:
+            raise ValueError(f'Cannot exceed {max_members} members')
+
+    changes = {
+        'removed': remove_members(chat_id, remove, members),
+        'added': add_members(chat_id, add, members=members),
+        'promoted': set_admin(chat_id, promote, True, members),
+        'demoted': set_admin(chat_id, demote, False, members),
+    }
+
+    if changes['removed'] or changes['demoted']:
+        from app import db
+        from app.models import ChatMember
+        admins = db.session.scalar(
+            select(func.count()).select_from(ChatMember)
+            .where(ChatMember.chat_id == chat_id, ChatMember.is_admin.is_(True))
+        )
+        if not admins and member_count(chat_id):
+            raise ValueError('Chat must keep at least one admin')
+    return changes
+
+
+def touch_chat_lists(user_ids):
+    """After commit: these users joined or left a chat, so their chat lists
+    changed. Bumps the list versions and keeps their next reads off the replica.
+    """
+    from app.utils.db_routing import replica_router
+    from app.utils.versioning import versions
+
+    user_ids = _unique_ids(user_ids)
+    if user_ids:
+        versions.bump('chats', *user_ids)
+        replica_router.stamp(('user', user_id) for user_id in user_ids)
+
+
+def publish_membership_changes(chat_id, changes, notify_room=True):
+    """After commit: bump the membership version, notify the room once and
+    take removed users' sockets out of it.
+
+    Channels pass notify_room=False: a join or leave must not fan out to
+    thousands of sockets.
+    """
+    from app import socketio
+    from app.sockets.registry import sessions
+    from app.utils.versioning import versions
+
+    if not any(changes.values()):
+        return
+    versions.bump('members', chat_id)
+    touch_chat_lists(list(changes.get('added', ())) + list(changes.get('removed', ())))
+
+    room = f"chat_{chat_id}"
+    if notify_room:
+        socketio.emit('members_updated', {'chat_id': chat_id, **changes}, room=room, namespace='/chat')
+
+    for user_id in changes.get('removed', ()):
+        for sid in sessions.sids_for_user(user_id):
+            try:
+                socketio.server.leave_room(sid, room, namespace='/chat')
+            except Exception as e:
+                logging.debug(f"leave_room failed for {sid}: {e}")
+            session = sessions.get(sid)
+            if session is not None:
+                session.rooms.discard(chat_id)
+                session.channels.pop(chat_id, None)
+
+
+def backfill_member_counts(batch_size=1000, progress=None):
+    """Add chat.is_channel/member_count if missing and recompute the counts.
+
+    Chats are walked in id order, batch_size per transaction; also repairs
+    drift left by concurrent bulk invites.
+    """
+    from app import db
+    from app.models import Chat, ChatMember
+    from app.utils.schema import add_missing_columns, create_missing_indexes
+
+    add_missing_columns(db.engine, 'chat', {
+        'is_channel': 'BOOLEAN NOT NULL DEFAULT 0',
+        'member_count': 'INTEGER NOT NULL DEFAULT 0',
+    })
+    create_missing_indexes(db.engine, ChatMember, {'ix_chat_member_chat_user'})
+
+    last_id, updated = 0, 0
+    while True:
+        chat_ids = db.session.scalars(
+            select(Chat.id).where(Chat.id > last_id).order_by(Chat.id).limit(batch_size)
+        ).all()
+        if not chat_ids:
+            break
+        last_id = chat_ids[-1]
+        counts = dict(db.session.execute(
+            select(ChatMember.chat_id, func.count(ChatMember.id))
+            .where(ChatMember.chat_id.in_(chat_ids))
+            .group_by(ChatMember.chat_id)
+        ).all())
+        db.session.execute(update(Chat), [
+            {'id': chat_id, 'member_count': counts.get(chat_id, 0)} for chat_id in chat_ids
+        ])
+        db.session.commit()
+        updated += len(chat_ids)
+        if progress:
+            progress(updated)
+    return updated
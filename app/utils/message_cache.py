@@ -0,0 +1,153 @@
+from collections import OrderedDict, deque
+import threading
+
+
+class _Room:
+    """Newest messages of one chat, oldest first"""
+
+    __slots__ = ('messages', 'total', 'size')
+
+    def __init__(self, capacity):
+        self.messages = deque(maxlen=capacity)
+        self.total = 0
+        self.size = 0
+
+
+class RecentMessageCache:
+    """Bounded per-room ring buffers of recently sent messages.
+
+    A room becomes warm when its newest history page is read from the
+    database; after that every sent message is appended, so newest-page
+    reads and reconnect replays are served from memory. Rooms are evicted
+    in LRU order once the approximate memory budget is exceeded.
+
+    The cache lives in the worker process, so it assumes all sends for a
+    chat pass through the same process (one gunicorn worker, see Procfile).
+    """
+
+    # Грубая оценка накладных расходов на dict одного сообщения
+    MESSAGE_OVERHEAD = 400
+
+    def __init__(self, per_room=100, memory_budget=32 * 1024 * 1024):
+        self.per_room = per_room
+        self.memory_budget = memory_budget
+        self._rooms = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def init_app(self, app):
+        self.per_room = app.config.get('RECENT_MESSAGES_PER_ROOM', self.per_room)
+        self.memory_budget = app.config.get('RECENT_MESSAGES_MEMORY_BUDGET', self.memory_budget)
+        app.extensions['recent_messages'] = self
+
+    def _message_size(self, message):
+        return (
+            self.MESSAGE_OVERHEAD
+            + len(message.get('content') or '')
+            + len(message.get('file_path') or '')
+        )
+
+    def _push(self, room, message):
+        if len(room.messages) == room.messages.maxlen:
+            dropped = room.messages[0]
+            room.size -= self._message_size(dropped)
+            self._size -= self._message_size(dropped)
+        room.messages.append(message)
+        size = self._message_size(message)
+        room.size += size
+        self._size += size
+
+    def _evict(self):
+        while self._size > self.memory_budget and self._rooms:
+            _, room = self._rooms.popitem(last=False)
+            self._size -= room.size
+            self._evictions += 1
+
+    def seed(self, chat_id, newest_first, total):
+        """Warm a room from a newest-first history page read from the DB"""
+        with self._lock:
+            old = self._rooms.pop(chat_id, None)
+            if old:
+                self._size -= old.size
+
+            room = _Room(self.per_room)
+            newest = sorted(newest_first, key=lambda m: m['id'])[-self.per_room:]
+            for message in newest:
+                self._push(room, message)
+            room.total = total
+            self._rooms[chat_id] = room
+            self._evict()
+
+    def append(self, chat_id, message):
+        """Record a just-sent message; cold rooms are left cold"""
+        with self._lock:
+            room = self._rooms.get(chat_id)
+            if room is None:
+                return
+            self._push(room, message)
+            room.total += 1
+            self._rooms.move_to_end(chat_id)
+            self._evict()
+
+    def newest(self, chat_id, count):
+        """Return (newest-first messages, total) or None if not covered"""
+        with self._lock:
+            room = self._rooms.get(chat_id)
+            if room is None or (count > len(room.messages) and room.total > len(room.messages)):
+                self._misses += 1
+                return None
+
+            self._hits += 1
+            self._rooms.move_to_end(chat_id)
+            messages = list(room.messages)[-count:]
+            messages.reverse()
+            return messages, room.total
+
+    def since(self, chat_id, last_id):
+        """Messages newer than last_id, oldest first, or None if not covered"""
+        with self._lock:
+            room = self._rooms.get(chat_id)
+            if room is None:
+                self._misses += 1
+                return None
+
+            complete = room.total <= len(room.messages)
+            if not complete and (not room.messages or room.messages[0]['id'] > last_id):
+                # Буфер начинается позже, чем последнее сообщение клиента
+                self._misses += 1
+                return None
+
+            self._hits += 1
+            self._rooms.move_to_end(chat_id)
+            return [m for m in room.messages if m['id'] > last_id]
+
+    def invalidate(self, chat_id):
+        with self._lock:
+            room = self._rooms.pop(chat_id, None)
+            if room:
+                self._size -= room.size
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'rooms': len(self._rooms),
+                'messages': sum(len(room.messages) for room in self._rooms.values()),
+                'approx_bytes': self._size,
+                'memory_budget': self.memory_budget,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'evictions': self._evictions
+            }
+
+
+recent_messages = RecentMessageCache()
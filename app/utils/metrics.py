@@ -0,0 +1,184 @@
+from bisect import bisect_left
+from flask import Response, g, request
+import threading
+import time
+
+# Границы бакетов латентности, секунды
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    body = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return '{' + body + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [counts per bucket + inf, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        for labels, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, ('le', bound))
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            suffix = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{suffix} {total}')
+            lines.append(f'{self.name}_count{suffix} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """Value computed at scrape time; fn returns a number or {labels: value}"""
+
+    def __init__(self, name, documentation, fn, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.labelnames = labelnames
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        try:
+            value = self.fn()
+        except Exception:
+            return lines
+        if isinstance(value, dict):
+            for labels, item in sorted(value.items()):
+                labels = labels if isinstance(labels, tuple) else (labels,)
+                lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {item}')
+        elif value is not None:
+            lines.append(f'{self.name} {value}')
+        return lines
+
+
+class Metrics:
+    """In-process metrics registry rendered in Prometheus text format.
+
+    Socket handlers are timed from ChatNamespace.trigger_event, HTTP
+    endpoints from before/after_request hooks; both cost one perf_counter
+    pair and a locked list update per call.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self._metrics = {}
+
+        self.http_requests = self.counter(
+            'schat_http_requests_total', 'HTTP requests by endpoint and status',
+            ('endpoint', 'method', 'status'))
+        self.http_errors = self.counter(
+            'schat_http_errors_total', 'HTTP requests that ended with a 5xx status',
+            ('endpoint',))
+        self.http_latency = self.histogram(
+            'schat_http_request_duration_seconds', 'HTTP handler latency',
+            ('endpoint',))
+        self.socket_events = self.counter(
+            'schat_socket_events_total', 'Socket.IO events handled', ('event',))
+        self.socket_errors = self.counter(
+            'schat_socket_event_errors_total', 'Socket.IO handlers that raised', ('event',))
+        self.socket_latency = self.histogram(
+            'schat_socket_event_duration_seconds', 'Socket.IO handler latency', ('event',))
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics[name] = metric
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics[name] = metric
+        return metric
+
+    def gauge(self, name, documentation, fn, labelnames=()):
+        # Повторная регистрация (новый create_app) заменяет старую функцию
+        metric = Gauge(name, documentation, fn, labelnames)
+        self._metrics[name] = metric
+        return metric
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        app.extensions['metrics'] = self
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    def _before_request(self):
+        g._metrics_start = time.perf_counter()
+
+    def _after_request(self, response):
+        start = g.pop('_metrics_start', None)
+        if start is not None:
+            endpoint = request.endpoint or 'unmatched'
+            self.http_latency.observe(time.perf_counter() - start, endpoint)
+            self.http_requests.inc(endpoint, request.method, response.status_code)
+            if response.status_code >= 500:
+                self.http_errors.inc(endpoint)
+        return response
+
+    def observe_socket_event(self, event, duration, failed=False):
+        self.socket_latency.observe(duration, event)
+        self.socket_events.inc(event)
+        if failed:
+            self.socket_errors.inc(event)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+metrics = Metrics()
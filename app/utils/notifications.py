@@ -0,0 +1,215 @@
+from datetime import datetime, timedelta
+from flask import current_app, render_template
+from markupsafe import Markup
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+import logging
+
+from app.utils.membership import _chunks
+from app.utils.query_budget import extend_budget
+
+
+def _upsert(db):
+    """INSERT that adds to the existing (user, chat) row instead of failing;
+    None for dialects without ON CONFLICT"""
+    from app.models import PendingNotification
+
+    dialect = db.session.get_bind(PendingNotification).dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+
+    stmt = insert(PendingNotification)
+    return stmt.on_conflict_do_update(
+        index_elements=['user_id', 'chat_id'],
+        set_={
+            'message_count': PendingNotification.message_count + 1,
+            'last_sender_id': stmt.excluded.last_sender_id,
+            'last_at': stmt.excluded.last_at,
+        }
+    )
+
+
+def _queue_without_upsert(db, rows):
+    """Portable _upsert: bump the rows that exist, insert the others.
+
+    Per chunk: one UPDATE, one SELECT of the rows now queued and one INSERT
+    in a savepoint. If a concurrent send inserted some of them first, the
+    chunk's new rows are retried one by one, each falling back to the
+    UPDATE, so the sender's transaction survives the conflict.
+    """
+    from app.models import PendingNotification
+
+    pending = PendingNotification
+    first = rows[0]
+    bump = {'message_count': pending.message_count + 1,
+            'last_sender_id': first['last_sender_id'], 'last_at': first['last_at']}
+    by_user = {row['user_id']: row for row in rows}
+    for chunk in _chunks(list(by_user)):
+        # Три запроса вместо одного upsert
+        extend_budget(2)
+        in_chat = (pending.chat_id == first['chat_id'], pending.user_id.in_(chunk))
+        db.session.execute(update(pending).where(*in_chat).values(**bump))
+        queued = set(db.session.scalars(select(pending.user_id).where(*in_chat)))
+        fresh = [by_user[uid] for uid in chunk if uid not in queued]
+        if not fresh:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(pending.__table__), fresh)
+        except IntegrityError:
+            for row in fresh:
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(insert(pending.__table__).values(row))
+                except IntegrityError:
+                    db.session.execute(update(pending).where(
+                        pending.chat_id == row['chat_id'], pending.user_id == row['user_id']
+                    ).values(**bump))
+
+
+def queue_offline_notifications(chat_id, sender_id, member_ids, is_online):
+    """Count a new message for every member without a connected socket.
+
+    Runs in the sender's transaction, one statement for all recipients
+    (a few per chunk on databases without an upsert, see
+    _queue_without_upsert). A
+    user's first message in a chat opens a NOTIFY_DIGEST_WINDOW; the digest
+    goes out when the window ends, unless the user connects before that.
+    Returns the number of users queued.
+    """
+    from app import db
+
+    recipients = [uid for uid in member_ids if uid != sender_id and not is_online(uid)]
+    if not recipients:
+        return 0
+    now = datetime.utcnow()
+    due_at = now + timedelta(seconds=current_app.config['NOTIFY_DIGEST_WINDOW'])
+    rows = [
+        {'user_id': uid, 'chat_id': chat_id, 'message_count': 1,
+         'last_sender_id': sender_id, 'last_at': now, 'due_at': due_at}
+        for uid in recipients
+    ]
+    upsert = _upsert(db)
+    if upsert is not None:
+        db.session.execute(upsert, rows)
+    else:
+        _queue_without_upsert(db, rows)
+    return len(recipients)
+
+
+def cancel_notifications(user_id):
+    """The user is back online: drop their queued digest"""
+    from app import db
+    from app.models import PendingNotification
+
+    db.session.execute(delete(PendingNotification).where(PendingNotification.user_id == user_id))
+    db.session.commit()
+
+
+def _digest_lines(rows, chats, senders):
+    lines = []
+    for row in rows:
+        chat = chats.get(row.chat_id)
+        name = chat.name if chat is not None and chat.name else 'a direct chat'
+        sender = senders.get(row.last_sender_id, 'someone')
+        noun = 'message' if row.message_count == 1 else 'messages'
+        lines.append(Markup('<p><strong>{}</strong> new {} in <strong>{}</strong>, last from {}</p>').format(
+            row.message_count, noun, name, sender))
+    return Markup('').join(lines)
+
+
+def send_due_digests(batch_size=200):
+    """Email one digest per user whose window has ended.
+
+    Users are taken batch_size at a time. The batch's digests are rendered
+    first and then sent over a single SMTP connection. A row that gained
+    messages while the batch was sent keeps only those, in a new
+    NOTIFY_DIGEST_WINDOW, for the next digest. If
+    SMTP is unavailable the rows stay and are retried on the next run.
+
+    Returns {'users', 'sent', 'failed'}.
+    """
+    from app import db, mail
+    from app.models import Chat, PendingNotification, User
+    from flask_mail import Message
+
+    stats = {'users': 0, 'sent': 0, 'failed': 0}
+    now = datetime.utcnow()
+    user_ids = db.session.scalars(
+        select(PendingNotification.user_id)
+        .where(PendingNotification.due_at <= now)
+        .group_by(PendingNotification.user_id)
+        .order_by(func.min(PendingNotification.due_at))
+        .limit(batch_size)
+    ).all()
+    if not user_ids:
+        return stats
+    stats['users'] = len(user_ids)
+
+    rows = db.session.scalars(
+        select(PendingNotification).where(PendingNotification.user_id.in_(user_ids))
+    ).all()
+    users = {user.id: user for user in db.session.execute(
+        select(User.id, User.username, User.email, User.email_verified).where(User.id.in_(user_ids))
+    )}
+    sender_ids = {row.last_sender_id for row in rows} - {None}
+    senders = dict(db.session.execute(select(User.id, User.username).where(User.id.in_(sender_ids))).all())
+    chats = {chat.id: chat for chat in db.session.execute(
+        select(Chat.id, Chat.name).where(Chat.id.in_({row.chat_id for row in rows}))
+    )}
+
+    by_user = {}
+    for row in rows:
+        by_user.setdefault(row.user_id, []).append(row)
+
+    # Сначала рендер всей пачки, потом отправка по одному соединению
+    messages = []
+    for user_id, user_rows in by_user.items():
+        user = users.get(user_id)
+        if user is None or not user.email_verified:
+            continue
+        total = sum(row.message_count for row in user_rows)
+        messages.append((user_id, Message(
+            subject=f"{total} new message{'s' if total != 1 else ''} on S-Chat",
+            recipients=[user.email],
+            html=render_template('notifications.html', user=user,
+                                 message=_digest_lines(user_rows, chats, senders))
+        )))
+
+    delivered = {uid for uid in by_user if uid not in users or not users[uid].email_verified}
+    if messages:
+        try:
+            with mail.connect() as connection:
+                for user_id, message in messages:
+                    try:
+                        connection.send(message)
+                        delivered.add(user_id)
+                        stats['sent'] += 1
+                    except Exception as e:
+                        stats['failed'] += 1
+                        logging.warning(f"Digest to user {user_id} failed: {e}")
+        except Exception as e:
+            logging.warning(f"SMTP unavailable, {len(messages)} digests postponed: {e}")
+            stats['failed'] = len(messages) - stats['sent']
+
+    # Вычитаем отправленное; строки, получившие сообщения после выборки,
+    # остаются с новым окном, остальные удаляются
+    emailed = {row.id: row.message_count for row in rows if row.user_id in delivered}
+    next_due = datetime.utcnow() + timedelta(seconds=current_app.config['NOTIFY_DIGEST_WINDOW'])
+    for chunk in _chunks(list(emailed)):
+        db.session.execute(
+            update(PendingNotification)
+            .where(PendingNotification.id.in_(chunk))
+            .values(message_count=PendingNotification.message_count - case(
+                        {row_id: emailed[row_id] for row_id in chunk}, value=PendingNotification.id),
+                    due_at=next_due)
+        )
+        db.session.execute(delete(PendingNotification).where(
+            PendingNotification.id.in_(chunk), PendingNotification.message_count <= 0
+        ))
+    db.session.commit()
+    return stats
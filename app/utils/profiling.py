@@ -0,0 +1,204 @@
+from collections import Counter
+from datetime import datetime
+from flask import g, request, current_app
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+
+def _native_threading():
+    """(Thread class, get_ident, sleep) that bypass gevent monkey-patching.
+
+    The sampler has to run on a real OS thread, otherwise under the gevent
+    worker it would never preempt the greenlet it is sampling.
+    """
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            return (
+                monkey.get_original('threading', 'Thread'),
+                monkey.get_original('_thread', 'get_ident'),
+                monkey.get_original('time', 'sleep')
+            )
+    except ImportError:
+        pass
+    return threading.Thread, threading.get_ident, time.sleep
+
+
+def _current_greenlet():
+    """The calling greenlet when gevent has patched threading, else None"""
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            from greenlet import getcurrent
+            return getcurrent()
+    except ImportError:
+        pass
+    return None
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread, or under gevent of one greenlet,
+    at a fixed interval.
+
+    The result is a Counter of collapsed stacks ("outer;...;inner" -> hits),
+    the input format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self._thread_class, get_ident, self._sleep = _native_threading()
+        self._target = get_ident()
+        self._greenlet = _current_greenlet()
+        self._running = False
+        self._sampler = None
+
+    def _frame_label(self, frame):
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _target_frame(self):
+        """Frame the profiled request or event is at right now.
+
+        Greenlets share their hub's OS thread, whose frame belongs to
+        whichever greenlet runs at the moment. A suspended greenlet is
+        read from its own gr_frame (where it waits for I/O); only while it
+        runs is the thread's frame its own.
+        """
+        glet = self._greenlet
+        if glet is None:
+            return sys._current_frames().get(self._target)
+        if glet.dead:
+            return None
+        frame = glet.gr_frame
+        if frame is None:
+            frame = sys._current_frames().get(self._target)
+            # Переключился, пока читали кадр потока: тот кадр чужой
+            if glet.gr_frame is not None:
+                frame = glet.gr_frame
+        return frame
+
+    def _sample(self):
+        while self._running:
+            self._sleep(self.interval)
+            frame = self._target_frame()
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_label(frame))
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[';'.join(stack)] += 1
+
+    def start(self):
+        self._running = True
+        self._sampler = self._thread_class(target=self._sample, daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._running = False
+        if self._sampler is not None:
+            self._sampler.join()
+        return self.stacks
+
+
+class Profiler:
+    """Opt-in profiling of single requests and sampled socket events.
+
+    An HTTP request is profiled when it carries `X-Profile: 1` together with
+    a valid X-Admin-Token; socket events are profiled with probability
+    PROFILE_SOCKET_SAMPLE_RATE. With PROFILING_ENABLED off no hooks are
+    installed at all.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.directory = None
+        self.interval = 0.005
+        self.socket_sample_rate = 0.0
+        self.max_files = 200
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PROFILING_ENABLED', False)
+        self.directory = app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+        self.interval = app.config.get('PROFILE_INTERVAL', self.interval)
+        self.socket_sample_rate = app.config.get('PROFILE_SOCKET_SAMPLE_RATE', 0.0) if self.enabled else 0.0
+        self.max_files = app.config.get('PROFILE_MAX_FILES', self.max_files)
+        app.extensions['profiler'] = self
+        if not self.enabled:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _authorized(self):
+        expected = current_app.config.get('ADMIN_TOKEN')
+        provided = request.headers.get('X-Admin-Token', '')
+        return bool(expected) and hmac.compare_digest(provided, expected)
+
+    def _before_request(self):
+        if request.headers.get('X-Profile') and self._authorized():
+            g._profiler = SamplingProfiler(self.interval)
+            g._profiler_start = time.perf_counter()
+            g._profiler.start()
+
+    def _after_request(self, response):
+        sampler = g.pop('_profiler', None)
+        if sampler is not None:
+            duration = time.perf_counter() - g.pop('_profiler_start')
+            name = self.save('http', request.endpoint or 'unmatched', sampler.stop(), duration)
+            response.headers['X-Profile-Id'] = name
+        return response
+
+    def should_sample_socket_event(self):
+        return self.socket_sample_rate > 0 and random.random() < self.socket_sample_rate
+
+    def profile_call(self, kind, label, fn, *args):
+        """Run fn under the sampler and save the profile"""
+        sampler = SamplingProfiler(self.interval)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            return fn(*args)
+        finally:
+            self.save(kind, label, sampler.stop(), time.perf_counter() - start)
+
+    def save(self, kind, label, stacks, duration):
+        """Write collapsed stacks to PROFILE_DIR, return the file name"""
+        label = re.sub(r'[^A-Za-z0-9_.-]', '_', label)
+        stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+        name = f"{stamp}_{kind}_{label}_{int(duration * 1000)}ms.collapsed"
+        with open(os.path.join(self.directory, name), 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self._prune()
+        return name
+
+    def _prune(self):
+        files = sorted(self.list_profiles(), key=lambda p: p['name'])
+        for stale in files[:max(0, len(files) - self.max_files)]:
+            os.remove(os.path.join(self.directory, stale['name']))
+
+    def list_profiles(self):
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.collapsed'):
+                stat = os.stat(os.path.join(self.directory, name))
+                profiles.append({
+                    'name': name,
+                    'size': stat.st_size,
+                    'created_at': datetime.utcfromtimestamp(stat.st_mtime).isoformat()
+                })
+        return profiles
+
+
+profiler = Profiler()
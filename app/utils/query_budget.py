@@ -0,0 +1,200 @@
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import logging
+import os
+import re
+import sys
+
+_tracker = ContextVar('query_tracker', default=None)
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_THIS_FILE = os.path.abspath(__file__)
+
+_WHITESPACE = re.compile(r'\s+')
+_IN_LIST = re.compile(r'IN \((?:\?|%\(\w+\)s|:\w+)(?:, (?:\?|%\(\w+\)s|:\w+))*\)')
+_POSTCOMPILE = re.compile(r'IN \(__\[POSTCOMPILE_\w+\]\)')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A unit of work issued more SQL statements than its budget allows"""
+
+
+def statement_shape(statement):
+    """Normalize SQL so that the same query with other parameters compares equal"""
+    shape = _WHITESPACE.sub(' ', statement).strip()
+    shape = _POSTCOMPILE.sub('IN (...)', shape)
+    return _IN_LIST.sub('IN (...)', shape)
+
+
+def _call_site():
+    """First frame inside app/ that is not this module"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(_APP_DIR) and filename != _THIS_FILE:
+            return f"{os.path.relpath(filename, os.path.dirname(_APP_DIR))}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return 'unknown'
+
+
+class QueryTracker:
+    """Counts statements of one unit of work (request, socket event, test block)"""
+
+    MAX_SITES_PER_SHAPE = 5
+
+    def __init__(self, label, max_queries=None):
+        self.label = label
+        self.max_queries = max_queries
+        self.count = 0
+        self.shapes = Counter()
+        self.sites = {}
+
+    def record(self, statement):
+        self.count += 1
+        shape = statement_shape(statement)
+        self.shapes[shape] += 1
+        sites = self.sites.setdefault(shape, Counter())
+        if len(sites) < self.MAX_SITES_PER_SHAPE or self.shapes[shape] == 1:
+            sites[_call_site()] += 1
+
+    def repeated_shapes(self, threshold):
+        """(shape, count, call sites) for statements issued threshold+ times"""
+        return [
+            (shape, count, dict(self.sites.get(shape, {})))
+            for shape, count in self.shapes.most_common()
+            if count >= threshold
+        ]
+
+    @property
+    def over_budget(self):
+        return self.max_queries is not None and self.count > self.max_queries
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    tracker = _tracker.get()
+    if tracker is not None:
+        tracker.record(statement)
+
+
+def query_budget(max_queries):
+    """Declare how many statements a view or socket handler may issue,
+    whatever the size of the data it works on"""
+    def decorator(fn):
+        fn._query_budget = max_queries
+        return fn
+    return decorator
+
+
+def extend_budget(extra):
+    """Allow the current unit of work extra statements beyond its declared
+    budget, for work whose statement count depends on configuration (one
+    per message shard a view reads from)"""
+    tracker = _tracker.get()
+    if tracker is not None and tracker.max_queries is not None:
+        tracker.max_queries += extra
+
+
+@contextmanager
+def assert_max_queries(max_queries, label='block'):
+    """Test helper: fail if the block issues more than max_queries statements"""
+    tracker = QueryTracker(label, max_queries)
+    token = _tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _tracker.reset(token)
+    if tracker.over_budget:
+        shapes = '\n'.join(
+            f"  {count}x {shape}" for shape, count, _ in tracker.repeated_shapes(1)
+        )
+        raise QueryBudgetExceeded(
+            f"{label} issued {tracker.count} queries, budget is {max_queries}:\n{shapes}"
+        )
+
+
+class QueryMonitor:
+    """Per-request and per-socket-event query counting.
+
+    With QUERY_TRACKING_ENABLED every unit of work gets a tracker; statement
+    shapes repeated QUERY_NPLUS1_THRESHOLD+ times are logged as likely N+1
+    patterns with their call sites, and budgets declared by @query_budget
+    are checked (raising when QUERY_BUDGET_ENFORCE is on, logging otherwise).
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.threshold = 5
+        self.enforce = False
+        self._listening = False
+
+    def init_app(self, app):
+        self.enabled = app.config.get('QUERY_TRACKING_ENABLED', False)
+        self.threshold = app.config.get('QUERY_NPLUS1_THRESHOLD', self.threshold)
+        self.enforce = app.config.get('QUERY_BUDGET_ENFORCE', False)
+        app.extensions['query_monitor'] = self
+
+        # Слушатель общий для всех движков; без активного трекера он почти бесплатен
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            self._listening = True
+
+        if self.enabled:
+            app.before_request(self._before_request)
+            app.after_request(self._after_request)
+            app.teardown_request(self._teardown_request)
+
+    def _view_budget(self):
+        view = current_app.view_functions.get(request.endpoint)
+        return getattr(view, '_query_budget', None)
+
+    def _before_request(self):
+        label = f"http:{request.endpoint or 'unmatched'}"
+        request._query_tracker_token = _tracker.set(QueryTracker(label, self._view_budget()))
+
+    def _after_request(self, response):
+        # Исключение здесь превращается в 500, что и нужно в режиме enforce
+        tracker = _tracker.get()
+        if tracker is not None:
+            self.report(tracker)
+        return response
+
+    def _teardown_request(self, exc=None):
+        # stream_with_context повторяет teardown после отдачи тела: токен
+        # сбрасывается только один раз
+        token = request.__dict__.pop('_query_tracker_token', None)
+        if token is not None:
+            _tracker.reset(token)
+
+    @contextmanager
+    def track(self, label, max_queries=None):
+        """Track one unit of work (used around socket events)"""
+        if not self.enabled:
+            yield None
+            return
+        tracker = QueryTracker(label, max_queries)
+        token = _tracker.set(tracker)
+        try:
+            yield tracker
+        finally:
+            _tracker.reset(token)
+        self.report(tracker)
+
+    def report(self, tracker):
+        for shape, count, sites in tracker.repeated_shapes(self.threshold):
+            logging.warning(
+                f"Possible N+1 in {tracker.label}: {count}x {shape[:200]} "
+                f"from {', '.join(sites)}"
+            )
+
+        if tracker.over_budget:
+            message = f"{tracker.label} issued {tracker.count} queries, budget is {tracker.max_queries}"
+            if self.enforce:
+                raise QueryBudgetExceeded(message)
+            logging.warning(message)
+
+
+query_monitor = QueryMonitor()
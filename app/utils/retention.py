@@ -0,0 +1,190 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, select, update
+import logging
+import os
+import threading
+import time
+
+# Чистки, уже учтённые кэшами этого процесса: chat_id -> purged_through
+_applied_purges = {}
+_applied_lock = threading.Lock()
+
+
+def retention_days(chat_retention, default_days):
+    """Effective policy of a chat: its own days, else the global default; 0 keeps forever"""
+    return default_days if chat_retention is None else chat_retention
+
+
+def ensure_retention_column():
+    """Add chat.retention_days and chat.purged_through to databases created before them"""
+    from app import db
+    from app.utils.schema import add_missing_columns
+
+    add_missing_columns(db.engine, 'chat', {'retention_days': 'INTEGER', 'purged_through': 'INTEGER'})
+
+
+def apply_purges(watermarks):
+    """Drop this process's cached messages of chats purged since it last looked.
+
+    watermarks: {chat_id: Chat.purged_through}. A purge usually runs in
+    another process (`flask scheduler run`, `flask chats purge`), which
+    cannot reach this one's newest-page buffer or message versions. Views
+    read the persisted watermark and call this before building their
+    ETag. Returns the chat ids whose caches were dropped.
+    """
+    from app.utils.message_cache import recent_messages
+    from app.utils.versioning import versions
+
+    dropped = []
+    with _applied_lock:
+        for chat_id, purged_through in watermarks.items():
+            if purged_through is None or _applied_purges.get(chat_id) == purged_through:
+                continue
+            _applied_purges[chat_id] = purged_through
+            dropped.append(chat_id)
+    for chat_id in dropped:
+        recent_messages.invalidate(chat_id)
+        versions.bump('messages', chat_id)
+    return dropped
+
+
+def check_purges(chat_ids):
+    """apply_purges for these chats, with their watermarks read in one query per chunk"""
+    from app import db
+    from app.models import Chat
+    from app.utils.membership import _chunks
+
+    watermarks = {}
+    for chunk in _chunks(list(chat_ids)):
+        watermarks.update(db.session.execute(
+            select(Chat.id, Chat.purged_through)
+            .where(Chat.id.in_(chunk), Chat.purged_through.isnot(None))
+        ).all())
+    return apply_purges(watermarks)
+
+
+def _remove_attachments(file_paths):
+    upload_folder = os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+    removed = 0
+    for file_path in file_paths:
+        path = os.path.abspath(os.path.join(upload_folder, file_path))
+        # Только файлы внутри папки загрузок
+        if not path.startswith(upload_folder + os.sep):
+            continue
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Could not remove attachment {path}: {e}")
+    return removed
+
+
+def purge_chat(chat_id, cutoff, batch_size=500, pause=0.05, dry_run=False):
+    """Delete one chat's messages older than cutoff, oldest first.
+
+    Messages are read from the chat's shard, batch_size at a time along
+    ix_message_chat_id_id.
+    Ids grow with time, so the walk stops at the first message newer than
+    cutoff. Each batch is one short DELETE of an id range, with a pause
+    before the next, so a live send waits for at most one batch. Files of
+    deleted attachments are removed after each commit.
+
+    Returns (messages deleted, attachments removed, newest id deleted).
+    """
+    from app import db
+    from app.models import Message
+    from app.utils.sharding import message_shards
+
+    store = message_shards.session(chat_id)
+    deleted = removed = 0
+    last_id = 0
+    while True:
+        rows = store.execute(
+            select(Message.id, Message.timestamp, Message.file_path)
+            .where(Message.chat_id == chat_id, Message.id > last_id)
+            .order_by(Message.id)
+            .limit(batch_size)
+        ).all()
+        expired = []
+        for row in rows:
+            if row.timestamp is not None and row.timestamp >= cutoff:
+                break
+            expired.append(row)
+        if not expired:
+            break
+        last_id = expired[-1].id
+
+        if not dry_run:
+            store.execute(
+                delete(Message).where(Message.chat_id == chat_id,
+                                      Message.id.between(expired[0].id, last_id))
+            )
+            db.session.commit()
+            removed += _remove_attachments([row.file_path for row in expired if row.file_path])
+        deleted += len(expired)
+
+        if len(expired) < len(rows) or len(rows) < batch_size:
+            break
+        if pause and not dry_run:
+            time.sleep(pause)
+    return deleted, removed, last_id
+
+
+def purge_expired_messages(batch_size=500, pause=0.05, dry_run=False, progress=None):
+    """Apply every chat's retention policy (Chat.retention_days, else
+    MESSAGE_RETENTION_DAYS).
+
+    Chats are walked in id order. After a chat loses messages, the id of
+    the newest one deleted is stored in Chat.purged_through. Every
+    process compares it with what it has seen (check_purges) before
+    serving the chat's messages, drops its newest-page buffer and bumps
+    the message version, so ETags and chat lists change in the web
+    workers too, not only in the process that ran the purge.
+
+    Returns {'chats', 'messages', 'attachments'}.
+    """
+    from app import db
+    from app.models import Chat
+
+    default_days = current_app.config['MESSAGE_RETENTION_DAYS']
+    now = datetime.utcnow()
+    stats = {'chats': 0, 'messages': 0, 'attachments': 0}
+    last_chat = 0
+
+    while True:
+        chats = db.session.execute(
+            select(Chat.id, Chat.retention_days)
+            .where(Chat.id > last_chat)
+            .order_by(Chat.id)
+            .limit(1000)
+        ).all()
+        if not chats:
+            break
+        last_chat = chats[-1].id
+
+        for chat_id, chat_retention in chats:
+            days = retention_days(chat_retention, default_days)
+            if not days:
+                continue
+            deleted, removed, purged_through = purge_chat(
+                chat_id, now - timedelta(days=days), batch_size, pause, dry_run)
+            if not deleted:
+                continue
+            if not dry_run:
+                db.session.execute(
+                    update(Chat).where(Chat.id == chat_id).values(purged_through=purged_through)
+                )
+                db.session.commit()
+                apply_purges({chat_id: purged_through})
+            stats['chats'] += 1
+            stats['messages'] += deleted
+            stats['attachments'] += removed
+            if progress:
+                progress(chat_id, deleted, stats)
+
+    if stats['messages']:
+        logging.info(f"Retention purge{' (dry run)' if dry_run else ''}: {stats}")
+    return stats
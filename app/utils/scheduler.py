@@ -0,0 +1,226 @@
+from datetime import datetime, timedelta
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError
+import logging
+import os
+import random
+import secrets
+import socket
+import threading
+import time
+
+
+class Job:
+    __slots__ = ('name', 'fn', 'interval', 'jitter', 'lease_seconds')
+
+    def __init__(self, name, fn, interval, jitter, lease_seconds):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.jitter = jitter
+        self.lease_seconds = lease_seconds
+
+    def next_delay(self):
+        """Interval with ±jitter, so jobs registered together spread out"""
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+class Scheduler:
+    """Periodic jobs shared by every process that runs the scheduler.
+
+    Each job has a row in job_lease with its next run time. A process runs
+    a job only after a conditional UPDATE that claims a due, unleased row
+    succeeds, so however many workers or `flask scheduler run` processes
+    poll, one of them runs each occurrence. The winner sets the next run
+    time and releases the lease; a lease left by a crashed process expires
+    after lease_seconds. Every run is recorded in job_run and observed in
+    the schat_job_* metrics.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.jobs = {}
+        self.enabled = False
+        self.tick = 5.0
+        self.history_days = 30
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+        self._thread = None
+        self._stop = threading.Event()
+        self._runs = None
+        self._durations = None
+
+    def job(self, name, interval, jitter=0.1, lease_seconds=600):
+        """Decorator registering fn(app) as a job every `interval` seconds"""
+        def decorator(fn):
+            self.jobs[name] = Job(name, fn, interval, jitter, lease_seconds)
+            return fn
+        return decorator
+
+    def init_app(self, app):
+        from app.utils.metrics import metrics
+
+        self.app = app
+        self.enabled = app.config.get('SCHEDULER_ENABLED', self.enabled)
+        self.tick = app.config.get('SCHEDULER_TICK', self.tick)
+        self.history_days = app.config.get('SCHEDULER_HISTORY_DAYS', self.history_days)
+        self._runs = metrics.counter(
+            'schat_job_runs_total', 'Scheduled job runs by outcome', ('job', 'status'))
+        self._durations = metrics.histogram(
+            'schat_job_duration_seconds', 'Scheduled job duration', ('job',),
+            buckets=(0.01, 0.1, 0.5, 1, 5, 15, 60, 300))
+        app.extensions['scheduler'] = self
+
+        from app.utils import jobs  # noqa: F401 — регистрация задач
+        if self.enabled:
+            self.start()
+
+    # --- аренда ------------------------------------------------------------
+
+    def ensure_schema(self):
+        from app import db
+        from app.models import JobLease, JobRun, PendingNotification
+        from app.utils.retention import ensure_retention_column
+        from app.utils.schema import add_missing_columns
+
+        db.metadata.create_all(db.engine, tables=[
+            JobLease.__table__, JobRun.__table__, PendingNotification.__table__
+        ])
+        add_missing_columns(db.engine, 'user', {'signed_pre_key_rotated_at': 'DATETIME'})
+        ensure_retention_column()
+
+    def _ensure_rows(self):
+        from app import db
+        from app.models import JobLease
+
+        now = datetime.utcnow()
+        known = set(db.session.scalars(select(JobLease.name)))
+        for job in self.jobs.values():
+            if job.name in known:
+                continue
+            # Первый запуск — через случайную долю интервала
+            first_delay = random.uniform(0, job.jitter) * job.interval
+            db.session.add(JobLease(name=job.name, next_run_at=now + timedelta(seconds=first_delay)))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()  # строку уже вставил другой процесс
+
+    def _claim(self, job):
+        from app import db
+        from app.models import JobLease
+
+        # Своё время на каждый захват: после долгой задачи время тика
+        # устарело, и аренда истекла бы ещё до запуска
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            update(JobLease)
+            .where(JobLease.name == job.name, JobLease.next_run_at <= now,
+                   or_(JobLease.lease_until.is_(None), JobLease.lease_until < now))
+            .values(owner=self.owner, lease_until=now + timedelta(seconds=job.lease_seconds))
+        ).rowcount == 1
+        db.session.commit()
+        return claimed
+
+    def _release(self, job):
+        from app import db
+        from app.models import JobLease
+
+        db.session.execute(
+            update(JobLease)
+            .where(JobLease.name == job.name, JobLease.owner == self.owner)
+            .values(lease_until=None, next_run_at=datetime.utcnow() + timedelta(seconds=job.next_delay()))
+        )
+        db.session.commit()
+
+    # --- выполнение ----------------------------------------------------------
+
+    def _execute(self, job):
+        from app import db
+        from app.models import JobRun
+
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        try:
+            result, status = job.fn(self.app), 'ok'
+        except Exception as e:
+            db.session.rollback()
+            logging.exception(f"Job {job.name} failed")
+            result, status = f"{type(e).__name__}: {e}", 'failed'
+        duration = time.perf_counter() - started
+
+        self._runs.inc(job.name, status)
+        self._durations.observe(duration, job.name)
+        db.session.add(JobRun(job=job.name, owner=self.owner, started_at=started_at,
+                              duration=duration, status=status,
+                              result=None if result is None else str(result)[:2000]))
+        db.session.commit()
+        return status, result
+
+    def run_pending(self, only=None):
+        """Run every due job this process manages to claim; returns
+        [(job name, status, result)]"""
+        from app import db
+        from app.models import JobLease
+
+        self._ensure_rows()
+        due = set(db.session.scalars(
+            select(JobLease.name).where(JobLease.next_run_at <= datetime.utcnow())
+        ))
+        done = []
+        for job in self.jobs.values():
+            if job.name not in due or (only and job.name not in only):
+                continue
+            if not self._claim(job):
+                continue
+            try:
+                status, result = self._execute(job)
+            finally:
+                self._release(job)
+            done.append((job.name, status, result))
+        return done
+
+    def run_now(self, name):
+        """Run one job regardless of its schedule, still under its lease"""
+        from app import db
+        from app.models import JobLease
+
+        job = self.jobs[name]
+        self._ensure_rows()
+        db.session.execute(update(JobLease).where(JobLease.name == name)
+                           .values(next_run_at=datetime.utcnow()))
+        db.session.commit()
+        if not self._claim(job):
+            return None
+        try:
+            return self._execute(job)
+        finally:
+            self._release(job)
+
+    def loop(self, stop=None):
+        stop = stop or self._stop
+        with self.app.app_context():
+            self.ensure_schema()
+        while not stop.is_set():
+            with self.app.app_context():
+                try:
+                    self.run_pending()
+                except Exception as e:
+                    logging.warning(f"Scheduler tick failed: {e}")
+            stop.wait(self.tick * random.uniform(0.8, 1.2))
+
+    def start(self):
+        """Poll in a daemon thread of this process"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.loop, name='scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.tick * 2)
+            self._thread = None
+
+
+scheduler = Scheduler()
@@ -0,0 +1,25 @@
+from sqlalchemy import inspect, text
+
+
+def add_missing_columns(engine, table, columns):
+    """ALTER TABLE ADD COLUMN for each {name: DDL} not in the table yet.
+
+    The schema is created with db.create_all, which never alters existing
+    tables; maintenance commands call this before backfilling new columns.
+    Returns the names added.
+    """
+    existing = {column['name'] for column in inspect(engine).get_columns(table)}
+    added = []
+    with engine.begin() as conn:
+        for name, ddl in columns.items():
+            if name not in existing:
+                conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}'))
+                added.append(name)
+    return added
+
+
+def create_missing_indexes(engine, model, names=None):
+    """CREATE INDEX for the model's indexes (or just `names`) that do not exist"""
+    for index in model.__table__.indexes:
+        if names is None or index.name in names:
+            index.create(engine, checkfirst=True)
@@ -0,0 +1,429 @@
+from datetime import datetime
+from sqlalchemy import Column, Index, Integer, MetaData, Table, case, delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+import logging
+import threading
+import time
+
+from app.utils.db_routing import read_engine
+from app.utils.membership import _chunks
+from app.utils.query_budget import extend_budget
+
+# id сообщений при включённых шардах: ID_BASE + k * ID_STRIDE + номер шарда.
+# Шаг не зависит от числа шардов, чтобы добавление шарда не меняло разбиение
+ID_BASE = 1 << 40
+ID_STRIDE = 64
+
+# Последний выданный id на каждом хранилище. Только растёт: перенос чата
+# удаляет строки из message, но не опускает эту отметку
+message_id_seq = Table(
+    'message_id_seq', MetaData(),
+    Column('shard', Integer, primary_key=True, autoincrement=False),
+    Column('last_id', Integer, nullable=False)
+)
+
+
+def shard_bind(shard):
+    """Bind key of message shard number `shard` (1..N; 0 is the primary database)"""
+    return f'message_shard_{shard}'
+
+
+def configure_message_shards(app):
+    """Register a bind per MESSAGE_SHARDS URI, before db.init_app"""
+    uris = app.config.get('MESSAGE_SHARDS') or []
+    if not uris:
+        return
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for shard, uri in enumerate(uris, start=1):
+        binds[shard_bind(shard)] = uri
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def shard_message_table():
+    """The message table as created on shards 1..N: same columns and
+    indexes, without foreign keys to chat/user, which live on the primary"""
+    from app.models import Message
+
+    table = Table('message', MetaData(), *[
+        Column(column.name, column.type, primary_key=column.primary_key,
+               nullable=column.nullable, index=column.index)
+        for column in Message.__table__.columns
+    ])
+    Index('ix_message_chat_id_id', table.c.chat_id, table.c.id)
+    return table
+
+
+def allocate_message_id(store, shard):
+    """Next message id of a shard, taken in the caller's transaction.
+
+    Ids above ID_BASE step by ID_STRIDE from the shard's number, so shards
+    never hand out the same id, and a chat keeps its ids when it moves.
+    Pre-shard autoincrement ids are all below ID_BASE. The id comes from
+    the shard's row in message_id_seq, a high-water mark that never goes
+    down, so ids deleted by a move or a purge are not issued again. The
+    UPDATE holds the row (SQLite: the write lock) until commit, so ids on
+    a shard follow commit order and `id > last_seen` cursors (sync, export
+    resume, recent_messages.since) never skip a message.
+    """
+    last_id = message_id_seq.c.last_id
+    issued = store.execute(
+        update(message_id_seq)
+        .where(message_id_seq.c.shard == shard)
+        .values(last_id=case(
+            (last_id < ID_BASE, ID_BASE + shard),
+            else_=last_id - (last_id - ID_BASE) % ID_STRIDE + ID_STRIDE + shard
+        ))
+        .returning(last_id)
+    ).scalar()
+    if issued is None:
+        raise RuntimeError(f"Shard {shard} has no message id sequence, run `flask shards init`")
+    return issued
+
+
+class ChatMoving(Exception):
+    """The chat's messages are being moved to another shard right now"""
+
+
+class MessageIdConflict(ValueError):
+    """Messages being moved have ids that another chat uses on the target"""
+
+
+class _ShardSession:
+    """db.session with every statement sent to one shard's engine.
+
+    The shard's connection joins the session transaction, so commit() and
+    rollback() of db.session cover it (no two-phase commit across shards).
+    """
+
+    def __init__(self, session, engine):
+        self.session = session
+        self.engine = engine
+
+    def execute(self, statement, params=None, **kwargs):
+        bind_arguments = dict(kwargs.pop('bind_arguments', None) or {}, bind=self.engine)
+        return self.session.execute(statement, params, bind_arguments=bind_arguments, **kwargs)
+
+    def scalar(self, statement, params=None, **kwargs):
+        return self.execute(statement, params, **kwargs).scalar()
+
+
+class MessageShards:
+    """Maps chat_id to the database that holds the chat's messages.
+
+    Shard 0 is the primary database; MESSAGE_SHARDS adds shards 1..N, each
+    with its own message table. The chat_shard directory on the primary
+    records where each chat lives; new chats are placed at creation
+    (chat_id modulo the number of shards), chats without a row stay on
+    shard 0. Directory entries are cached for MESSAGE_SHARD_DIRECTORY_TTL
+    seconds, which is also how long `flask shards move` waits for every
+    process to notice a change. Without MESSAGE_SHARDS everything goes to
+    the primary exactly as before and ids stay autoincrement.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.count = 1
+        self.ttl = 2.0
+        self._directory = {}  # chat_id -> (shard, frozen, когда прочитано)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.count = 1 + len(app.config.get('MESSAGE_SHARDS') or [])
+        if self.count > ID_STRIDE:
+            raise ValueError(f"At most {ID_STRIDE} message shards are supported, got {self.count}")
+        self.enabled = self.count > 1
+        self.ttl = app.config.get('MESSAGE_SHARD_DIRECTORY_TTL', self.ttl)
+        self._directory = {}
+        app.extensions['message_shards'] = self
+
+    # --- каталог ---------------------------------------------------------
+
+    def _entries(self, chat_ids):
+        """{chat_id: (shard, frozen)}, one directory query for the uncached ones"""
+        from app import db
+        from app.models import ChatShard
+
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            for chat_id in chat_ids:
+                entry = self._directory.get(chat_id)
+                if entry is not None and now - entry[2] < self.ttl:
+                    found[chat_id] = entry[:2]
+                else:
+                    missing.append(chat_id)
+        if not missing:
+            return found
+
+        loaded = {chat_id: (0, False) for chat_id in missing}
+        for chunk in _chunks(missing):
+            # Поход в каталог — сверх бюджета вида, он зависит от TTL кэша
+            extend_budget(1)
+            # Не с реплики: отстающая копия каталога сломала бы переключение при переносе
+            for chat_id, shard, frozen in db.session.execute(
+                select(ChatShard.chat_id, ChatShard.shard, ChatShard.frozen)
+                .where(ChatShard.chat_id.in_(chunk)),
+                bind_arguments={'bind': read_engine(db)}
+            ):
+                loaded[chat_id] = (shard, bool(frozen))
+        with self._lock:
+            if len(self._directory) > 100000:
+                self._directory.clear()
+            for chat_id, entry in loaded.items():
+                self._directory[chat_id] = entry + (now,)
+        found.update(loaded)
+        return found
+
+    def shard_of(self, chat_id):
+        if not self.enabled:
+            return 0
+        return self._entries([chat_id])[chat_id][0]
+
+    def group(self, chat_ids):
+        """{shard: [chat ids]} in shard order"""
+        if not self.enabled:
+            return {0: list(chat_ids)} if chat_ids else {}
+        groups = {}
+        for chat_id, (shard, _) in self._entries(list(chat_ids)).items():
+            groups.setdefault(shard, []).append(chat_id)
+        return dict(sorted(groups.items()))
+
+    def place(self, chat_id):
+        """Directory row of a new chat, in the caller's transaction"""
+        from app import db
+        from app.models import ChatShard
+
+        if not self.enabled:
+            return 0
+        shard = chat_id % self.count
+        db.session.add(ChatShard(chat_id=chat_id, shard=shard, frozen=False))
+        with self._lock:
+            self._directory[chat_id] = (shard, False, time.monotonic())
+        return shard
+
+    # --- доступ к хранилищам ----------------------------------------------
+
+    def engine(self, shard):
+        """Engine of a shard, None for shard 0 (the primary and its read routing)"""
+        from app import db
+
+        return db.engines[shard_bind(shard)] if shard else None
+
+    def session(self, chat_id=None, shard=None):
+        """Session-like object for statements on the message table of a chat
+        (or of a shard). Shard 0 gets db.session itself, so the read pool and
+        replica routing keep working for the primary."""
+        from app import db
+
+        if shard is None:
+            shard = self.shard_of(chat_id) if chat_id is not None else 0
+        if not shard:
+            return db.session
+        return _ShardSession(db.session, self.engine(shard))
+
+    def insert_message(self, chat_id, **values):
+        """Insert a message into its chat's shard, in db.session's transaction.
+
+        Returns (id, timestamp). Raises ChatMoving during the final seconds
+        of a move, when the chat does not accept writes.
+        """
+        from app.models import Message
+
+        shard, frozen = self._entries([chat_id])[chat_id] if self.enabled else (0, False)
+        if frozen:
+            raise ChatMoving('Chat is being moved, try again in a few seconds')
+
+        table = Message.__table__
+        store = self.session(shard=shard)
+        values.update(chat_id=chat_id, timestamp=datetime.utcnow())
+        if self.enabled:
+            extend_budget(1)
+            values['id'] = allocate_message_id(store, shard)
+        result = store.execute(insert(table).values(**values).returning(table.c.id))
+        return result.scalar_one(), values['timestamp']
+
+    # --- обслуживание -----------------------------------------------------
+
+    def ensure_schema(self):
+        """Create chat_shard on the primary, the message table on every shard
+        and each store's message_id_seq row"""
+        from app import db
+        from app.models import ChatShard
+
+        ChatShard.__table__.create(db.engine, checkfirst=True)
+        table = shard_message_table()
+        engines = [db.engine] + [self.engine(shard) for shard in range(1, self.count)]
+        for shard, engine in enumerate(engines):
+            if shard:
+                table.create(engine, checkfirst=True)
+            message_id_seq.create(engine, checkfirst=True)
+
+        # Новая отметка начинается выше всех id на всех хранилищах: прежние
+        # id уже могли разойтись по другим шардам при переносах
+        top = 0
+        for engine in engines:
+            with engine.connect() as conn:
+                top = max(top, conn.scalar(select(func.max(table.c.id))) or 0)
+        for shard, engine in enumerate(engines):
+            with engine.begin() as conn:
+                known = conn.scalar(select(message_id_seq.c.shard).where(message_id_seq.c.shard == shard))
+                if known is None:
+                    conn.execute(insert(message_id_seq).values(shard=shard, last_id=top))
+
+    def counts(self):
+        """[(shard, chats in the directory, messages)] for every shard"""
+        from app import db
+        from app.models import ChatShard, Message
+
+        directory = dict(db.session.execute(
+            select(ChatShard.shard, func.count()).group_by(ChatShard.shard)
+        ).all())
+        return [
+            (shard, directory.get(shard, 0),
+             self.session(shard=shard).scalar(select(func.count()).select_from(Message)))
+            for shard in range(self.count)
+        ]
+
+
+message_shards = MessageShards()
+
+
+def _copy_after(chat_id, source, target, last_id, batch_size, pause):
+    """Copy a chat's messages with id > last_id from source to target in
+    batch_size transactions. Returns (rows copied, last id copied)."""
+    from app import db
+    from app.models import Message
+
+    columns = [column.name for column in Message.__table__.columns]
+    copied = 0
+    while True:
+        rows = message_shards.session(shard=source).execute(
+            select(Message.__table__)
+            .where(Message.chat_id == chat_id, Message.id > last_id)
+            .order_by(Message.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return copied, last_id
+        try:
+            message_shards.session(shard=target).execute(
+                insert(Message.__table__), [dict(zip(columns, row)) for row in rows]
+            )
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            # id, выданные до message_id_seq, могли повториться в другом чате
+            taken = message_shards.session(shard=target).execute(
+                select(Message.id, Message.chat_id)
+                .where(Message.id.in_([row.id for row in rows]), Message.chat_id != chat_id)
+            ).all()
+            if not taken:
+                raise
+            raise MessageIdConflict(
+                f"Chat {chat_id}: ids already used on shard {target} by other chats: "
+                + ', '.join(f"{row.id} (chat {row.chat_id})" for row in taken[:10])
+            )
+        copied += len(rows)
+        last_id = rows[-1].id
+        if len(rows) < batch_size:
+            return copied, last_id
+        if pause:
+            time.sleep(pause)
+
+
+def _set_directory(chat_id, **values):
+    from app import db
+    from app.models import ChatShard
+
+    db.session.execute(update(ChatShard).where(ChatShard.chat_id == chat_id).values(**values))
+    db.session.commit()
+
+
+def move_chat(chat_id, target, batch_size=1000, pause=0.01, progress=None):
+    """Move one chat's messages to another shard while it stays online.
+
+    1. The directory row gets target set; reads and writes still go to the
+       source while messages are copied in id order, batch_size per
+       transaction, until a pass finds almost nothing new.
+    2. The chat is frozen: sends are refused with ChatMoving. After one
+       directory TTL every process has seen it, and the tail is copied.
+    3. The directory points at the target and the freeze is lifted. After
+       another TTL nothing reads the source any more; messages a send in
+       flight left there are copied, and the source rows are deleted in
+       id-range batches.
+
+    If the copy fails (e.g. MessageIdConflict), the chat is released on
+    the source and `target` is cleared. An interrupted or failed move
+    resumes after the last message already on the target. Returns {'copied', 'deleted', 'frozen_seconds', 'seconds'}.
+    """
+    from app import db
+    from app.models import ChatShard, Message
+
+    if not 0 <= target < message_shards.count:
+        raise ValueError(f"Shard {target} is not configured (0..{message_shards.count - 1})")
+
+    started = time.monotonic()
+    stats = {'copied': 0, 'deleted': 0, 'frozen_seconds': 0.0, 'seconds': 0.0}
+    row = db.session.get(ChatShard, chat_id)
+    if row is None:
+        db.session.add(ChatShard(chat_id=chat_id, shard=0, frozen=False))
+        db.session.commit()
+        row = db.session.get(ChatShard, chat_id)
+    source = row.shard
+    if source == target:
+        return stats
+
+    _set_directory(chat_id, target=target, frozen=False)
+    last_id = message_shards.session(shard=target).scalar(
+        select(func.max(Message.id)).where(Message.chat_id == chat_id)
+    ) or 0
+
+    try:
+        # Догоняем живую запись, пока за проход почти ничего не прибавляется
+        while True:
+            copied, last_id = _copy_after(chat_id, source, target, last_id, batch_size, pause)
+            stats['copied'] += copied
+            if progress:
+                progress('copy', stats)
+            if copied < batch_size:
+                break
+
+        _set_directory(chat_id, frozen=True)
+        frozen_at = time.monotonic()
+        time.sleep(message_shards.ttl)
+        copied, last_id = _copy_after(chat_id, source, target, last_id, batch_size, 0)
+        stats['copied'] += copied
+
+        _set_directory(chat_id, shard=target, target=None, frozen=False)
+        stats['frozen_seconds'] = time.monotonic() - frozen_at
+        if progress:
+            progress('switched', stats)
+    except Exception:
+        db.session.rollback()
+        # Чат остаётся на источнике и снова принимает сообщения; скопированное
+        # не видно, повторный move продолжит копирование с него
+        _set_directory(chat_id, target=None, frozen=False)
+        raise
+
+    time.sleep(message_shards.ttl)
+    copied, last_id = _copy_after(chat_id, source, target, last_id, batch_size, 0)
+    stats['copied'] += copied
+
+    store = message_shards.session(shard=source)
+    while True:
+        ids = store.execute(
+            select(Message.id).where(Message.chat_id == chat_id).order_by(Message.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        store.execute(delete(Message).where(Message.chat_id == chat_id, Message.id.between(ids[0], ids[-1])))
+        db.session.commit()
+        stats['deleted'] += len(ids)
+        if progress:
+            progress('delete', stats)
+        if pause:
+            time.sleep(pause)
+
+    stats['seconds'] = time.monotonic() - started
+    logging.info(f"Chat {chat_id} moved from shard {source} to {target}: {stats}")
+    return stats
@@ -0,0 +1,34 @@
+import logging
+import time
+
+
+class StartupTimer:
+    """Wall time of the steps of create_app, reported with STARTUP_TIMING.
+
+    mark(name) closes the step that started at the previous mark, so the
+    report adds up to the whole create_app call.
+    """
+
+    def __init__(self, enabled, import_seconds=None):
+        self.enabled = enabled
+        self.import_seconds = import_seconds
+        self.steps = []
+        self._started = self._last = time.perf_counter()
+
+    def mark(self, name):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.steps.append((name, now - self._last))
+        self._last = now
+
+    def report(self):
+        if not self.enabled:
+            return
+        total = time.perf_counter() - self._started
+        lines = [f"Startup timing (create_app {total * 1000:.1f} ms):"]
+        if self.import_seconds is not None:
+            lines.append(f"  {'import app':<20} {self.import_seconds * 1000:8.1f} ms")
+        for name, seconds in self.steps:
+            lines.append(f"  {name:<20} {seconds * 1000:8.1f} ms")
+        logging.warning('\n'.join(lines))
@@ -0,0 +1,126 @@
+from collections import OrderedDict
+from flask_login import UserMixin
+from sqlalchemy import event, select
+from sqlalchemy.orm import object_session
+import threading
+import time
+
+
+class CachedUser(UserMixin):
+    """What login-protected views need of a user, without the key columns.
+
+    Views that need the full row (keys, password hash) load it with
+    db.session.get(User, current_user.id).
+    """
+
+    def __init__(self, id, username, email, email_verified):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.email_verified = bool(email_verified)
+
+    def get_id(self):
+        return str(self.id)
+
+    def __repr__(self):
+        return f'<CachedUser {self.username}>'
+
+
+class UserLoaderCache:
+    """LRU + TTL cache behind the Flask-Login user loader.
+
+    Every ORM update or delete of a User drops its entry once the
+    transaction commits (verification, password reset, key rotation all
+    go through the ORM). Bulk UPDATE statements bypass mapper events and
+    must call invalidate() themselves; the TTL bounds staleness otherwise.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user_id -> (CachedUser, expires_at)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._listening = False
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('USER_CACHE_SIZE', self.maxsize)
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+        app.extensions['user_cache'] = self
+        self.clear()
+
+        if not self._listening:
+            from app.models import User
+            from app.utils.db_routing import RoutingSession
+            event.listen(User, 'after_update', self._mark_dirty)
+            event.listen(User, 'after_delete', self._mark_dirty)
+            event.listen(RoutingSession, 'after_commit', self._after_commit)
+            event.listen(RoutingSession, 'after_soft_rollback', self._after_rollback)
+            self._listening = True
+
+    # --- события ORM -----------------------------------------------------
+
+    def _mark_dirty(self, mapper, connection, target):
+        # Сразу сбрасываем, чтобы этот же процесс не прочёл старое значение,
+        # и ещё раз после commit — на случай чтения между flush и commit
+        self.invalidate(target.id)
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault('dirty_user_ids', set()).add(target.id)
+
+    def _after_commit(self, session):
+        for user_id in session.info.pop('dirty_user_ids', ()):
+            self.invalidate(user_id)
+
+    def _after_rollback(self, session, previous_transaction):
+        session.info.pop('dirty_user_ids', None)
+
+    # --- кэш ---------------------------------------------------------------
+
+    def load(self, user_id):
+        """CachedUser for user_id, from memory or one narrow SELECT"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                self._hits += 1
+                return entry[0]
+            self._misses += 1
+
+        from app import db
+        from app.models import User
+        row = db.session.execute(
+            select(User.id, User.username, User.email, User.email_verified)
+            .where(User.id == user_id)
+        ).first()
+        if row is None:
+            return None
+
+        user = CachedUser(*row)
+        with self._lock:
+            self._entries[user_id] = (user, now + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+            }
+
+
+user_cache = UserLoaderCache()
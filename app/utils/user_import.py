@@ -0,0 +1,241 @@
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+from werkzeug.security import generate_password_hash
+import csv
+import json
+import logging
+import os
+import secrets
+import time
+
+
+def read_user_records(path, fmt=None):
+    """(line number, record) pairs from a CSV (with a header row) or JSONL file.
+
+    A JSONL line that does not parse is yielded as its JSONDecodeError, so
+    validate_record reports it with its line number like any invalid row.
+    """
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            # Строка 1 — заголовок
+            for line_no, row in enumerate(csv.DictReader(f), start=2):
+                yield line_no, row
+        else:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    record = e
+                yield line_no, record
+
+
+def validate_record(record):
+    """Normalized (email, username, password) or an error string; same rules as /auth/register"""
+    from app.routes.auth import is_valid_email
+
+    if isinstance(record, json.JSONDecodeError):
+        return f'invalid JSON: {record.msg}'
+    if not isinstance(record, dict):
+        return 'row is not a JSON object'
+
+    email = (record.get('email') or '').strip().lower()
+    username = (record.get('username') or '').strip()
+    password = (record.get('password') or '').strip()
+
+    if not email or not username or not password:
+        return 'email, username and password are required'
+    if not is_valid_email(email):
+        return 'invalid email format'
+    if not 3 <= len(username) <= 20:
+        return 'username must be 3-20 characters long'
+    if len(password) < 6:
+        return 'password must be at least 6 characters long'
+    return email, username, password
+
+
+def generate_user_material(args):
+    """Password hash and Signal key material for one user (runs in a worker process)"""
+    password, store_path = args
+    from app.encryption.signal_protocol import SignalProtocol
+
+    signal = SignalProtocol(store_path)
+    identity_keys = signal.generate_identity_key_pair()
+    signing_keys = signal.generate_signing_key_pair()
+    signing_private_key = signal._deserialize_ed25519_private_key(signing_keys['private'])
+    signed_pre_key = signal.generate_signed_pre_key(signing_private_key)
+    return {
+        'password_hash': generate_password_hash(password),
+        'identity_key_public': identity_keys['public'],
+        'identity_key_private': identity_keys['private'],
+        'signing_key_public': signing_keys['public'],
+        'signing_key_private': signing_keys['private'],
+        'signed_pre_key_public': signed_pre_key['public'],
+        'signed_pre_key_private': signed_pre_key['private'],
+        'signed_pre_key_signature': signed_pre_key['signature'],
+    }
+
+
+def _existing(column, values, chunk_size):
+    """Values already present in a unique column, one IN query per chunk"""
+    from app import db
+    from sqlalchemy import select
+
+    values = list(values)
+    found = set()
+    for start in range(0, len(values), chunk_size):
+        found.update(db.session.scalars(
+            select(column).where(column.in_(values[start:start + chunk_size]))
+        ))
+    return found
+
+
+class UserImporter:
+    """Provision many users at once, the bulk counterpart of /auth/register.
+
+    Rows are validated and de-duplicated in memory, checked against the
+    database with set-based IN queries, hashed and given key material in a
+    process pool, inserted with executemany in chunks of chunk_size (one
+    commit per chunk), and sent verification emails over one SMTP
+    connection.
+    """
+
+    def __init__(self, workers=None, chunk_size=500, send_emails=True, verified=False):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.send_emails = send_emails and not verified
+        self.verified = verified
+        self.timings = {}
+        self.errors = []  # (line number, reason)
+        self._lines = {}  # email -> line number
+
+    def _phase(self, name, started):
+        self.timings[name] = time.perf_counter() - started
+        return time.perf_counter()
+
+    def prepare(self, records):
+        """Valid, unique (email, username, password) rows that are not in the database yet"""
+        from app.models import User
+
+        rows = []
+        emails, usernames = set(), set()
+        for line_no, record in records:
+            result = validate_record(record)
+            if isinstance(result, str):
+                self.errors.append((line_no, result))
+                continue
+            email, username, password = result
+            if email in emails or username in usernames:
+                self.errors.append((line_no, 'duplicate in file'))
+                continue
+            emails.add(email)
+            usernames.add(username)
+            rows.append((line_no, email, username, password))
+
+        taken_emails = _existing(User.email, emails, self.chunk_size)
+        taken_usernames = _existing(User.username, usernames, self.chunk_size)
+        fresh = []
+        for line_no, email, username, password in rows:
+            if email in taken_emails:
+                self.errors.append((line_no, 'email already registered'))
+            elif username in taken_usernames:
+                self.errors.append((line_no, 'username already taken'))
+            else:
+                fresh.append((line_no, email, username, password))
+        return fresh
+
+    def _insert_chunk(self, chunk):
+        from app import db
+        from app.models import User
+        from sqlalchemy import insert
+        from sqlalchemy.exc import IntegrityError
+
+        try:
+            db.session.execute(insert(User), chunk)
+            db.session.commit()
+            return chunk
+        except IntegrityError:
+            # Кто-то зарегистрировался параллельно: убираем конфликтующие строки и повторяем
+            db.session.rollback()
+            taken_emails = _existing(User.email, [r['email'] for r in chunk], self.chunk_size)
+            taken_usernames = _existing(User.username, [r['username'] for r in chunk], self.chunk_size)
+            remaining = [
+                r for r in chunk
+                if r['email'] not in taken_emails and r['username'] not in taken_usernames
+            ]
+            for row in chunk:
+                if row not in remaining:
+                    self.errors.append((self._lines[row['email']], 'registered concurrently'))
+            if remaining:
+                db.session.execute(insert(User), remaining)
+                db.session.commit()
+            return remaining
+
+    def send_verification_emails(self, users):
+        from flask import current_app
+        from app import mail
+        from app.routes.auth import build_verification_message
+
+        config = current_app.config
+        if not config.get('MAIL_USERNAME') or not config.get('MAIL_PASSWORD'):
+            logging.warning("Email credentials not configured, verification emails not sent")
+            return 0
+
+        sent = 0
+        base_url = config['BASE_URL'].rstrip('/')
+        with mail.connect() as connection:
+            for user in users:
+                url = f"{base_url}/auth/verify-page/{user['verification_token']}"
+                try:
+                    connection.send(build_verification_message(SimpleNamespace(**user), url))
+                    sent += 1
+                except Exception as e:
+                    logging.error(f"❌ Failed to send verification email to {user['email']}: {e}")
+        return sent
+
+    def run(self, records):
+        from flask import current_app
+
+        started = time.perf_counter()
+        phase = started
+        rows = self.prepare(records)
+        phase = self._phase('validate', phase)
+
+        store_path = current_app.config['SIGNAL_PROTOCOL_STORE']
+        jobs = [(password, store_path) for _, _, _, password in rows]
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            materials = list(pool.map(
+                generate_user_material, jobs,
+                chunksize=max(1, len(jobs) // (self.workers * 4))
+            ))
+        phase = self._phase('keys', phase)
+
+        users = []
+        for (line_no, email, username, _), material in zip(rows, materials):
+            self._lines[email] = line_no
+            users.append({
+                'email': email,
+                'username': username,
+                'email_verified': self.verified,
+                'verification_token': None if self.verified else secrets.token_urlsafe(32),
+                **material,
+            })
+
+        inserted = []
+        for start in range(0, len(users), self.chunk_size):
+            inserted.extend(self._insert_chunk(users[start:start + self.chunk_size]))
+        phase = self._phase('insert', phase)
+
+        emails_sent = self.send_verification_emails(inserted) if self.send_emails else 0
+        self._phase('email', phase)
+
+        elapsed = time.perf_counter() - started
+        return {
+            'imported': len(inserted),
+            'skipped': len(self.errors),
+            'emails_sent': emails_sent,
+            'seconds': elapsed,
+            'users_per_second': len(inserted) / elapsed if elapsed else 0.0,
+        }
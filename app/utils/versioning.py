@@ -0,0 +1,80 @@
+from collections import OrderedDict
+from flask import Response, jsonify, request
+import secrets
+import threading
+
+
+class Versions:
+    """Per-key version counters for cache keys and ETags.
+
+    A counter is bumped after every committed change of what it covers
+    (e.g. ('members', chat_id)). Counters live in the worker process and
+    start from zero, so ETags also carry a per-process epoch: a client
+    revalidating after a restart never matches a recycled version.
+    """
+
+    def __init__(self):
+        self.epoch = secrets.token_hex(4)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind, key):
+        return self._counters.get((kind, key), 0)
+
+    def bump(self, kind, *keys):
+        with self._lock:
+            for key in keys:
+                self._counters[(kind, key)] = self._counters.get((kind, key), 0) + 1
+
+    def etag(self, kind, key, version=None):
+        """ETag for a key; pass the version the payload was built for"""
+        if version is None:
+            version = self.get(kind, key)
+        return f"{kind}-{key}-{self.epoch}-{version}"
+
+
+class VersionedCache:
+    """Small LRU of computed payloads keyed by (key, version).
+
+    A version bump makes the old entry unreachable; it ages out of the LRU
+    instead of being deleted.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, version, compute):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        value = compute()
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+
+def conditional_json(etag, build_payload):
+    """304 when the client already has this ETag, else the JSON payload with it.
+
+    The ETag is weak: it names a version of the data, not the bytes, which
+    may differ between encodings or key order of the same version.
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build_payload())
+    response.set_etag(etag, weak=True)
+    # Данные пользователя: только кэш браузера, и всегда с ревалидацией
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+versions = Versions()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Load test for broadcast channels.
+
+Builds a channel with --members members (10k by default) on a fresh
+SQLite database and measures, in-process:
+
+  * the bulk add of all members (one transaction, statements issued)
+  * walking the whole member list in keyset pages
+  * single join/leave latency and statements per call
+  * message fan-out to --sockets connected clients, compared with a small
+    channel that has only the connected members, to show that send cost
+    does not depend on how many members the channel stores
+
+    python benchmarks/channel_load.py [--members 10000] [--sockets 200] [--messages 50]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def describe(values):
+    return (f"p50 {percentile(values, 50) * 1000:6.2f} ms, "
+            f"p99 {percentile(values, 99) * 1000:6.2f} ms over {len(values)}")
+
+
+def build_app(users):
+    from app import create_app, db
+    from app.models import User
+    from config import Config
+    from sqlalchemy import insert
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + tempfile.mktemp(suffix='.db')
+        METRICS_ENABLED = False
+        SECRET_KEY = 'bench'
+        # Один отправитель шлёт все сообщения подряд
+        SOCKET_RATE_LIMITS = {**Config.SOCKET_RATE_LIMITS, 'send_message': (10 ** 6, 10 ** 6)}
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(User), [
+            {'username': f'user{i}', 'email': f'user{i}@bench.local', 'password_hash': 'x'}
+            for i in range(1, users + 1)
+        ])
+        db.session.commit()
+    return app
+
+
+def create_channel(client, name, member_ids):
+    response = client.post('/chats/chats', json={
+        'name': name, 'is_channel': True, 'created_by': 1, 'user_ids': []
+    })
+    chat_id = response.get_json()['chat_id']
+
+    from app import db
+    from app.utils.membership import apply_membership_changes
+    from app.utils.query_budget import assert_max_queries
+
+    start = time.perf_counter()
+    with assert_max_queries(10 ** 6) as tracker:
+        apply_membership_changes(chat_id, add=member_ids)
+        db.session.commit()
+    return chat_id, time.perf_counter() - start, tracker.count
+
+
+def walk_pages(client, chat_id, limit):
+    latencies, total, after = [], 0, 0
+    while after is not None:
+        start = time.perf_counter()
+        body = client.get(f'/chats/chats/{chat_id}/members?after={after}&limit={limit}').get_json()
+        latencies.append(time.perf_counter() - start)
+        total += len(body['members'])
+        after = body['next_after']
+    return latencies, total
+
+
+def join_leave(client, chat_id, user_ids):
+    from app.utils.query_budget import assert_max_queries
+
+    joins, leaves, statements = [], [], []
+    for user_id in user_ids:
+        with assert_max_queries(10 ** 6) as tracker:
+            start = time.perf_counter()
+            client.post(f'/chats/chats/{chat_id}/join', json={'user_id': user_id})
+            joins.append(time.perf_counter() - start)
+        statements.append(tracker.count)
+    for user_id in user_ids:
+        start = time.perf_counter()
+        client.post(f'/chats/chats/{chat_id}/leave', json={'user_id': user_id})
+        leaves.append(time.perf_counter() - start)
+    return joins, leaves, statements
+
+
+def fan_out(app, chat_id, socket_user_ids, messages):
+    """Admin (user 1) sends `messages`; every connected member must get each one"""
+    from app import socketio
+    from app.sockets.auth import generate_socket_token
+
+    class Identity:
+        def __init__(self, user_id):
+            self.id, self.username = user_id, f'user{user_id}'
+
+    def connect(user_id):
+        with app.test_request_context():
+            token = generate_socket_token(Identity(user_id))
+        client = socketio.test_client(app, namespace='/chat', auth={'token': token})
+        client.emit('join_chat', {'chat_id': chat_id}, namespace='/chat')
+        client.get_received('/chat')
+        return client
+
+    sender = connect(1)
+    clients = [connect(user_id) for user_id in socket_user_ids]
+
+    latencies = []
+    for i in range(messages):
+        start = time.perf_counter()
+        sender.emit('send_message', {'chat_id': chat_id, 'content': f'broadcast {i}'}, namespace='/chat')
+        latencies.append(time.perf_counter() - start)
+
+    delivered = sum(
+        1 for client in clients for packet in client.get_received('/chat')
+        if packet['name'] == 'new_message'
+    )
+
+    # Не-админ не может писать, набор в канале не рассылается
+    clients[0].emit('send_message', {'chat_id': chat_id, 'content': 'nope'}, namespace='/chat')
+    rejected = any(p['name'] == 'error' for p in clients[0].get_received('/chat'))
+    sender.emit('typing', {'chat_id': chat_id, 'is_typing': True}, namespace='/chat')
+    typing_seen = any(p['name'] == 'user_typing' for p in clients[1].get_received('/chat'))
+
+    for client in [sender] + clients:
+        client.disconnect(namespace='/chat')
+    return latencies, delivered, rejected, typing_seen
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--members', type=int, default=10000)
+    parser.add_argument('--sockets', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--joins', type=int, default=200)
+    args = parser.parse_args()
+
+    sockets = min(args.sockets, args.members - 1)
+    app = build_app(args.members + args.joins)
+    client = app.test_client()
+
+    with app.app_context():
+        big, add_seconds, add_statements = create_channel(
+            client, 'big', list(range(2, args.members + 1)))
+        small, _, _ = create_channel(client, 'small', list(range(2, sockets + 2)))
+
+        print(f"bulk add {args.members - 1} members: {add_seconds:.2f}s, {add_statements} statements")
+
+    latencies, total = walk_pages(client, big, args.page_size)
+    print(f"member pages (limit {args.page_size}): {describe(latencies)}, {total} members listed")
+
+    joins, leaves, statements = join_leave(
+        client, big, list(range(args.members + 1, args.members + args.joins + 1)))
+    print(f"join:  {describe(joins)}, {max(statements)} statements max")
+    print(f"leave: {describe(leaves)}")
+
+    socket_users = list(range(2, sockets + 2))
+    for name, chat_id, members in (('small', small, sockets + 1), ('big', big, args.members)):
+        latencies, delivered, rejected, typing_seen = fan_out(app, chat_id, socket_users, args.messages)
+        print(f"send to {name} channel ({members} members, {sockets} sockets): {describe(latencies)}, "
+              f"delivered {delivered}/{sockets * args.messages}, "
+              f"non-admin rejected: {rejected}, typing broadcast: {typing_seen}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+CPU cost vs bytes saved of response compression.
+
+Builds real payloads on a temp SQLite database (a history page, the
+member list of a large group, a chat export stream and single
+new_message packets) and compresses each with gzip at several levels and
+brotli if it is installed. For new_message the packets are fed through
+one raw deflate stream, the way websocket permessage-deflate does.
+
+    python benchmarks/compression.py [--messages 500] [--repeat 200]
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import tempfile
+import time
+import zlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+def build_payloads(message_count):
+    from app import create_app, db
+    from app.models import Chat, ChatMember, Message, User
+    from config import Config
+    from sqlalchemy import insert
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + tempfile.mktemp(suffix='.db')
+        METRICS_ENABLED = False
+        COMPRESSION_ENABLED = False
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(User), [
+            {'username': f'user{i}', 'email': f'user{i}@bench.local', 'password_hash': 'x'}
+            for i in range(1, 51)
+        ])
+        chat = Chat(name='bench', is_group=True, created_by=1, member_count=50)
+        db.session.add(chat)
+        db.session.flush()
+        db.session.execute(insert(ChatMember), [
+            {'chat_id': chat.id, 'user_id': i, 'is_admin': i == 1} for i in range(1, 51)
+        ])
+        # Содержимое зашифровано на клиенте: случайные байты в base64
+        db.session.execute(insert(Message), [
+            {'chat_id': chat.id, 'user_id': i % 50 + 1, 'message_type': 'text',
+             'content': base64.b64encode(os.urandom(48 + i % 200)).decode()}
+            for i in range(message_count)
+        ])
+        db.session.commit()
+        chat_id = chat.id
+
+    client = app.test_client()
+    # Экспорт отдаётся только вошедшему участнику чата
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+    payloads = {
+        'history page (50)': client.get(f'/chats/chats/{chat_id}/messages?per_page=50').get_data(),
+        'members (50)': client.get(f'/chats/chats/{chat_id}/members').get_data(),
+        'chat list': client.get('/chats/chats?user_id=1').get_data(),
+        'export stream': client.get(f'/chats/chats/{chat_id}/export').get_data(),
+    }
+    history = json.loads(payloads['history page (50)'])['messages']
+    packets = [
+        ('42/chat,' + json.dumps(['new_message', dict(message, chat_id=chat_id)])).encode()
+        for message in history
+    ]
+    return payloads, packets
+
+
+def encoders():
+    from app.utils.compression import brotli
+
+    result = [(f'gzip-{level}', lambda data, level=level: zlib.compress(data, level))
+              for level in (1, 6, 9)]
+    if brotli is not None:
+        result += [(f'br-{quality}', lambda data, quality=quality: brotli.compress(data, quality=quality))
+                   for quality in (4, 11)]
+    return result
+
+
+def measure(compress, data, repeat):
+    started = time.process_time()
+    for _ in range(repeat):
+        out = compress(data)
+    return (time.process_time() - started) / repeat, len(out)
+
+
+def permessage_deflate(packets, repeat):
+    """Bytes and CPU per packet on one context-takeover deflate stream"""
+    total_in = sum(len(p) for p in packets)
+    started = time.process_time()
+    for _ in range(repeat):
+        stream = zlib.compressobj(6, zlib.DEFLATED, -15)
+        total_out = sum(len(stream.compress(p) + stream.flush(zlib.Z_SYNC_FLUSH)) for p in packets)
+    cpu = (time.process_time() - started) / repeat / len(packets)
+    return total_in / len(packets), total_out / len(packets), cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    payloads, packets = build_payloads(args.messages)
+
+    print(f"{'payload':<20} {'encoding':<8} {'bytes':>9} {'ratio':>6} {'cpu us':>8} {'saved/cpu':>12}")
+    for name, data in payloads.items():
+        print(f"{name:<20} {'identity':<8} {len(data):>9}")
+        for label, compress in encoders():
+            cpu, size = measure(compress, data, args.repeat)
+            saved_per_ms = (len(data) - size) / (cpu * 1000) if cpu else 0
+            print(f"{'':<20} {label:<8} {size:>9} {size / len(data):>6.2f} "
+                  f"{cpu * 1e6:>8.1f} {saved_per_ms:>9.0f} B/ms")
+
+    raw, compressed, cpu = permessage_deflate(packets, args.repeat)
+    print(f"\nnew_message, permessage-deflate: {raw:.0f} -> {compressed:.0f} bytes/packet "
+          f"({compressed / raw:.2f}), {cpu * 1e6:.1f} us/packet")
+
+
+if __name__ == '__main__':
+    main()
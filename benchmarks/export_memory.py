@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Peak memory of a streamed chat export.
+
+Seeds one chat with --messages messages and downloads
+GET /chats/chats/<id>/export through the test client, reading the body
+chunk by chunk the way a slow client would. Python allocations are traced
+with tracemalloc while the export runs; the peak should depend on
+EXPORT_BATCH_SIZE, not on the size of the chat. The same export of a
+tenth of the chat is measured first for comparison. A small export is
+also run with QUERY_TRACKING_ENABLED, whose request teardown runs twice
+around a streamed body.
+
+Exits 1 if an export loses messages, its peak exceeds --max-peak-mib or
+grows with the chat, a malformed resume token is not answered with 400,
+or the tracked export fails.
+
+    python benchmarks/export_memory.py [--messages 1000000] [--batch-size 1000]
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+def make_app(path, batch_size, tracking=False):
+    from app import create_app
+    from config import Config
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+        METRICS_ENABLED = False
+        EXPORT_BATCH_SIZE = batch_size
+        QUERY_TRACKING_ENABLED = tracking
+
+    return create_app(BenchConfig)
+
+
+def seed(app, chats):
+    """chats: {chat_id: message count}"""
+    from app import db
+    from app.models import Chat, ChatMember, Message, User
+    from sqlalchemy import insert
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(User), [
+            {'id': 1, 'username': 'exporter', 'email': 'exporter@bench.local', 'password_hash': 'x'}
+        ])
+        db.session.execute(insert(Chat), [
+            {'id': chat_id, 'name': f'export {chat_id}', 'is_group': True} for chat_id in chats
+        ])
+        db.session.execute(insert(ChatMember), [
+            {'chat_id': chat_id, 'user_id': 1} for chat_id in chats
+        ])
+        for chat_id, messages in chats.items():
+            for start in range(0, messages, 50000):
+                db.session.execute(insert(Message.__table__), [
+                    {'chat_id': chat_id, 'user_id': 1, 'content': f'message {i} ' + 'x' * 80}
+                    for i in range(start, min(start + 50000, messages))
+                ])
+        db.session.commit()
+
+
+def member_client(app):
+    """Test client logged in as user 1, a member of every seeded chat"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+    return client
+
+
+def export(app, chat_id):
+    """(lines, bytes, seconds, peak MiB) of one full export"""
+    client = member_client(app)
+    lines = size = 0
+    tracemalloc.start()
+    started = time.perf_counter()
+    response = client.get(f'/chats/chats/{chat_id}/export', buffered=False)
+    for chunk in response.response:
+        size += len(chunk)
+        lines += chunk.count(b'\n') if isinstance(chunk, bytes) else chunk.count('\n')
+    response.close()
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return lines, size, seconds, peak / 2 ** 20
+
+
+def check_tokens(app, chat_id):
+    """Resume tokens that are not objects, or carry fields of the wrong type,
+    must be a 400, not a 500"""
+    client = member_client(app)
+    bad = [json.dumps('1'), json.dumps([]), json.dumps({'chat_id': chat_id, 'since': 5})]
+    statuses = []
+    for payload in bad:
+        token = base64.urlsafe_b64encode(payload.encode()).decode()
+        statuses.append(client.get(f'/chats/chats/{chat_id}/export?resume={token}').status_code)
+    return statuses
+
+
+def check_tracked_export(batch_size):
+    """Status and line count of a 100-message export with query tracking on"""
+    path = tempfile.mktemp(suffix='.db')
+    app = make_app(path, batch_size, tracking=True)
+    seed(app, {1: 100})
+    try:
+        response = member_client(app).get('/chats/chats/1/export')
+        return response.status_code, len(response.get_data(as_text=True).splitlines())
+    finally:
+        os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--max-peak-mib', type=float, default=16,
+                        help='Fail if the traced peak of an export exceeds this (MiB).')
+    args = parser.parse_args()
+
+    path = tempfile.mktemp(suffix='.db')
+    app = make_app(path, args.batch_size)
+    small = max(1, args.messages // 10)
+    started = time.perf_counter()
+    seed(app, {1: small, 2: args.messages})
+    print(f"seeded {small + args.messages} messages in {time.perf_counter() - started:.1f}s")
+
+    problems = []
+    peaks = []
+    for chat_id, messages in ((1, small), (2, args.messages)):
+        lines, size, seconds, peak = export(app, chat_id)
+        peaks.append(peak)
+        # Последняя строка — итог с resume_token
+        print(f"{messages:>9} messages: {lines - 1} exported, {size / 2 ** 20:.0f} MiB "
+              f"in {seconds:.1f}s, peak traced memory {peak:.1f} MiB")
+        if lines - 1 != messages:
+            problems.append(f"chat of {messages} exported {lines - 1} messages")
+        if peak > args.max_peak_mib:
+            problems.append(f"peak {peak:.1f} MiB over {args.max_peak_mib} MiB")
+    # Десятикратно больший чат не должен заметно поднимать пик
+    if peaks[1] > peaks[0] * 1.5 + 1:
+        problems.append(f"peak grew with chat size: {peaks[0]:.1f} -> {peaks[1]:.1f} MiB")
+
+    statuses = check_tokens(app, 2)
+    print(f"malformed resume tokens: {statuses}")
+    if any(status != 400 for status in statuses):
+        problems.append(f"malformed resume tokens answered {statuses}, expected 400")
+    os.remove(path)
+
+    status, lines = check_tracked_export(args.batch_size)
+    print(f"export with query tracking: status {status}, {lines - 1} messages")
+    if (status, lines - 1) != (200, 100):
+        problems.append(f"export with query tracking: status {status}, {lines - 1} messages")
+
+    print(f"problems: {problems or 'none'}")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Message shards: routing, concurrent writes and an online move.
+
+Runs against fresh SQLite files, with --shards extra message stores
+(MESSAGE_SHARDS) next to the primary:
+
+  * routing: chats created over HTTP are spread over the shards; a socket
+    send, the history page, the chat list, sync and export of every chat
+    must see the same messages
+  * writes: --threads writers, each in its own chat, insert + commit for
+    --seconds, once with a single message table and once with the chats
+    on different shards
+  * processes: --processes processes send to the chats of one shard
+    at once; ids must be unique and follow commit order in every chat
+  * move: a chat with --messages messages is moved to another shard by
+    app.utils.sharding.move_chat while a writer keeps sending to it; every
+    accepted message must end up on the target and none on the source
+  * move away and back: two chats share a shard; the one with the newest
+    ids moves away, the other gets a message and then moves to the same
+    target. The new id must not repeat a moved one and both moves must
+    finish with the directory settled
+
+    python benchmarks/message_shards.py [--shards 3] [--threads 4] [--processes 4] [--messages 50000]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def make_app(paths):
+    """App on the given primary and shard files"""
+    from app import create_app
+    from config import Config
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + paths[0]
+        MESSAGE_SHARDS = ['sqlite:///' + path for path in paths[1:]]
+        MESSAGE_SHARD_DIRECTORY_TTL = 0.5
+        SQLITE_PRODUCTION = True
+        METRICS_ENABLED = False
+        NOTIFY_OFFLINE_ENABLED = False
+        SECRET_KEY = 'bench'
+        SOCKET_RATE_LIMITS = {**Config.SOCKET_RATE_LIMITS, 'send_message': (10 ** 6, 10 ** 6)}
+
+    return create_app(BenchConfig)
+
+
+def build_app(paths, users=10):
+    from app import db
+    from app.models import User
+    from app.utils.sharding import message_shards
+    from sqlalchemy import insert
+
+    app = make_app(paths)
+    with app.app_context():
+        db.create_all()
+        message_shards.ensure_schema()
+        db.session.execute(insert(User), [
+            {'username': f'user{i}', 'email': f'user{i}@bench.local', 'password_hash': 'x'}
+            for i in range(1, users + 1)
+        ])
+        db.session.commit()
+    return app
+
+
+def check_routing(app, chats):
+    from app import socketio
+    from app.sockets.auth import generate_socket_token
+    from app.utils.sharding import message_shards
+
+    class Identity:
+        id, username = 1, 'user1'
+
+    client = app.test_client()
+    # Экспорт отдаётся только вошедшему участнику чата
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+    chat_ids = [
+        client.post('/chats/chats', json={'name': f'c{i}', 'is_group': True, 'created_by': 1,
+                                          'user_ids': [2]}).get_json()['chat_id']
+        for i in range(chats)
+    ]
+    with app.test_request_context():
+        token = generate_socket_token(Identity())
+    sock = socketio.test_client(app, namespace='/chat', auth={'token': token})
+    for chat_id in chat_ids:
+        sock.emit('join_chat', {'chat_id': chat_id}, namespace='/chat')
+        for i in range(3):
+            sock.emit('send_message', {'chat_id': chat_id, 'content': f'{chat_id}:{i}'}, namespace='/chat')
+    sent = [p['args'][0] for p in sock.get_received('/chat') if p['name'] == 'new_message']
+    sock.disconnect(namespace='/chat')
+
+    with app.app_context():
+        placement = message_shards.group(chat_ids)
+    problems = []
+    for chat_id in chat_ids:
+        expected = [m['id'] for m in sent if m['chat_id'] == chat_id]
+        page = client.get(f'/chats/chats/{chat_id}/messages').get_json()
+        if sorted(m['id'] for m in page['messages']) != sorted(expected):
+            problems.append(f'page {chat_id}')
+        lines = client.get(f'/chats/chats/{chat_id}/export').get_data(as_text=True).splitlines()
+        if [json.loads(line)['id'] for line in lines[:-1]] != expected:
+            problems.append(f'export {chat_id}')
+    synced = client.post('/chats/chats/sync', json={
+        'user_id': 1, 'chats': {str(chat_id): 0 for chat_id in chat_ids}
+    }).get_json()['chats']
+    if sum(len(entry['messages']) for entry in synced.values()) != len(sent):
+        problems.append('sync')
+    listed = client.get('/chats/chats?user_id=1').get_json()['chats']
+    if any(chat['last_message']['content'] != f"{chat['id']}:2" for chat in listed):
+        problems.append('chat list')
+    shards = {shard: len(ids) for shard, ids in placement.items()}
+    print(f"routing: {len(chat_ids)} chats over shards {shards}, {len(sent)} messages sent, "
+          f"problems: {problems or 'none'}")
+
+
+def write_throughput(app, chat_ids, seconds):
+    """Commits per second of one writer thread per chat"""
+    from app import db
+    from app.utils.sharding import message_shards
+
+    stop = threading.Event()
+    counts, latencies = [0] * len(chat_ids), []
+
+    def writer(index, chat_id):
+        with app.app_context():
+            while not stop.is_set():
+                start = time.perf_counter()
+                message_shards.insert_message(chat_id, user_id=1, content='x' * 200)
+                db.session.commit()
+                latencies.append(time.perf_counter() - start)
+                counts[index] += 1
+
+    threads = [threading.Thread(target=writer, args=(i, chat_id)) for i, chat_id in enumerate(chat_ids)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / seconds, latencies
+
+
+def compare_writes(app, threads, seconds):
+    from app import db
+    from app.models import Chat, ChatShard
+    from app.utils.sharding import message_shards
+
+    with app.app_context():
+        chats = [Chat(name=f'w{i}', is_group=True, created_by=1) for i in range(2 * threads)]
+        db.session.add_all(chats)
+        db.session.flush()
+        single = [chat.id for chat in chats[:threads]]
+        spread = [chat.id for chat in chats[threads:]]
+        for i, chat_id in enumerate(spread):
+            db.session.add(ChatShard(chat_id=chat_id, shard=i % message_shards.count, frozen=False))
+        db.session.commit()
+
+    for name, chat_ids in (('one table', single), (f'{message_shards.count} shards', spread)):
+        rate, latencies = write_throughput(app, chat_ids, seconds)
+        print(f"writes, {threads} threads, {name}: {rate:.0f} commits/s, "
+              f"p50 {percentile(latencies, 50) * 1000:.2f} ms, p99 {percentile(latencies, 99) * 1000:.2f} ms")
+
+
+def child(args):
+    """Send to the given chats round-robin for --seconds, one commit each.
+    Prints "sent id started committed" per message (wall clock)."""
+    from app import db
+    from app.utils.sharding import message_shards
+
+    app = make_app(args.child.split(','))
+    chat_ids = [int(chat_id) for chat_id in args.chats_of_child.split(',')]
+    deadline = time.monotonic() + args.seconds
+    sent = 0
+    with app.app_context():
+        while time.monotonic() < deadline:
+            started = time.time()
+            message_id, _ = message_shards.insert_message(
+                chat_ids[sent % len(chat_ids)], user_id=1, content=str(os.getpid()))
+            db.session.commit()
+            print('sent', message_id, started, time.time())
+            sent += 1
+
+
+def concurrent_processes(app, paths, processes, seconds):
+    """Several processes send to the same chats of one shard"""
+    from app import db
+    from app.models import Chat, ChatShard, Message
+    from sqlalchemy import func, select
+
+    with app.app_context():
+        chats = [Chat(name=f'p{i}', is_group=True, created_by=1) for i in range(4)]
+        db.session.add_all(chats)
+        db.session.flush()
+        chat_ids = [chat.id for chat in chats]
+        for chat_id in chat_ids:
+            db.session.add(ChatShard(chat_id=chat_id, shard=1, frozen=False))
+        db.session.commit()
+
+    argv = [sys.executable, os.path.abspath(__file__), '--child', ','.join(paths),
+            '--chats-of-child', ','.join(map(str, chat_ids)), '--seconds', str(seconds)]
+    procs = [subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+             for _ in range(processes)]
+    sends = [
+        (int(message_id), float(started), float(committed))
+        for proc in procs for _, message_id, started, committed in
+        (line.split() for line in proc.communicate()[0].splitlines() if line.startswith('sent '))
+    ]
+    failed = sum(1 for proc in procs if proc.returncode)
+
+    from app.utils.sharding import message_shards
+    with app.app_context():
+        stored = message_shards.session(shard=1).scalar(
+            select(func.count()).select_from(Message).where(Message.chat_id.in_(chat_ids)))
+
+    # Сообщение, начатое после commit другого, должно получить больший id:
+    # иначе курсор `id > last_seen` его пропустит
+    out_of_order = 0
+    first_commit = float('inf')
+    for message_id, started, committed in sorted(sends, reverse=True):
+        if started > first_commit:
+            out_of_order += 1
+        first_commit = min(first_commit, committed)
+    unique = len({message_id for message_id, _, _ in sends})
+    print(f"{processes} processes, one shard: {len(sends)} sends, {stored} stored, {unique} unique ids, "
+          f"{out_of_order} behind an earlier commit, {failed} processes failed")
+    return not failed and unique == stored == len(sends) and not out_of_order
+
+
+def online_move(app, messages, batch_size):
+    from app import db
+    from app.models import Chat, Message
+    from app.utils.sharding import ChatMoving, message_shards, move_chat
+    from sqlalchemy import func, select
+
+    with app.app_context():
+        chat = Chat(name='moving', is_group=True, created_by=1)
+        db.session.add(chat)
+        db.session.flush()
+        chat_id = chat.id
+        message_shards.place(chat_id)
+        db.session.commit()
+        source = message_shards.shard_of(chat_id)
+        target = (source + 1) % message_shards.count
+        for i in range(messages):
+            message_shards.insert_message(chat_id, user_id=1, content=f'seed {i}')
+            if i % 10000 == 9999:
+                db.session.commit()
+        db.session.commit()
+
+    stop = threading.Event()
+    accepted, refused, latencies = [], [0], []
+
+    def writer():
+        with app.app_context():
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    message_id, _ = message_shards.insert_message(chat_id, user_id=1, content='live')
+                    db.session.commit()
+                    accepted.append(message_id)
+                    latencies.append(time.perf_counter() - start)
+                except ChatMoving:
+                    refused[0] += 1
+                    time.sleep(0.05)
+                time.sleep(0.002)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    time.sleep(0.2)
+    with app.app_context():
+        stats = move_chat(chat_id, target, batch_size=batch_size, pause=0.005)
+    time.sleep(0.2)
+    stop.set()
+    thread.join()
+
+    with app.app_context():
+        counted = select(func.count()).select_from(Message).where(Message.chat_id == chat_id)
+        on_target = message_shards.session(shard=target).scalar(counted)
+        on_source = message_shards.session(shard=source).scalar(counted)
+        live = set(message_shards.session(shard=target).execute(
+            select(Message.id).where(Message.chat_id == chat_id, Message.content == 'live')
+        ).scalars())
+    lost = len(set(accepted) - live)
+    print(f"move {messages} messages shard {source} -> {target}: {stats['seconds']:.2f}s, "
+          f"writes refused for {stats['frozen_seconds']:.2f}s ({refused[0]} attempts); "
+          f"live sends {len(accepted)}, p99 {percentile(latencies, 99) * 1000:.1f} ms; "
+          f"target {on_target}/{messages + len(accepted)}, source {on_source}, lost {lost}")
+    return lost == 0 and on_source == 0
+
+
+def move_twice(app):
+    from app import db
+    from app.models import Chat, ChatShard, Message
+    from app.utils.sharding import message_shards, move_chat
+    from sqlalchemy import select
+
+    with app.app_context():
+        chats = [Chat(name=f'm{i}', is_group=True, created_by=1) for i in range(2)]
+        db.session.add_all(chats)
+        db.session.flush()
+        stays, leaves = [chat.id for chat in chats]
+        for chat_id in (stays, leaves):
+            db.session.add(ChatShard(chat_id=chat_id, shard=0, frozen=False))
+        db.session.commit()
+        for chat_id in (stays, leaves, leaves):
+            message_shards.insert_message(chat_id, user_id=1, content='before')
+            db.session.commit()
+
+    problems = []
+    with app.app_context():
+        moved = set(message_shards.session(shard=0).scalars(
+            select(Message.id).where(Message.chat_id == leaves)))
+        move_chat(leaves, 1, pause=0)
+        new_id, _ = message_shards.insert_message(stays, user_id=1, content='after')
+        db.session.commit()
+        if new_id in moved:
+            problems.append(f'id {new_id} reissued')
+        try:
+            move_chat(stays, 1, pause=0)
+        except Exception as e:
+            problems.append(f'second move: {type(e).__name__}: {e}')
+        db.session.expire_all()
+        for chat_id in (stays, leaves):
+            row = db.session.get(ChatShard, chat_id)
+            if row.shard != 1 or row.target is not None or row.frozen:
+                problems.append(f'chat {chat_id} directory {row.shard}/{row.target}/{row.frozen}')
+    print(f"move away, send to the source, move again: problems: {problems or 'none'}")
+    return not problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--shards', type=int, default=3)
+    parser.add_argument('--chats', type=int, default=12)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--chats-of-child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args)
+
+    paths = [tempfile.mktemp(suffix='.db') for _ in range(args.shards + 1)]
+    app = build_app(paths)
+    check_routing(app, args.chats)
+    compare_writes(app, args.threads, args.seconds)
+    ok = concurrent_processes(app, paths, args.processes, args.seconds)
+    ok = move_twice(app) and ok
+    return 0 if online_move(app, args.messages, args.batch_size) and ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Live write latency while expired messages are purged.
+
+Seeds --messages expired messages over --chats chats. It then purges
+them twice on fresh copies while a writer thread keeps inserting
+messages (insert + commit, like on_send_message):
+
+  * single:  one DELETE ... WHERE timestamp < cutoff
+  * batched: app.utils.retention.purge_expired_messages
+
+and reports purge time and the writer's latency percentiles and worst case.
+
+    python benchmarks/retention_purge.py [--messages 200000] [--chats 50] [--batch-size 500]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def seed(path, messages, chats):
+    from app import create_app, db
+    from app.models import Chat, Message
+    from config import Config
+    from sqlalchemy import insert
+
+    class SeedConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+        METRICS_ENABLED = False
+
+    app = create_app(SeedConfig)
+    old = datetime.utcnow() - timedelta(days=30)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(Chat), [{'id': i, 'name': f'c{i}', 'is_group': True} for i in range(1, chats + 1)])
+        for start in range(0, messages, 50000):
+            db.session.execute(insert(Message), [
+                {'chat_id': i % chats + 1, 'user_id': 1, 'content': f'old {i}', 'timestamp': old}
+                for i in range(start, min(start + 50000, messages))
+            ])
+        db.session.commit()
+
+
+def run(path, mode, batch_size, pause):
+    from app import create_app, db
+    from app.models import Message
+    from config import Config
+    from sqlalchemy import delete
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+        METRICS_ENABLED = False
+        MESSAGE_RETENTION_DAYS = 7
+
+    app = create_app(BenchConfig)
+    stop = threading.Event()
+    latencies, errors = [], []
+
+    def writer():
+        with app.app_context():
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    db.session.add(Message(chat_id=1, user_id=1, content='live'))
+                    db.session.commit()
+                    latencies.append(time.perf_counter() - start)
+                except Exception as e:
+                    db.session.rollback()
+                    errors.append(type(e).__name__)
+                time.sleep(0.005)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    time.sleep(0.2)
+
+    started = time.perf_counter()
+    with app.app_context():
+        if mode == 'single':
+            cutoff = datetime.utcnow() - timedelta(days=7)
+            deleted = db.session.execute(delete(Message).where(Message.timestamp < cutoff)).rowcount
+            db.session.commit()
+        else:
+            from app.utils.retention import purge_expired_messages
+            deleted = purge_expired_messages(batch_size=batch_size, pause=pause)['messages']
+    purge_seconds = time.perf_counter() - started
+
+    stop.set()
+    thread.join()
+    return deleted, purge_seconds, latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--pause', type=float, default=0.05)
+    args = parser.parse_args()
+
+    template = tempfile.mktemp(suffix='.db')
+    seed(template, args.messages, args.chats)
+
+    for mode in ('single', 'batched'):
+        path = tempfile.mktemp(suffix='.db')
+        shutil.copy(template, path)
+        deleted, seconds, latencies, errors = run(path, mode, args.batch_size, args.pause)
+        print(f"{mode:<8} deleted {deleted} in {seconds:.2f}s; writes during purge: {len(latencies)}, "
+              f"p50 {percentile(latencies, 50) * 1000:.1f} ms, p99 {percentile(latencies, 99) * 1000:.1f} ms, "
+              f"max {max(latencies, default=0) * 1000:.0f} ms, errors {len(errors)}")
+        os.remove(path)
+    os.remove(template)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Several scheduler processes against one database.
+
+Starts --processes processes that each poll a shared SQLite file for
+--seconds. A test job runs every --interval seconds and takes --work
+seconds. Afterwards it checks from job_run that no two runs overlapped
+and that runs were not duplicated (at most one per interval), and shows
+how runs were spread across processes.
+
+    python benchmarks/scheduler_processes.py [--processes 4] [--seconds 20] [--interval 1]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+def make_app(db_path, tick):
+    from app import create_app
+    from config import Config
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + db_path
+        METRICS_ENABLED = False
+        SCHEDULER_TICK = tick
+
+    return create_app(BenchConfig)
+
+
+def child(args):
+    import threading
+    from app.utils import jobs  # noqa: F401
+    from app.utils.scheduler import scheduler
+
+    # Только тестовая задача: обслуживание здесь не нужно
+    scheduler.jobs.clear()
+
+    @scheduler.job('bench_job', interval=args.interval, jitter=0.05, lease_seconds=30)
+    def bench_job(app):
+        time.sleep(args.work)
+        return os.getpid()
+
+    app = make_app(args.child, args.tick)
+    stop = threading.Event()
+    threading.Timer(args.seconds, stop.set).start()
+    scheduler.loop(stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--interval', type=float, default=1.0)
+    parser.add_argument('--work', type=float, default=0.2)
+    parser.add_argument('--tick', type=float, default=0.2)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args)
+
+    db_path = tempfile.mktemp(suffix='.db')
+    app = make_app(db_path, args.tick)
+    from app import db
+    with app.app_context():
+        db.create_all()
+
+    argv = [sys.executable, os.path.abspath(__file__), '--child', db_path,
+            '--seconds', str(args.seconds), '--interval', str(args.interval),
+            '--work', str(args.work), '--tick', str(args.tick)]
+    procs = [subprocess.Popen(argv, stdout=subprocess.DEVNULL) for _ in range(args.processes)]
+    for proc in procs:
+        proc.wait()
+
+    from app.models import JobRun
+    from sqlalchemy import select
+    with app.app_context():
+        runs = db.session.scalars(
+            select(JobRun).where(JobRun.job == 'bench_job').order_by(JobRun.started_at)
+        ).all()
+
+    overlaps = sum(
+        1 for previous, run in zip(runs, runs[1:])
+        if run.started_at < previous.started_at + timedelta(seconds=previous.duration)
+    )
+    gaps = [(run.started_at - previous.started_at).total_seconds() for previous, run in zip(runs, runs[1:])]
+    expected = args.seconds / (args.interval + args.work)
+    by_owner = Counter(run.owner.split(':')[1] for run in runs)
+
+    print(f"{args.processes} processes, {args.seconds:.0f}s, interval {args.interval}s, work {args.work}s")
+    print(f"runs: {len(runs)} (about {expected:.0f} expected), overlapping: {overlaps}, "
+          f"failed: {sum(run.status != 'ok' for run in runs)}")
+    if gaps:
+        print(f"gap between starts: min {min(gaps):.2f}s, max {max(gaps):.2f}s")
+    print("runs per process (pid):", dict(by_owner))
+    os.remove(db_path)
+    return 1 if overlaps else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
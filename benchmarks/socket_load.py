@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Socket.IO load generator for the /chat namespace.
+
+Simulates N authenticated clients in M group chats running the same flow
+as app/static/js/app.js (join_chat, typing, send_message) and measures
+send -> new_message latency, throughput and errors. The report is written
+as JSON so runs can be compared across commits.
+
+    # start a throwaway server on a temp database and load it
+    python benchmarks/socket_load.py --spawn --clients 50 --chats 5 --messages 20
+
+    # against an already running server
+    python benchmarks/socket_load.py --url http://localhost:5000 --clients 50
+
+    # compare with an earlier report
+    python benchmarks/socket_load.py --spawn --compare benchmarks/reports/<old>.json
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MAX_GROUP_SIZE = 50
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'p50_ms': _ms(percentile(values, 50)),
+        'p90_ms': _ms(percentile(values, 90)),
+        'p99_ms': _ms(percentile(values, 99)),
+        'max_ms': _ms(max(values) if values else None),
+    }
+
+
+def _ms(value):
+    return round(value * 1000, 3) if value is not None else None
+
+
+# --- server ---------------------------------------------------------------
+
+def serve(port, database):
+    """Run the app on a temp database (used by --spawn)"""
+    os.chdir(ROOT)
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+    # Без почтовых учеток регистрация сразу подтверждает email
+    os.environ['MAIL_USERNAME'] = ''
+    os.environ['MAIL_PASSWORD'] = ''
+
+    from app import create_app, db, socketio
+    from config import Config
+
+    app = create_app(Config)
+    with app.app_context():
+        db.create_all()
+    socketio.run(app, host='127.0.0.1', port=port, debug=False,
+                 use_reloader=False, allow_unsafe_werkzeug=True, log_output=False)
+
+
+def spawn_server(port):
+    database = tempfile.mktemp(suffix='.db')
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', str(port), '--database', database],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f'http://127.0.0.1:{port}'
+
+    import requests
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(url + '/favicon.ico', timeout=1)
+            return process, url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('Server did not start within 30 seconds')
+
+
+# --- clients --------------------------------------------------------------
+
+class LoadClient:
+    """One simulated user: HTTP login plus a Socket.IO connection"""
+
+    def __init__(self, url, index, run_id, stats, transports):
+        self.url = url
+        self.index = index
+        self.username = f'ld{run_id}{index}'[:20]
+        self.email = f'{self.username}@load.test'
+        self.stats = stats
+        self.transports = transports
+        self.user_id = None
+        self.token = None
+        self.chat_ids = []
+        self.sio = None
+
+    def register_and_login(self, http):
+        response = http.post(f'{self.url}/auth/register', json={
+            'email': self.email, 'username': self.username, 'password': 'load-test'
+        })
+        if response.status_code != 201:
+            raise RuntimeError(f'register failed: {response.status_code} {response.text[:200]}')
+
+        response = http.post(f'{self.url}/auth/login', json={'email': self.email})
+        if response.status_code != 200:
+            raise RuntimeError(f'login failed: {response.status_code} {response.text[:200]}')
+        data = response.json()
+        self.user_id = data['user_id']
+        self.token = data['socket_token']
+
+    def connect(self):
+        import socketio
+
+        self.sio = socketio.Client(reconnection=False)
+        joined = threading.Event()
+        pending_joins = set(self.chat_ids)
+
+        @self.sio.on('join_success', namespace='/chat')
+        def on_join_success(data):
+            pending_joins.discard(data['chat_id'])
+            if not pending_joins:
+                joined.set()
+
+        @self.sio.on('new_message', namespace='/chat')
+        def on_new_message(data):
+            received = time.perf_counter()
+            try:
+                payload = json.loads(data['content'])
+            except (TypeError, ValueError):
+                return
+            if 'sent_at' not in payload:
+                return
+            latency = received - payload['sent_at']
+            if data['user_id'] == self.user_id:
+                self.stats.record('echo', latency)
+            else:
+                self.stats.record('fanout', latency)
+
+        @self.sio.on('error', namespace='/chat')
+        def on_error(data):
+            self.stats.error('server_error')
+
+        @self.sio.on('rate_limited', namespace='/chat')
+        def on_rate_limited(data):
+            self.stats.error('rate_limited')
+
+        self.sio.connect(self.url, namespaces=['/chat'], auth={'token': self.token},
+                         transports=self.transports, wait_timeout=10)
+        for chat_id in self.chat_ids:
+            self.sio.emit('join_chat', {'chat_id': chat_id, 'user_id': self.user_id}, namespace='/chat')
+        if not joined.wait(10):
+            self.stats.error('join_timeout')
+
+    def run(self, messages, interval):
+        for _ in range(messages):
+            chat_id = random.choice(self.chat_ids)
+            self.sio.emit('typing', {'chat_id': chat_id, 'is_typing': True}, namespace='/chat')
+            content = json.dumps({'sent_at': time.perf_counter(), 'pad': 'x' * 64})
+            self.sio.emit('send_message', {
+                'chat_id': chat_id, 'user_id': self.user_id, 'content': content, 'type': 'text'
+            }, namespace='/chat')
+            self.stats.sent()
+            time.sleep(interval * random.uniform(0.5, 1.5))
+
+    def close(self):
+        if self.sio is not None and self.sio.connected:
+            self.sio.disconnect()
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {'echo': [], 'fanout': []}
+        self.errors = {}
+        self.messages_sent = 0
+
+    def record(self, kind, latency):
+        with self.lock:
+            self.latencies[kind].append(latency)
+
+    def error(self, kind):
+        with self.lock:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def sent(self):
+        with self.lock:
+            self.messages_sent += 1
+
+
+# --- driver ---------------------------------------------------------------
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_load(args):
+    import requests
+
+    stats = Stats()
+    run_id = uuid.uuid4().hex[:6]
+    transports = args.transport.split(',') if args.transport else None
+    http = requests.Session()
+
+    clients = [LoadClient(args.url, i, run_id, stats, transports) for i in range(args.clients)]
+    for client in clients:
+        client.register_and_login(http)
+
+    # Раскладываем клиентов по чатам по кругу; создатель — первый участник
+    groups = [clients[i::args.chats] for i in range(args.chats)]
+    expected_deliveries = 0
+    for number, group in enumerate(groups):
+        if not group:
+            continue
+        if len(group) > MAX_GROUP_SIZE:
+            raise SystemExit(f'{len(group)} clients per chat exceeds the group limit of {MAX_GROUP_SIZE}')
+        response = http.post(f'{args.url}/chats/chats', json={
+            'name': f'load-{run_id}-{number}',
+            'is_group': True,
+            'created_by': group[0].user_id,
+            'user_ids': [client.user_id for client in group[1:]],
+        })
+        if response.status_code != 201:
+            raise RuntimeError(f'create chat failed: {response.status_code} {response.text[:200]}')
+        chat_id = response.json()['chat_id']
+        for client in group:
+            client.chat_ids.append(chat_id)
+        expected_deliveries += len(group) * len(group) * args.messages
+
+    connect_started = time.perf_counter()
+    for client in clients:
+        try:
+            client.connect()
+        except Exception:
+            stats.error('connect_failed')
+    connect_seconds = time.perf_counter() - connect_started
+
+    connected = [client for client in clients if client.sio and client.sio.connected]
+    workers = [threading.Thread(target=client.run, args=(args.messages, args.interval)) for client in connected]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    # Ждем доставку хвоста
+    deadline = time.time() + args.drain
+    while time.time() < deadline:
+        with stats.lock:
+            delivered = len(stats.latencies['echo']) + len(stats.latencies['fanout'])
+        if delivered >= expected_deliveries:
+            break
+        time.sleep(0.1)
+    elapsed = time.perf_counter() - started
+
+    for client in clients:
+        client.close()
+
+    delivered = len(stats.latencies['echo']) + len(stats.latencies['fanout'])
+    return {
+        'revision': git_revision(),
+        'created_at': datetime.utcnow().isoformat(),
+        'config': {
+            'clients': args.clients, 'chats': args.chats, 'messages_per_client': args.messages,
+            'interval': args.interval, 'transport': args.transport or 'default',
+        },
+        'connected_clients': len(connected),
+        'connect_seconds': round(connect_seconds, 3),
+        'duration_seconds': round(elapsed, 3),
+        'messages_sent': stats.messages_sent,
+        'deliveries': delivered,
+        'expected_deliveries': expected_deliveries,
+        'lost_deliveries': max(0, expected_deliveries - delivered),
+        'send_throughput_per_s': round(stats.messages_sent / elapsed, 2) if elapsed else None,
+        'delivery_throughput_per_s': round(delivered / elapsed, 2) if elapsed else None,
+        'latency_echo': summarize(stats.latencies['echo']),
+        'latency_fanout': summarize(stats.latencies['fanout']),
+        'errors': stats.errors,
+    }
+
+
+def compare(report, baseline):
+    rows = [
+        ('send_throughput_per_s', 'send/s'),
+        ('delivery_throughput_per_s', 'deliveries/s'),
+        ('lost_deliveries', 'lost'),
+    ]
+    print(f"\nvs {baseline.get('revision')} ({baseline.get('created_at')}):")
+    for key, label in rows:
+        print(f"  {label:14} {baseline.get(key)} -> {report.get(key)}")
+    for kind in ('latency_echo', 'latency_fanout'):
+        for pct in ('p50_ms', 'p90_ms', 'p99_ms'):
+            print(f"  {kind[8:]:6} {pct:7} {baseline[kind].get(pct)} -> {report[kind].get(pct)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--spawn', action='store_true', help='start a local server on a temp database')
+    parser.add_argument('--port', type=int, default=5055, help='port for --spawn')
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--chats', type=int, default=4)
+    parser.add_argument('--messages', type=int, default=10, help='messages per client')
+    parser.add_argument('--interval', type=float, default=0.5, help='mean seconds between sends')
+    parser.add_argument('--transport', default=None, help='e.g. "websocket" or "polling"')
+    parser.add_argument('--drain', type=float, default=10, help='seconds to wait for in-flight deliveries')
+    parser.add_argument('--output', default=None, help='report path (default benchmarks/reports/...)')
+    parser.add_argument('--compare', default=None, help='earlier report to diff against')
+    parser.add_argument('--serve', type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--database', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.database)
+        return
+
+    server = None
+    if args.spawn:
+        server, args.url = spawn_server(args.port)
+    try:
+        report = run_load(args)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    output = args.output or os.path.join(
+        ROOT, 'benchmarks', 'reports',
+        f"socket_load-{report['revision'] or 'local'}-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print(json.dumps(report, indent=2))
+    print(f"\nReport written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Concurrent read/write benchmark for the SQLite profiles.
+
+Runs writer threads (insert + commit, like on_send_message) and reader
+threads (newest history page + count, like get_chat_messages) against a
+fresh database file, once with the default configuration and once with
+SQLITE_PRODUCTION, and reports throughput, latency and lock errors.
+
+    python benchmarks/sqlite_concurrency.py [--writers 8] [--readers 16] [--seconds 10]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def build_app(production):
+    from app import create_app, db
+    from app.models import Chat, Message
+    from config import Config
+    from sqlalchemy import insert
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + tempfile.mktemp(suffix='.db')
+        SQLITE_PRODUCTION = production
+        METRICS_ENABLED = False
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Chat(id=1, name='bench', is_group=True))
+        db.session.execute(insert(Message), [
+            {'chat_id': 1, 'user_id': 1, 'content': f'seed {i}'} for i in range(2000)
+        ])
+        db.session.commit()
+    return app
+
+
+def run(app, writers, readers, seconds):
+    from app import db
+    from app.models import Message
+
+    stop = threading.Event()
+    results = {'write': [], 'read': []}
+    errors = {'write': {}, 'read': {}}
+    lock = threading.Lock()
+
+    def write_loop():
+        with app.app_context():
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    db.session.add(Message(chat_id=1, user_id=1, content='x' * 200))
+                    db.session.commit()
+                    kind = 'ok'
+                except Exception as e:
+                    db.session.rollback()
+                    kind = type(e).__name__
+                finally:
+                    db.session.remove()
+                with lock:
+                    if kind == 'ok':
+                        results['write'].append(time.perf_counter() - start)
+                    else:
+                        errors['write'][kind] = errors['write'].get(kind, 0) + 1
+
+    def read_loop():
+        with app.app_context():
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    Message.query.filter_by(chat_id=1)\
+                        .order_by(Message.timestamp.desc(), Message.id.desc())\
+                        .paginate(page=1, per_page=50, error_out=False)
+                    kind = 'ok'
+                except Exception as e:
+                    kind = type(e).__name__
+                finally:
+                    db.session.remove()
+                with lock:
+                    if kind == 'ok':
+                        results['read'].append(time.perf_counter() - start)
+                    else:
+                        errors['read'][kind] = errors['read'].get(kind, 0) + 1
+
+    threads = [threading.Thread(target=write_loop) for _ in range(writers)]
+    threads += [threading.Thread(target=read_loop) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        kind: {
+            'ops_per_s': len(results[kind]) / seconds,
+            'p50_ms': percentile(results[kind], 50) * 1000,
+            'p99_ms': percentile(results[kind], 99) * 1000,
+            'errors': errors[kind],
+        }
+        for kind in ('write', 'read')
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    for production in (False, True):
+        app = build_app(production)
+        report = run(app, args.writers, args.readers, args.seconds)
+        name = 'SQLITE_PRODUCTION' if production else 'default'
+        print(f"{name}:")
+        for kind, row in report.items():
+            print(f"  {kind:5} {row['ops_per_s']:9.1f} ops/s  p50 {row['p50_ms']:7.2f} ms  "
+                  f"p99 {row['p99_ms']:8.2f} ms  errors {row['errors'] or 0}")
+
+
+if __name__ == '__main__':
+    main()
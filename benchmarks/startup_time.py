@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for create_app.
+
+Starts fresh interpreters that import the app and call create_app, with
+and without FAST_STARTUP, and reports the median wall time of each. With
+--imports it also prints the slowest top-level imports from
+`python -X importtime`.
+
+    python benchmarks/startup_time.py [--runs 10] [--imports]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = "from app import create_app; create_app()"
+
+
+def cold_start(fast, extra_args=()):
+    env = dict(os.environ, FAST_STARTUP='1' if fast else '0', PYTHONPATH=ROOT)
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, *extra_args, '-c', SNIPPET],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        sys.exit(f"create_app failed:\n{result.stderr}")
+    return elapsed, result.stderr
+
+
+def slowest_imports(fast, limit):
+    _, stderr = cold_start(fast, ('-X', 'importtime'))
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative_us, name = line.split('|')
+        # Только пакеты верхнего уровня (без отступа)
+        if name.startswith('  ') or not cumulative_us.strip().isdigit():
+            continue
+        rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--imports', action='store_true', help='show slowest top-level imports')
+    args = parser.parse_args()
+
+    cold_start(True)  # прогрев файлового кэша и .pyc
+
+    results = {}
+    for fast in (False, True):
+        times = [cold_start(fast)[0] for _ in range(args.runs)]
+        results[fast] = times
+        label = 'fast' if fast else 'default'
+        print(f"{label:>8}: median {statistics.median(times) * 1000:7.1f} ms, "
+              f"min {min(times) * 1000:7.1f} ms over {args.runs} runs")
+
+    saved = statistics.median(results[False]) - statistics.median(results[True])
+    print(f"FAST_STARTUP saves {saved * 1000:.1f} ms per process")
+
+    if args.imports:
+        for fast in (False, True):
+            print(f"\nSlowest imports ({'fast' if fast else 'default'}):")
+            for cumulative_us, name in slowest_imports(fast, 10):
+                print(f"  {cumulative_us / 1000:7.1f} ms  {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -17,6 +17,36 @@ class Config:
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Быстрый старт воркеров: без Flask-Migrate, отчёт о времени create_app
+    FAST_STARTUP = os.getenv("FAST_STARTUP", "False").lower() in ("true", "1", "yes")
+    STARTUP_TIMING = os.getenv("STARTUP_TIMING", "False").lower() in ("true", "1", "yes")
+    ASSET_FETCH_TIMEOUT = float(os.getenv("ASSET_FETCH_TIMEOUT", 10))
+    # Куда `flask assets build` пишет файлы с хэшем (по умолчанию static/dist)
+    ASSET_BUILD_DIR = os.getenv("ASSET_BUILD_DIR", None)
+
+    # Кэш Flask-Login user_loader
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+    USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 300))  # с
+
+    # Каналы: без лимита групп в 50 участников
+    CHANNEL_MAX_MEMBERS = int(os.getenv("CHANNEL_MAX_MEMBERS", 100000))
+    # Выше этого числа сокетов в комнате индикатор набора не рассылается
+    SOCKET_TYPING_MAX_ROOM = int(os.getenv("SOCKET_TYPING_MAX_ROOM", 100))
+
+    # Реплика для чтения (GET-эндпоинты, помеченные @replica_ok)
+    SQLALCHEMY_REPLICA_URI = os.getenv("DATABASE_REPLICA_URL")
+    REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", 5))
+    REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", 2))
+    REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", 1))
+
+    # Продакшен-профиль SQLite: WAL, один писатель, пул read-only читателей
+    SQLITE_PRODUCTION = os.getenv("SQLITE_PRODUCTION", "False").lower() in ("true", "1", "yes")
+    SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))  # мс
+    SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", 8))
+    SQLITE_POOL_TIMEOUT = int(os.getenv("SQLITE_POOL_TIMEOUT", 30))  # с, ожидание соединения из пула
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", -64000))  # отрицательное значение — КиБ
+
     # --- Mail settings ---
     MAIL_SERVER = os.getenv("MAIL_SERVER", "smtp.gmail.com")
     MAIL_PORT = int(os.getenv("MAIL_PORT", 587))
@@ -36,5 +66,92 @@ class Config:
     # --- Security / Auth ---
     SECURITY_PASSWORD_SALT = os.getenv("SECURITY_PASSWORD_SALT", "default_salt")
 
+    # --- Chat history export ---
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+
+    # --- Reconnect delta sync ---
+    SYNC_MAX_CHATS = int(os.getenv("SYNC_MAX_CHATS", 500))
+    SYNC_MAX_MESSAGES_PER_CHAT = int(os.getenv("SYNC_MAX_MESSAGES_PER_CHAT", 200))
+
+    # --- Recent message ring buffers (per chat room) ---
+    RECENT_MESSAGES_PER_ROOM = int(os.getenv("RECENT_MESSAGES_PER_ROOM", 100))
+    RECENT_MESSAGES_MEMORY_BUDGET = int(os.getenv("RECENT_MESSAGES_MEMORY_BUDGET", 32 * 1024 * 1024))
+
+    # --- Admin / diagnostics ---
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+    # --- Metrics ---
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").lower() in ("true", "1", "yes")
+
+    # --- Profiling (opt-in) ---
+    PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "False").lower() in ("true", "1", "yes")
+    PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(basedir, "instance", "profiles"))
+    PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.005))
+    PROFILE_SOCKET_SAMPLE_RATE = float(os.getenv("PROFILE_SOCKET_SAMPLE_RATE", 0))
+    PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", 200))
+
+    # --- SQL query budgets / N+1 detection ---
+    QUERY_TRACKING_ENABLED = os.getenv("QUERY_TRACKING_ENABLED", "False").lower() in ("true", "1", "yes")
+    QUERY_NPLUS1_THRESHOLD = int(os.getenv("QUERY_NPLUS1_THRESHOLD", 5))
+    QUERY_BUDGET_ENFORCE = os.getenv("QUERY_BUDGET_ENFORCE", "False").lower() in ("true", "1", "yes")
+
+    # --- Сжатие HTTP-ответов (gzip, brotli при установленном пакете) ---
+    COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "True").lower() in ("true", "1", "yes")
+    # Ответы меньше порога отправляются как есть
+    COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+    # Шифртекст жмётся одинаково на любом уровне: уровень 1 почти вдвое дешевле 6-го
+    COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 1))
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+
+    # --- Фоновые задачи (app/utils/jobs.py) ---
+    # В воркере веб-сервера планировщик выключен; `flask scheduler run` — отдельным процессом.
+    # Включённый в нескольких процессах, он всё равно выполняет каждую задачу один раз (аренда в БД)
+    SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "False").lower() in ("true", "1", "yes")
+    SCHEDULER_TICK = float(os.getenv("SCHEDULER_TICK", 5))
+    SCHEDULER_HISTORY_DAYS = int(os.getenv("SCHEDULER_HISTORY_DAYS", 30))
+    UPLOAD_RETENTION_DAYS = int(os.getenv("UPLOAD_RETENTION_DAYS", 30))
+    KEY_ROTATION_DAYS = int(os.getenv("KEY_ROTATION_DAYS", 7))
+    KEY_ROTATION_BATCH = int(os.getenv("KEY_ROTATION_BATCH", 200))
+
+    # --- Дайджесты для офлайн-пользователей ---
+    NOTIFY_OFFLINE_ENABLED = os.getenv("NOTIFY_OFFLINE_ENABLED", "True").lower() in ("true", "1", "yes")
+    # Сообщения, пришедшие за окно, собираются в одно письмо (секунды)
+    NOTIFY_DIGEST_WINDOW = int(os.getenv("NOTIFY_DIGEST_WINDOW", 900))
+    # Пользователей на одно SMTP-соединение
+    NOTIFY_DIGEST_BATCH = int(os.getenv("NOTIFY_DIGEST_BATCH", 200))
+
+    # --- Хранение сообщений (задача purge_expired_messages) ---
+    # Дней по умолчанию для чатов без своей политики; 0 — хранить всегда
+    MESSAGE_RETENTION_DAYS = int(os.getenv("MESSAGE_RETENTION_DAYS", 0))
+    # Сообщений в одном DELETE и пауза между ними: запись в чат ждёт не дольше одной пачки
+    RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 500))
+    RETENTION_BATCH_PAUSE = float(os.getenv("RETENTION_BATCH_PAUSE", 0.05))
+
+    # --- Шарды сообщений (app/utils/sharding.py) ---
+    # URI баз через запятую; шард 0 — основная БД. Пусто — все сообщения в основной
+    MESSAGE_SHARDS = [uri.strip() for uri in os.getenv("MESSAGE_SHARDS", "").split(",") if uri.strip()]
+    # Сколько секунд процесс кэширует каталог chat -> shard; перенос чата ждёт столько же
+    MESSAGE_SHARD_DIRECTORY_TTL = float(os.getenv("MESSAGE_SHARD_DIRECTORY_TTL", 2))
+
     # --- SocketIO ---
     SOCKET_IO_MESSAGE_QUEUE = os.getenv("SOCKET_IO_MESSAGE_QUEUE", None)
+    # Подробные логи socket.io/engine.io заметно дороги, только для отладки
+    SOCKETIO_LOGGER = os.getenv("SOCKETIO_LOGGER", "False").lower() in ("true", "1", "yes")
+    ENGINEIO_LOGGER = os.getenv("ENGINEIO_LOGGER", "False").lower() in ("true", "1", "yes")
+    SOCKET_TOKEN_MAX_AGE = int(os.getenv("SOCKET_TOKEN_MAX_AGE", 12 * 3600))
+    # Сжатие long-polling ответов Engine.IO; websocket договаривается о
+    # permessage-deflate сам, если его предлагает клиент
+    SOCKETIO_HTTP_COMPRESSION = os.getenv("SOCKETIO_HTTP_COMPRESSION", "True").lower() in ("true", "1", "yes")
+    SOCKETIO_COMPRESSION_THRESHOLD = int(os.getenv("SOCKETIO_COMPRESSION_THRESHOLD", 1024))
+
+    # Лимиты входящих событий на одно соединение: (токенов в секунду, размер пачки)
+    SOCKET_RATE_LIMITS = {
+        'send_message': (5, 20),
+        'typing': (2, 5),
+        'join_chat': (5, 20),
+        'default': (10, 30),
+    }
+    # Глубина исходящей очереди Engine.IO (в пакетах)
+    SOCKET_OUTBOUND_SOFT_LIMIT = int(os.getenv("SOCKET_OUTBOUND_SOFT_LIMIT", 100))
+    SOCKET_OUTBOUND_HARD_LIMIT = int(os.getenv("SOCKET_OUTBOUND_HARD_LIMIT", 1000))
+    SOCKET_OUTBOUND_GRACE = int(os.getenv("SOCKET_OUTBOUND_GRACE", 10))
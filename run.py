@@ -1,10 +1,11 @@
 from app import create_app, socketio
 from config import Config
+import os
 
 app = create_app(Config)
 
-# ДОБАВЬТЕ ЭТО ДЛЯ ДИАГНОСТИКИ
-with app.app_context():
+# Диагностика: SHOW_ROUTES=1 печатает маршруты auth
+if os.getenv("SHOW_ROUTES"):
     print("=== AVAILABLE ENDPOINTS ===")
     for rule in app.url_map.iter_rules():
         if 'auth' in str(rule):